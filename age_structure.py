@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Full age structure of every county and cohort tracking across YEAR codes.
+
+The pipeline's agesex frames keep UNDER5_TOT and the female 15-49 columns
+only. Here every five-year age group (AGE04 ... AGE85PLUS) of every sex (TOT,
+MALE, FEM) is kept for every county and YEAR code in one int32 array:
+
+    counts[county, YEAR code, age group, sex]      (-1 = county not in that YEAR)
+
+about 4 MB for ~3,100 counties x 6 codes x 18 groups x 3 sexes.
+
+Cohorts are followed by shifting the age axis: the people aged 0-4 at one
+estimate are aged 5-9 five years later, so for a span of `years` between two
+YEAR codes each group at the start is compared with the group
+round(years / 5) steps older at the end (the groups that age into 85+ are
+summed). That is one slice and subtraction over all counties at once. Child
+mortality is negligible, so the change of the under-5 cohort is net migration
+of young children, and with them of their families. It is separate from the
+change in the under-5 count itself, which also moves with births:
+
+    under-5 2020 -> 2024 (UNDER5_TOT)       births and migration
+    under-5 2020 -> age 5-9 2024 (cohort)   migration only
+
+The April 2020 base to July 2024 is 4.25 years, so the 2020 under-5 cohort is
+read off the 5-9 group of 2024 (ages 4.25-9.25 vs 5-9).
+
+The pipeline reads AGE_COLUMNS along with the other agesex columns in its one
+load of the file (census_schema.read_agesex, or streaming.stream_agesex with
+--stream) and builds the AgeStructure from that frame.
+
+Usage (cohort change by locale_type):
+    python age_structure.py [--source-dir DIR] [--sex TOT|MALE|FEM]
+"""
+
+import argparse
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+import census_schema
+from county_dimension import fips_code
+
+AGE_GROUPS = ['AGE04', 'AGE59', 'AGE1014', 'AGE1519', 'AGE2024', 'AGE2529', 'AGE3034', 'AGE3539', 'AGE4044',
+              'AGE4549', 'AGE5054', 'AGE5559', 'AGE6064', 'AGE6569', 'AGE7074', 'AGE7579', 'AGE8084', 'AGE85PLUS']
+SEXES = ['TOT', 'MALE', 'FEM']
+# Every {group}_{sex} column of the agesex layout
+AGE_COLUMNS = [f'{group}_{sex}' for group in AGE_GROUPS for sex in SEXES]
+GROUP_YEARS = 5
+MISSING = -1
+
+# Cohorts written into the county outputs: name -> the age groups it starts in
+COHORTS = {
+    'under5': ['AGE04'],
+    'age25_39': ['AGE2529', 'AGE3034', 'AGE3539'],
+}
+
+# fips: (counties,) integer FIPS; codes: (codes,) YEAR codes; groups, sexes: the axis labels;
+# counts: (counties, codes, groups, sexes) int32, MISSING where a county has no row for a code
+AgeStructure = namedtuple('AgeStructure', ['fips', 'codes', 'groups', 'sexes', 'counts'])
+
+
+def age_columns(header):
+    """The {group}_{sex} columns of AGE_GROUPS x SEXES present in an agesex header."""
+    return [col for col in AGE_COLUMNS if col in header]
+
+
+def build_age_structure(agesex):
+    """AgeStructure of an agesex frame with the AGE_GROUPS x SEXES columns."""
+    fips = fips_code(agesex['STATE'], agesex['COUNTY'])
+    counties, rows = np.unique(fips, return_inverse=True)
+    codes, cols = np.unique(agesex['YEAR'].to_numpy(dtype=np.int64), return_inverse=True)
+    counts = np.full((len(counties), len(codes), len(AGE_GROUPS), len(SEXES)), MISSING, dtype=np.int32)
+    for g, group in enumerate(AGE_GROUPS):
+        for s, sex in enumerate(SEXES):
+            col = f'{group}_{sex}'
+            if col in agesex.columns:
+                counts[rows, cols, g, s] = agesex[col].to_numpy(dtype=np.int32)
+    return AgeStructure(counties, codes, list(AGE_GROUPS), list(SEXES), counts)
+
+
+def load_age_structure(path, optional=False, cache_dir=None):
+    """AgeStructure of a cc-est agesex file; None if optional and missing."""
+    try:
+        header = census_schema.read_header(path)
+    except FileNotFoundError:
+        if optional:
+            return None
+        raise
+    return build_age_structure(census_schema.read_agesex(path, extra=age_columns(header), cache_dir=cache_dir))
+
+
+def _at(ages, code, groups, sex):
+    """counties x len(groups) float counts at one YEAR code (NaN = missing)."""
+    where = np.flatnonzero(ages.codes == code)
+    if not len(where):
+        raise KeyError(f"YEAR code {code} not in {ages.codes.tolist()}")
+    values = ages.counts[:, where[0], groups, ages.sexes.index(sex)].astype(float)
+    values[values == MISSING] = np.nan
+    return values
+
+
+def cohort_flows(ages, start_code, end_code, years, sex='TOT'):
+    """
+    Every cohort from `start_code` to `end_code`, `years` apart: (end age
+    groups, counties x cohorts at the start, counties x cohorts at the end).
+    Cohort i starts in group i and ends in group i + round(years / 5); the
+    starting groups that end in the open 85+ group are summed.
+    """
+    shift = int(round(years / GROUP_YEARS))
+    if not 0 < shift < len(ages.groups):
+        raise ValueError(f"{years} years does not move a cohort into another age group")
+    n = len(ages.groups) - shift
+    start = np.add.reduceat(_at(ages, start_code, np.arange(len(ages.groups)), sex), np.arange(n), axis=1)
+    end = _at(ages, end_code, np.arange(shift, len(ages.groups)), sex)
+    return ages.groups[shift:], start, end
+
+
+def cohort_counts(ages, groups, start_code, end_code, years, sex='TOT'):
+    """(counties at the start, counties at the end) of the cohort that starts in `groups`."""
+    end_groups, start, end = cohort_flows(ages, start_code, end_code, years, sex)
+    idx = [ages.groups.index(group) for group in groups]
+    if max(idx) >= len(end_groups):
+        raise ValueError(f"{groups} age into the open 85+ group")
+    return start[:, idx].sum(axis=1), end[:, idx].sum(axis=1)
+
+
+def cohort_table(ages, start_code, end_code, start_year, end_year, cohorts=COHORTS):
+    """
+    Per-county frame indexed by integer FIPS with, for each of `cohorts`,
+    cohort_{name}_{start_year}, cohort_{name}_{end_year} (the same people,
+    older) and cohort_{name}_pct_change.
+    """
+    table = pd.DataFrame(index=pd.Index(ages.fips, name='FIPS'))
+    for name, groups in cohorts.items():
+        start, end = cohort_counts(ages, groups, start_code, end_code, end_year - start_year)
+        table[f'cohort_{name}_{start_year}'] = start
+        table[f'cohort_{name}_{end_year}'] = end
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pct_change = np.where(start > 0, (end - start) / start * 100, np.nan)
+        table[f'cohort_{name}_pct_change'] = np.round(pct_change, 1)
+    return table
+
+
+if __name__ == '__main__':
+    import os
+
+    import pipeline
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--source-dir', default=pipeline.SOURCE_DIR)
+    parser.add_argument('--sex', default='TOT', choices=SEXES)
+    args = parser.parse_args()
+
+    src = pipeline.source_paths(args.source_dir)
+    counties = pipeline.load_county_types(src['county_types'])
+    df_10 = pipeline.load_components(src['components_10'])
+    df_24 = pipeline.load_components(src['components_24'])
+    agesex = pipeline.load_agesex(src['agesex_24'], extra=AGE_COLUMNS)
+    snapshot = pipeline.snapshot_years(df_10, df_24, agesex)
+    ages = build_age_structure(agesex)
+    print(f"{len(ages.fips):,} counties x {len(ages.codes)} YEAR codes x {len(ages.groups)} age groups x "
+          f"{len(ages.sexes)} sexes: {ages.counts.nbytes / 1e6:.1f} MB")
+
+    end_groups, start, end = cohort_flows(ages, snapshot['base_code'], snapshot['latest_code'],
+                                          snapshot['latest'] - snapshot['base'], args.sex)
+    labels = pipeline.county_locales(ages.fips, pipeline.add_locale_type(agesex, counties))
+    rows = []
+    for locale in pipeline.LOCALE_ORDER:
+        mask = labels == locale
+        s, e = np.nansum(start[mask], axis=0), np.nansum(end[mask], axis=0)
+        rows.append(pd.Series(np.round((e - s) / s * 100, 1), index=end_groups, name=locale))
+    print(f"\nCohort change {snapshot['base']} -> {snapshot['latest']} (%), by age group at the end:")
+    print(pd.DataFrame(rows).T.to_string())
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for the pipeline stages on synthetic Census-shaped inputs.
+
+Generates fixtures with make_fixtures.py (or uses an existing directory), then
+times each phase -- load (cold, then from the census_cache), enrich,
+aggregate, bootstrap, export -- and records its peak traced memory and RSS growth.
+Results can be saved as JSON and compared against an earlier run; a phase that
+got slower than the tolerance makes the script exit non-zero.
+
+Usage:
+    python benchmark.py [--scale 1] [--fixtures DIR] [--save out.json] [--baseline old.json]
+"""
+
+import argparse
+import json
+import os
+import resource
+import shutil
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import census_cache
+import pipeline
+from make_fixtures import write_fixtures
+
+
+@contextmanager
+def measure(results, phase):
+    """Record wall time, peak tracemalloc and ru_maxrss growth of the block."""
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        rss_growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before
+        results[phase] = {
+            'seconds': round(seconds, 4),
+            'peak_traced_mb': round(peak / 1e6, 1),
+            'rss_growth_mb': round(rss_growth / 1024, 1),
+        }
+
+
+def run_benchmark(source_dir, out_dir):
+    src = pipeline.source_paths(source_dir)
+    results = {}
+
+    def load_all():
+        return {
+            'county_types': pipeline.load_county_types(src['county_types']),
+            'components_10': pipeline.load_components(src['components_10']),
+            'components_24': pipeline.load_components(src['components_24']),
+            'agesex_10': pipeline.load_agesex(src['agesex_10'], optional=True),
+            'agesex_24': pipeline.load_agesex(src['agesex_24']),
+        }
+
+    shutil.rmtree(os.path.join(source_dir, census_cache.CACHE_DIRNAME), ignore_errors=True)
+    with measure(results, 'load (cold)'):
+        raw = load_all()
+    with measure(results, 'load (cached)'):
+        raw = load_all()
+
+    with measure(results, 'enrich'):
+        county_types = raw.pop('county_types')
+        frames = {name: pipeline.add_locale_type(df, county_types) for name, df in raw.items()}
+
+    with measure(results, 'aggregate'):
+        birth_ts = pipeline.birth_rate_ts(frames['components_10'], frames['components_24'])
+        change_data = pipeline.birth_rate_change(birth_ts)
+        fertility_ts = pipeline.fertility_rate_ts(frames['components_10'], frames['components_24'],
+                                                  frames['agesex_10'], frames['agesex_24'])
+        snapshot = pipeline.snapshot_years(frames['components_10'], frames['components_24'], frames['agesex_24'])
+        under5_data = pipeline.under5_by_type(frames['agesex_24'], snapshot)
+        nationwide = pipeline.nationwide_under5(frames['agesex_24'], snapshot)
+        lu = pipeline.large_urban_detail(frames['agesex_24'], frames['components_10'], frames['components_24'],
+                                         snapshot)
+
+    with measure(results, 'bootstrap'):
+        series = pipeline.county_fertility_ts(frames['components_10'], frames['components_24'],
+                                              frames['agesex_10'], frames['agesex_24'])
+        birth_ci = pipeline.birth_rate_ci(frames['components_10'], frames['components_24'])
+        fertility_ci = pipeline.fertility_rate_ci(series, frames['components_10'], frames['components_24'])
+
+    with measure(results, 'export'):
+        pipeline.export(out_dir, birth_ts, change_data, fertility_ts, under5_data, lu, nationwide, birth_ci,
+                        fertility_ci, snapshot)
+
+    rows = {name: len(df) for name, df in frames.items() if df is not None}
+    return results, rows
+
+
+def compare(results, baseline, tolerance):
+    """Phases slower than baseline by more than `tolerance` (fraction), as messages."""
+    regressions = []
+    for phase, stats in results.items():
+        old = baseline.get('phases', {}).get(phase)
+        if not old or old['seconds'] <= 0:
+            continue
+        ratio = stats['seconds'] / old['seconds']
+        if ratio > 1 + tolerance:
+            regressions.append(f"{phase}: {old['seconds']:.3f}s -> {stats['seconds']:.3f}s ({ratio:.2f}x)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=float, default=1.0, help='fixture size as a multiple of ~3,144 counties')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--fixtures', help='existing fixture directory (generated there if empty)')
+    parser.add_argument('--save', help='write the results as JSON')
+    parser.add_argument('--baseline', help='JSON from an earlier --save to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown per phase (0.25 = 25%%)')
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix='cff-bench-')
+    fixtures = args.fixtures or os.path.join(work, 'fixtures')
+    try:
+        if not os.path.exists(os.path.join(fixtures, pipeline.SOURCE_FILES['agesex_24'])):
+            start = time.perf_counter()
+            # In a child process so generating them does not inflate our peak RSS
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                pool.submit(write_fixtures, fixtures, args.scale, args.seed).result()
+            print(f"Generated fixtures (scale {args.scale}) in {time.perf_counter() - start:.1f}s")
+
+        results, rows = run_benchmark(fixtures, os.path.join(work, 'out'))
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    print(f"\n{'phase':<16}{'seconds':>10}{'peak traced MB':>16}{'RSS growth MB':>15}")
+    for phase, stats in results.items():
+        print(f"{phase:<16}{stats['seconds']:>10.3f}{stats['peak_traced_mb']:>16.1f}{stats['rss_growth_mb']:>15.1f}")
+    print("\nRows: " + ", ".join(f"{name} {n:,}" for name, n in rows.items()))
+
+    report = {'scale': args.scale, 'seed': args.seed, 'rows': rows, 'phases': results}
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved {args.save}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\nREGRESSIONS:")
+            for line in regressions:
+                print(f"  {line}")
+            raise SystemExit(1)
+        print("\nNo regressions against baseline")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Bootstrap percentile intervals for the locale-level rates.
+
+The published birth and fertility rates by locale_type are ratios of sums over
+the counties of each locale (population-weighted RBIRTH, births per 1,000
+women 15-49). To see how much they depend on which counties a locale happens
+to contain, the counties of each locale are resampled with replacement
+thousands of times and the rate recomputed for every replicate.
+
+Everything is batched: a block of replicates is drawn as one index matrix
+(replicates x counties), turned into a count matrix (how often each county is
+drawn in each replicate), and multiplied with the counties x years numerator
+and denominator arrays, so one matrix product gives the rate of every
+replicate for every year. The same draw is used for all years of a replicate,
+so a county's years stay together.
+
+Locales are resampled independently of one another, so the difference between
+two locales' replicates also gives an interval for the gap between them
+(difference_intervals).
+
+Usage:
+    python bootstrap.py [--source-dir DIR] [--replicates N] [--compare "Large urban" Suburban]
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+N_REPLICATES = 10_000
+CONFIDENCE = 0.95
+SEED = 20240701
+# Replicates drawn per index matrix (bounds memory at BATCH x counties)
+BATCH = 1_000
+
+
+def resample_counts(rng, n, replicates):
+    """replicates x n matrix of how often each of n counties is drawn (n draws with replacement)."""
+    draws = rng.integers(0, n, size=(replicates, n))
+    flat = (np.arange(replicates)[:, None] * n + draws).ravel()
+    return np.bincount(flat, minlength=replicates * n).reshape(replicates, n)
+
+
+def ratio_replicates(numer, denom, groups, order, replicates=N_REPLICATES, seed=SEED, batch=BATCH):
+    """
+    Bootstrap replicates of sum(numer) / sum(denom) per group and year.
+    `numer`/`denom` are counties x years (0 where a county has no value),
+    `groups` the group of each county. Returns {group: replicates x years}.
+    """
+    rng = np.random.default_rng(seed)
+    groups = np.asarray(groups, dtype=object)
+    out = {}
+    for group in order:
+        members = np.flatnonzero(groups == group)
+        if not len(members):
+            continue
+        num, den = numer[members], denom[members]
+        blocks = []
+        for start in range(0, replicates, batch):
+            counts = resample_counts(rng, len(members), min(batch, replicates - start)).astype(float)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                blocks.append((counts @ num) / (counts @ den))
+        out[group] = np.vstack(blocks)
+    return out
+
+
+def _bounds(confidence):
+    tail = (1 - confidence) / 2 * 100
+    return [tail, 100 - tail]
+
+
+def percentile_intervals(samples, years, confidence=CONFIDENCE):
+    """Long table (locale_type, year, low, high) from ratio_replicates output."""
+    if not len(years):
+        return pd.DataFrame(columns=['locale_type', 'year', 'low', 'high'])
+    rows = []
+    for group, reps in samples.items():
+        low, high = np.nanpercentile(reps, _bounds(confidence), axis=0)
+        rows.append(pd.DataFrame({'locale_type': group, 'year': years, 'low': low, 'high': high}))
+    return pd.concat(rows, ignore_index=True)
+
+
+def difference_intervals(samples, a, b, years, confidence=CONFIDENCE):
+    """Interval of (rate of `a` - rate of `b`) per year; excludes 0 where the gap holds up."""
+    low, high = np.nanpercentile(samples[a] - samples[b], _bounds(confidence), axis=0)
+    return pd.DataFrame({'year': years, 'low': low, 'high': high})
+
+
+def add_intervals(records, intervals, rate_key, decimals=2):
+    """
+    Copies of ts records with {rate_key}_low / {rate_key}_high next to the rate.
+    Records that already carry an interval (appended history) and have none in
+    `intervals` keep theirs.
+    """
+    bounds = {(locale, int(year)): (low, high)
+              for locale, year, low, high in zip(intervals['locale_type'], intervals['year'],
+                                                 intervals['low'], intervals['high'])}
+    out = []
+    for record in records:
+        if (record['locale_type'], record['year']) not in bounds and f'{rate_key}_low' in record:
+            out.append(dict(record))
+            continue
+        low, high = bounds.get((record['locale_type'], record['year']), (np.nan, np.nan))
+        row = {}
+        for key, value in record.items():
+            row[key] = value
+            if key == rate_key:
+                row[f'{rate_key}_low'] = None if np.isnan(low) else round(float(low), decimals)
+                row[f'{rate_key}_high'] = None if np.isnan(high) else round(float(high), decimals)
+        out.append(row)
+    return out
+
+
+if __name__ == '__main__':
+    import os
+    import time
+
+    import pipeline
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--source-dir', default=pipeline.SOURCE_DIR)
+    parser.add_argument('--replicates', type=int, default=N_REPLICATES)
+    parser.add_argument('--compare', nargs=2, default=['Large urban', 'Suburban'], metavar='LOCALE')
+    args = parser.parse_args()
+
+    src = pipeline.source_paths(args.source_dir)
+    counties = pipeline.load_county_types(src['county_types'])
+    df_10 = pipeline.add_locale_type(pipeline.load_components(src['components_10']), counties)
+    df_24 = pipeline.add_locale_type(pipeline.load_components(src['components_24']), counties)
+    agesex_10 = pipeline.add_locale_type(pipeline.load_agesex(src['agesex_10'], optional=True), counties)
+    agesex_24 = pipeline.add_locale_type(pipeline.load_agesex(src['agesex_24']), counties)
+    series = pipeline.county_fertility_ts(df_10, df_24, agesex_10, agesex_24)
+
+    for label, sampler in (('Birth rate', lambda: pipeline.birth_rate_samples(df_10, df_24, args.replicates)),
+                           ('Fertility rate', lambda: pipeline.fertility_rate_samples(series, df_10, df_24,
+                                                                                      args.replicates))):
+        start = time.perf_counter()
+        samples, years = sampler()
+        print(f"\n{label}: {args.replicates:,} replicates x {len(samples)} locales x {len(years)} years "
+              f"in {time.perf_counter() - start:.2f}s")
+        gap = difference_intervals(samples, *args.compare, years)
+        print(f"  {args.compare[0]} - {args.compare[1]}, {CONFIDENCE:.0%} interval:")
+        for row in gap.itertuples():
+            holds = 'yes' if row.low > 0 or row.high < 0 else 'no'
+            print(f"    {row.year}: [{row.low:+.2f}, {row.high:+.2f}]  excludes 0: {holds}")
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Columnar on-disk cache for the raw Census CSV inputs.
+
+The first read of a CSV parses it with pandas and writes every column to its
+own .npy file next to a small meta.json. Later reads load the arrays straight
+back instead of re-parsing the text. A cache entry is keyed by the source
+file's size, mtime and SHA-256 content hash: if size and mtime match the cache
+is used as-is, if only the mtime moved the content hash decides, and anything
+else rebuilds the entry.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+CACHE_VERSION = 1
+CACHE_DIRNAME = '.census_cache'
+
+
+def content_hash(path, chunk_size=1 << 20):
+    """SHA-256 hex digest of a file, read in chunks."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def default_cache_dir(path):
+    """Cache directory used for `path` when none is given: a hidden folder beside it."""
+    return os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIRNAME)
+
+
+def _options_key(read_csv_kwargs):
+    return json.dumps(read_csv_kwargs, sort_keys=True, default=str)
+
+
+def _entry_dir(path, cache_dir, options):
+    tag = hashlib.sha1(options.encode()).hexdigest()[:10]
+    return os.path.join(cache_dir or default_cache_dir(path), f'{os.path.basename(path)}.{tag}')
+
+
+def _save_column(entry, i, series):
+    """Write one column; returns the meta describing how to restore it."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        np.save(os.path.join(entry, f'c{i:04d}.npy'), series.cat.codes.to_numpy())
+        np.save(os.path.join(entry, f'c{i:04d}_cats.npy'), series.cat.categories.to_numpy().astype(str))
+        return {'kind': 'category'}
+    if series.dtype == object or pd.api.types.is_string_dtype(series.dtype):
+        values = series.to_numpy(dtype=object)
+        mask = pd.isna(values)
+        text = np.where(mask, '', values).astype(str)
+        np.save(os.path.join(entry, f'c{i:04d}.npy'), text)
+        if mask.any():
+            np.save(os.path.join(entry, f'c{i:04d}_na.npy'), mask)
+        return {'kind': 'object', 'has_na': bool(mask.any())}
+    np.save(os.path.join(entry, f'c{i:04d}.npy'), series.to_numpy())
+    return {'kind': 'array'}
+
+
+def _load_column(entry, i, spec):
+    values = np.load(os.path.join(entry, f'c{i:04d}.npy'))
+    if spec['kind'] == 'category':
+        cats = np.load(os.path.join(entry, f'c{i:04d}_cats.npy')).astype(object)
+        return pd.Categorical.from_codes(values, categories=cats)
+    if spec['kind'] == 'object':
+        values = values.astype(object)
+        if spec['has_na']:
+            values[np.load(os.path.join(entry, f'c{i:04d}_na.npy'))] = np.nan
+        return values
+    return values
+
+
+def _read_meta(entry):
+    try:
+        with open(os.path.join(entry, 'meta.json')) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _is_fresh(path, meta, options):
+    """True if the cache entry described by `meta` still matches the source file."""
+    if meta is None or meta.get('version') != CACHE_VERSION or meta.get('options') != options:
+        return False
+    st = os.stat(path)
+    if st.st_size != meta['size']:
+        return False
+    if st.st_mtime_ns == meta['mtime_ns']:
+        return True
+    # Touched but possibly unchanged (copied, re-downloaded): let the content decide
+    return content_hash(path) == meta['sha256']
+
+
+def load_cached(path, cache_dir=None, **read_csv_kwargs):
+    """Load `path` from its cache entry, or return None if there is no fresh one."""
+    options = _options_key(read_csv_kwargs)
+    entry = _entry_dir(path, cache_dir, options)
+    meta = _read_meta(entry)
+    if not _is_fresh(path, meta, options):
+        return None
+    st = os.stat(path)
+    if st.st_mtime_ns != meta['mtime_ns']:
+        meta['mtime_ns'] = st.st_mtime_ns
+        with open(os.path.join(entry, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+    data = {name: _load_column(entry, i, spec) for i, (name, spec) in enumerate(zip(meta['columns'], meta['specs']))}
+    return pd.DataFrame(data, columns=meta['columns'])
+
+
+def write_cache(path, df, cache_dir=None, **read_csv_kwargs):
+    """Store `df` (parsed from `path` with `read_csv_kwargs`) as a cache entry."""
+    options = _options_key(read_csv_kwargs)
+    entry = _entry_dir(path, cache_dir, options)
+    st = os.stat(path)
+    tmp = f'{entry}.tmp{os.getpid()}'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    specs = [_save_column(tmp, i, df[name]) for i, name in enumerate(df.columns)]
+    meta = {
+        'version': CACHE_VERSION,
+        'source': os.path.abspath(path),
+        'size': st.st_size,
+        'mtime_ns': st.st_mtime_ns,
+        'sha256': content_hash(path),
+        'options': options,
+        'columns': [str(c) for c in df.columns],
+        'specs': specs,
+        'rows': len(df),
+    }
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    shutil.rmtree(entry, ignore_errors=True)
+    os.replace(tmp, entry)
+
+
+def read_csv(path, cache_dir=None, parser=pd.read_csv, **read_csv_kwargs):
+    """
+    Drop-in for pd.read_csv(path, **read_csv_kwargs) backed by the columnar cache.
+
+    The keyword arguments are part of the cache key, so reading the same file
+    with different options (usecols, dtype, ...) keeps separate entries valid.
+    `parser` parses on a miss (census_schema.parse_csv adds a coercing fallback).
+    """
+    df = load_cached(path, cache_dir, **read_csv_kwargs)
+    if df is not None:
+        return df
+    df = parser(path, **read_csv_kwargs)
+    try:
+        write_cache(path, df, cache_dir, **read_csv_kwargs)
+    except OSError as e:
+        print(f"  (could not write cache for {os.path.basename(path)}: {e})")
+    return df
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+
+    for src in sys.argv[1:]:
+        start = time.perf_counter()
+        frame = read_csv(src, encoding='latin-1', low_memory=False)
+        print(f"{src}: {len(frame):,} rows x {len(frame.columns)} columns in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Schema-driven readers for the Census county files.
+
+Only the columns the analyses use are parsed, with compact dtypes declared up
+front: small ints for the geography/YEAR codes, int32 for counts, categoricals
+for the state and county names. Non-numeric footnote values (the 2020 agesex
+vintage has some) are declared as NA values, so they become missing during the
+parse instead of turning the whole column into strings, and are stored as 0 --
+what the scripts used to do afterwards with pd.to_numeric(errors='coerce').
+A marker not on that list makes the typed parse fail; the file is then parsed
+again with those columns as text and coerced the old way, so the build goes on.
+
+With CENSUS_STORE set to a store built by county_store.py, the same frames
+are read back from that SQLite file instead of the CSVs.
+
+Usage (compare against a full, untyped parse):
+    python census_schema.py /path/to/cc-est2024-agesex-all.csv ...
+"""
+
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+import census_cache
+
+# Path of a county_store.py SQLite store to read the sources from instead of the CSVs
+STORE_ENV = 'CENSUS_STORE'
+
+# Footnote / suppression markers seen in Census estimate tables
+FOOTNOTE_VALUES = ['X', '(X)', 'N', 'NA', '-', '*', '**']
+
+GEO_DTYPES = {
+    'STATE': 'int16',
+    'COUNTY': 'int16',
+    'STNAME': 'category',
+    'CTYNAME': 'category',
+}
+
+WOMEN_15_49_COLS = ['AGE1519_FEM', 'AGE2024_FEM', 'AGE2529_FEM', 'AGE3034_FEM',
+                    'AGE3539_FEM', 'AGE4044_FEM', 'AGE4549_FEM']
+
+AGESEX_COUNTS = ['POPESTIMATE', 'UNDER5_TOT'] + WOMEN_15_49_COLS
+
+# Counts are parsed as float64 (the C parser's fast path, and exact for any
+# count) so footnotes can become NaN, then stored as int32
+COUNT_PARSE_DTYPE = 'float64'
+COUNT_DTYPE = np.int32
+
+AGESEX_DTYPES = dict(GEO_DTYPES, YEAR='int8', **{col: COUNT_PARSE_DTYPE for col in AGESEX_COUNTS})
+
+# co-est alldata: per-year counts and rates
+COMPONENT_COLUMN = re.compile(r'^(POPESTIMATE|BIRTHS|RBIRTH)\d{4}$')
+# Rates stay float64: they feed population-weighted averages rounded to 0.01,
+# and the columns are only a few thousand rows long
+RATE_DTYPE = 'float64'
+
+
+def read_header(path):
+    return list(pd.read_csv(path, encoding='latin-1', nrows=0).columns)
+
+
+def _is_count(col):
+    return col in AGESEX_COUNTS or (COMPONENT_COLUMN.match(col) is not None and not col.startswith('RBIRTH'))
+
+
+def _fill_counts(df, extra=()):
+    """Count columns (footnotes parsed as NaN) -> int32 with 0."""
+    for col in df.columns:
+        if (_is_count(col) or col in extra) and df[col].dtype.kind == 'f':
+            df[col] = df[col].fillna(0).astype(COUNT_DTYPE)
+    return df
+
+
+def agesex_options(path, extra=()):
+    """read_csv keyword arguments for an agesex file: the default columns plus `extra`."""
+    header = read_header(path)
+    dtypes = dict(AGESEX_DTYPES, **{col: COUNT_PARSE_DTYPE for col in extra})
+    dtypes = {col: dtype for col, dtype in dtypes.items() if col in header}
+    return dict(encoding='latin-1', usecols=list(dtypes), dtype=dtypes, na_values=FOOTNOTE_VALUES)
+
+
+def components_options(path):
+    """read_csv keyword arguments for a co-est alldata file."""
+    dtypes = {}
+    for col in read_header(path):
+        if col in GEO_DTYPES:
+            dtypes[col] = GEO_DTYPES[col]
+        elif COMPONENT_COLUMN.match(col):
+            dtypes[col] = RATE_DTYPE if col.startswith('RBIRTH') else COUNT_PARSE_DTYPE
+    return dict(encoding='latin-1', usecols=list(dtypes), dtype=dtypes, na_values=FOOTNOTE_VALUES)
+
+
+def _text_options(options):
+    """`options` with the float64 columns parsed as text, for _coerce_floats."""
+    return dict(options, dtype={col: object if dtype == 'float64' else dtype
+                                for col, dtype in options['dtype'].items()})
+
+
+def _coerce_floats(df, options):
+    """Text-parsed float64 columns -> float64, anything that is not a number as NaN."""
+    for col, dtype in options['dtype'].items():
+        if dtype == 'float64' and col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
+    return df
+
+
+def _coerce_note(path):
+    print(f"  ({os.path.basename(path)}: unrecognised non-numeric values in count columns, read as missing)")
+
+
+def parse_csv(path, **options):
+    """
+    pd.read_csv(path, **options) for agesex_options/components_options. If a
+    footnote marker outside FOOTNOTE_VALUES makes the typed parse raise, the
+    file is parsed again with the float64 columns as text and coerced.
+    """
+    try:
+        return pd.read_csv(path, **options)
+    except ValueError:
+        _coerce_note(path)
+        return _coerce_floats(pd.read_csv(path, **_text_options(options)), options)
+
+
+def parse_csv_chunks(path, chunksize, **options):
+    """parse_csv in chunks of `chunksize` rows; the coercing parse takes over from the chunk that failed."""
+    done = 0
+    try:
+        with pd.read_csv(path, chunksize=chunksize, **options) as reader:
+            for chunk in reader:
+                yield chunk
+                done += 1
+        return
+    except ValueError:
+        _coerce_note(path)
+    with pd.read_csv(path, chunksize=chunksize, **_text_options(options)) as reader:
+        for i, chunk in enumerate(reader):
+            if i >= done:
+                yield _coerce_floats(chunk, options)
+
+
+def _store(store):
+    """The store to read from: `store`, or CENSUS_STORE when it is None ('' = the CSVs)."""
+    return os.environ.get(STORE_ENV, '') if store is None else store
+
+
+def read_agesex(path, extra=(), cache_dir=None, store=None, cache=True):
+    """
+    cc-est agesex file, pruned to the columns the analyses use (plus `extra`;
+    a store has age_structure.AGE_COLUMNS, other extras are read from the CSV).
+    cache=False parses the CSV itself, neither reading nor writing the cache.
+    """
+    if _store(store):
+        import county_store
+        if set(extra) <= set(county_store.AGE_COLUMNS):
+            return county_store.read_agesex(_store(store), path, extra)
+    if not cache:
+        return _fill_counts(parse_csv(path, **agesex_options(path, extra)), extra)
+    return _fill_counts(census_cache.read_csv(path, cache_dir=cache_dir, parser=parse_csv,
+                                             **agesex_options(path, extra)), extra)
+
+
+def read_components(path, cache_dir=None, store=None):
+    """co-est alldata file, pruned to geography plus POPESTIMATE/BIRTHS/RBIRTH per year."""
+    if _store(store):
+        import county_store
+        return county_store.read_components(_store(store), path)
+    return _fill_counts(census_cache.read_csv(path, cache_dir=cache_dir, parser=parse_csv,
+                                             **components_options(path)))
+
+
+def read_typology(path, store=None):
+    """The EIG county typology (county_summary_final.csv), all columns."""
+    if _store(store):
+        import county_store
+        return county_store.read_typology(_store(store), path)
+    return pd.read_csv(path, encoding='latin-1')
+
+
+def _measure_one(path, schema):
+    """Runs in a fresh process: (seconds, peak RSS growth in bytes, frame bytes, columns)."""
+    import resource
+    import time
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    if schema:
+        options = agesex_options(path) if 'agesex' in path else components_options(path)
+        df = _fill_counts(parse_csv(path, **options))
+    else:
+        df = pd.read_csv(path, encoding='latin-1', low_memory=False)
+    seconds = time.perf_counter() - start
+    # ru_maxrss is in KB on Linux
+    rss_growth = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) * 1024
+    return seconds, rss_growth, int(df.memory_usage(deep=True).sum()), len(df.columns)
+
+
+def measure(path):
+    """Load time and peak RSS growth of a full untyped parse vs the schema parse (cache bypassed)."""
+    from concurrent.futures import ProcessPoolExecutor
+
+    rows = []
+    for label, schema in (('full parse', False), ('schema', True)):
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            rows.append((label,) + pool.submit(_measure_one, path, schema).result())
+    return rows
+
+
+if __name__ == '__main__':
+    import sys
+
+    for src in sys.argv[1:]:
+        print(os.path.basename(src))
+        for label, seconds, rss, frame_bytes, ncols in measure(src):
+            print(f"  {label:<10} {seconds:6.2f}s  peak RSS +{rss / 1e6:7.1f} MB  "
+                  f"frame {frame_bytes / 1e6:7.1f} MB  {ncols} columns")
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Shared county dimension keyed by integer FIPS.
+
+Every Census file identifies a county by its STATE and COUNTY codes. Instead of
+building a zero-padded 5-character FIPS string for every row and merging on it,
+frames carry FIPS = STATE * 1000 + COUNTY as an int32, and the county
+attributes (the EIG locale_type, plus the county and state names from the
+typology) live once in a CountyDimension indexed by that integer. Attaching an
+attribute to a frame is a direct array lookup: FIPS codes are below 100,000,
+so a table of that size maps each code straight to its dimension row, with no
+hashing and no merge.
+
+String FIPS ("01001") are produced only when writing outputs (fips_str).
+
+Usage (join time and memory of the string merge vs the integer lookup):
+    python county_dimension.py /path/to/county_summary_final.csv /path/to/cc-est2024-agesex-all.csv
+"""
+
+import numpy as np
+import pandas as pd
+
+# Upper bound (exclusive) of STATE * 1000 + COUNTY
+MAX_FIPS = 100_000
+FIPS_DTYPE = np.int32
+
+# Typology columns kept in the dimension, by their name there
+TYPOLOGY_COLUMNS = {'locale_type': 'locale_type', 'county_name': 'county_name', 'state_name': 'state_name'}
+
+
+def fips_code(state, county):
+    """Integer FIPS (STATE * 1000 + COUNTY) for arrays of state and county codes."""
+    return np.asarray(state, dtype=FIPS_DTYPE) * 1000 + np.asarray(county, dtype=FIPS_DTYPE)
+
+
+def fips_str(codes):
+    """Zero-padded 5-digit FIPS strings for integer codes (for outputs only)."""
+    return [f'{code:05d}' for code in np.asarray(codes, dtype=np.int64).tolist()]
+
+
+class CountyDimension:
+    """County attributes indexed by integer FIPS, with array lookups by code."""
+
+    def __init__(self, table):
+        """`table`: one row per county, indexed by integer FIPS."""
+        self.table = table
+        self._position = np.full(MAX_FIPS, -1, dtype=np.int32)
+        self._position[table.index.to_numpy(dtype=np.int64)] = np.arange(len(table), dtype=np.int32)
+
+    @classmethod
+    def from_typology(cls, county_types):
+        """From the EIG typology (county_fips as an integer or digit string)."""
+        fips = pd.to_numeric(county_types['county_fips']).to_numpy(dtype=FIPS_DTYPE)
+        columns = {name: county_types[col].to_numpy() for col, name in TYPOLOGY_COLUMNS.items()
+                   if col in county_types.columns}
+        table = pd.DataFrame(columns, index=pd.Index(fips, name='FIPS'))
+        return cls(table[~table.index.duplicated()])
+
+    def __len__(self):
+        return len(self.table)
+
+    @property
+    def fips(self):
+        return self.table.index.to_numpy()
+
+    def positions(self, fips):
+        """Dimension row of each code in `fips`, -1 where the county is not in the dimension."""
+        fips = np.asarray(fips, dtype=np.int64)
+        known = (fips >= 0) & (fips < MAX_FIPS)
+        out = np.full(len(fips), -1, dtype=np.int64)
+        out[known] = self._position[fips[known]]
+        return out
+
+    def lookup(self, column, fips):
+        """Values of `column` for each code in `fips` (missing where the county is unknown)."""
+        return self.table[column].array.take(self.positions(fips), allow_fill=True)
+
+    def attach(self, df, columns=('locale_type',)):
+        """Add dimension `columns` to `df` (which has an integer FIPS column), in place."""
+        for column in columns:
+            df[column] = self.lookup(column, df['FIPS'])
+        return df
+
+
+def _compare(types_path, agesex_path):
+    """(label, seconds, bytes added per row) for the string merge and the integer lookup."""
+    import time
+
+    import census_schema
+
+    types = pd.read_csv(types_path, encoding='latin-1')
+    df = census_schema.read_agesex(agesex_path)
+    base = df.memory_usage(deep=True).sum()
+
+    start = time.perf_counter()
+    strings = df.copy()
+    strings['FIPS'] = strings['STATE'].astype(str).str.zfill(2) + strings['COUNTY'].astype(str).str.zfill(3)
+    typology = types.assign(county_fips=types['county_fips'].astype(str).str.zfill(5))
+    strings = strings.merge(typology[['county_fips', 'locale_type']], left_on='FIPS', right_on='county_fips',
+                            how='left')
+    merge_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ints = df.copy()
+    ints['FIPS'] = fips_code(ints['STATE'], ints['COUNTY'])
+    CountyDimension.from_typology(types).attach(ints)
+    lookup_seconds = time.perf_counter() - start
+
+    assert (strings['locale_type'].fillna('') == ints['locale_type'].fillna('')).all()
+    return [(label, seconds, (frame.memory_usage(deep=True).sum() - base) / len(frame))
+            for label, seconds, frame in (('string merge', merge_seconds, strings),
+                                          ('int lookup', lookup_seconds, ints))]
+
+
+if __name__ == '__main__':
+    import sys
+
+    for label, seconds, per_row in _compare(sys.argv[1], sys.argv[2]):
+        print(f"  {label:<12} {seconds:6.3f}s  +{per_row:6.1f} bytes/row")
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Point-to-county lookup over data/counties.geojson.
+
+Builds a uniform grid over the county polygons' bounding boxes once; a batch
+of points is binned into grid cells, paired only with the polygons whose box
+covers their cell, and settled with an exact even-odd point-in-polygon test,
+vectorised per polygon. Holes and multi-part counties need no special
+handling: every ring of a polygon counts toward the crossing parity.
+
+The index is saved beside the GeoJSON (.census_cache/counties.<hash>.npz)
+keyed by the file's content hash, so later runs load it instead of
+rebuilding.
+
+    from county_lookup import CountyIndex
+    index = CountyIndex.load_or_build()
+    fips = index.lookup(lons, lats)        # array of 5-digit FIPS, '' = none
+
+Usage (FIPS for a CSV of points, joined to county_changes.csv metrics):
+    python county_lookup.py points.csv [--lon lon] [--lat lat] [--out out.csv]
+    python county_lookup.py --benchmark 1000000
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import census_cache
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+COUNTIES_GEOJSON = os.path.join(REPO_DIR, 'data', 'counties.geojson')
+COUNTY_METRICS = os.path.join(REPO_DIR, 'data', 'county_changes.csv')
+
+INDEX_VERSION = 1
+CELL_DEGREES = 0.25
+# Points per batch and point x edge cells per crossing test, to bound memory
+BATCH_POINTS = 1_000_000
+BLOCK_CELLS = 1_000_000
+
+
+class CountyIndex:
+    """
+    Polygons as flat edge arrays plus a grid of candidate polygons per cell.
+
+    Arrays: fips (U5, per county); part_county, part_bbox, part_edges (CSR
+    offsets into x0/y0/x1/y1, per polygon part); cell_offsets (CSR offsets into
+    cell_items, per grid cell); origin, cell size and grid shape.
+    """
+
+    ARRAYS = ['fips', 'part_county', 'part_bbox', 'part_edges', 'x0', 'y0', 'x1', 'y1',
+              'cell_offsets', 'cell_items', 'grid']
+
+    def __init__(self, arrays):
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+        self.origin_x, self.origin_y, self.cell, self.nx, self.ny = self.grid
+        self.nx, self.ny = int(self.nx), int(self.ny)
+
+    # -- building -----------------------------------------------------------
+
+    @classmethod
+    def from_geojson(cls, path=COUNTIES_GEOJSON, cell_degrees=CELL_DEGREES):
+        with open(path) as f:
+            features = json.load(f)['features']
+        fips, part_county, part_bbox, part_edges = [], [], [], [0]
+        edges = []
+        for feature in features:
+            props = feature['properties']
+            geometry = feature['geometry']
+            polygons = [geometry['coordinates']] if geometry['type'] == 'Polygon' else geometry['coordinates']
+            for polygon in polygons:
+                rings = [np.asarray(ring, dtype='float64') for ring in polygon]
+                for ring in rings:
+                    # Close the ring so the last edge returns to the start
+                    closed = ring if (ring[0] == ring[-1]).all() else np.vstack([ring, ring[:1]])
+                    edges.append(np.hstack([closed[:-1], closed[1:]]))
+                outer = rings[0]
+                part_county.append(len(fips))
+                part_bbox.append([outer[:, 0].min(), outer[:, 1].min(), outer[:, 0].max(), outer[:, 1].max()])
+                part_edges.append(part_edges[-1] + sum(len(ring) - (ring[0] == ring[-1]).all() for ring in rings))
+            fips.append(f"{props['STATE']}{props['COUNTY']}")
+
+        edges = np.vstack(edges)
+        part_bbox = np.asarray(part_bbox)
+        origin_x, origin_y = part_bbox[:, 0].min(), part_bbox[:, 1].min()
+        nx = int(np.ceil((part_bbox[:, 2].max() - origin_x) / cell_degrees)) + 1
+        ny = int(np.ceil((part_bbox[:, 3].max() - origin_y) / cell_degrees)) + 1
+
+        # Every cell each part's box touches
+        lo_x = ((part_bbox[:, 0] - origin_x) // cell_degrees).astype(np.int64)
+        hi_x = ((part_bbox[:, 2] - origin_x) // cell_degrees).astype(np.int64)
+        lo_y = ((part_bbox[:, 1] - origin_y) // cell_degrees).astype(np.int64)
+        hi_y = ((part_bbox[:, 3] - origin_y) // cell_degrees).astype(np.int64)
+        cells, items = [], []
+        for part, (ax, bx, ay, by) in enumerate(zip(lo_x, hi_x, lo_y, hi_y)):
+            gx, gy = np.meshgrid(np.arange(ax, bx + 1), np.arange(ay, by + 1))
+            cells.append((gy * nx + gx).ravel())
+            items.append(np.full(gx.size, part, dtype=np.int32))
+        cells, items = np.concatenate(cells), np.concatenate(items)
+        order = np.argsort(cells, kind='stable')
+        cell_offsets = np.zeros(nx * ny + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cells, minlength=nx * ny), out=cell_offsets[1:])
+
+        return cls({
+            'fips': np.asarray(fips, dtype='U5'),
+            'part_county': np.asarray(part_county, dtype=np.int32),
+            'part_bbox': part_bbox,
+            'part_edges': np.asarray(part_edges, dtype=np.int64),
+            'x0': edges[:, 0], 'y0': edges[:, 1], 'x1': edges[:, 2], 'y1': edges[:, 3],
+            'cell_offsets': cell_offsets,
+            'cell_items': items[order],
+            'grid': np.array([origin_x, origin_y, cell_degrees, nx, ny]),
+        })
+
+    # -- persistence --------------------------------------------------------
+
+    @staticmethod
+    def cache_path(geojson_path=COUNTIES_GEOJSON, cache_dir=None):
+        cache_dir = cache_dir or census_cache.default_cache_dir(geojson_path)
+        digest = census_cache.content_hash(geojson_path)[:16]
+        name = os.path.splitext(os.path.basename(geojson_path))[0]
+        return os.path.join(cache_dir, f'{name}.v{INDEX_VERSION}.{digest}.npz')
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + '.tmp.npz'
+        np.savez(tmp, **{name: getattr(self, name) for name in self.ARRAYS})
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls({name: data[name] for name in cls.ARRAYS})
+
+    @classmethod
+    def load_or_build(cls, geojson_path=COUNTIES_GEOJSON, cache_dir=None):
+        """The saved index for this GeoJSON's content, built and saved if missing."""
+        path = cls.cache_path(geojson_path, cache_dir)
+        if os.path.exists(path):
+            return cls.load(path)
+        index = cls.from_geojson(geojson_path)
+        index.save(path)
+        return index
+
+    # -- queries ------------------------------------------------------------
+
+    def _contains(self, part, px, py):
+        """Even-odd test of points (px, py) against every ring of polygon part `part`."""
+        lo, hi = self.part_edges[part], self.part_edges[part + 1]
+        x0, y0, x1, y1 = self.x0[lo:hi], self.y0[lo:hi], self.x1[lo:hi], self.y1[lo:hi]
+        crossings = np.zeros(len(px), dtype=np.int64)
+        px, py = px[:, None], py[:, None]
+        block = max(1, BLOCK_CELLS // len(px))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for e in range(0, hi - lo, block):
+                ax, ay, bx, by = (a[e:e + block] for a in (x0, y0, x1, y1))
+                # Edges straddling the point's latitude, crossed by a ray towards +x
+                straddles = (ay > py) != (by > py)
+                crossings += (straddles & (px < ax + (py - ay) * (bx - ax) / (by - ay))).sum(axis=1)
+        return crossings % 2 == 1
+
+    def _candidates(self, lons, lats):
+        """(point, part) pairs whose part box contains the point."""
+        gx = np.floor((lons - self.origin_x) / self.cell).astype(np.int64)
+        gy = np.floor((lats - self.origin_y) / self.cell).astype(np.int64)
+        valid = (gx >= 0) & (gx < self.nx) & (gy >= 0) & (gy < self.ny)
+        points = np.flatnonzero(valid)
+        cell = gy[valid] * self.nx + gx[valid]
+        start, count = self.cell_offsets[cell], np.diff(self.cell_offsets)[cell]
+        pair_point = np.repeat(points, count)
+        # Position of each pair within its cell's item list
+        within = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+        pair_part = self.cell_items[np.repeat(start, count) + within]
+        box = self.part_bbox[pair_part]
+        x, y = lons[pair_point], lats[pair_point]
+        keep = (box[:, 0] <= x) & (x <= box[:, 2]) & (box[:, 1] <= y) & (y <= box[:, 3])
+        return pair_point[keep], pair_part[keep]
+
+    def lookup_index(self, lons, lats):
+        """County position (into self.fips) for each point, -1 where no county contains it."""
+        lons = np.asarray(lons, dtype='float64')
+        lats = np.asarray(lats, dtype='float64')
+        result = np.full(len(lons), -1, dtype=np.int32)
+        for lo in range(0, len(lons), BATCH_POINTS):
+            sl = slice(lo, lo + BATCH_POINTS)
+            pair_point, pair_part = self._candidates(lons[sl], lats[sl])
+            order = np.argsort(pair_part, kind='stable')
+            pair_point, pair_part = pair_point[order], pair_part[order]
+            bounds = np.flatnonzero(np.diff(pair_part)) + 1
+            for points, parts in zip(np.split(pair_point, bounds), np.split(pair_part, bounds)):
+                if not len(points):
+                    continue
+                inside = self._contains(parts[0], lons[sl][points], lats[sl][points])
+                result[lo + points[inside]] = self.part_county[parts[0]]
+        return result
+
+    def lookup(self, lons, lats):
+        """5-digit FIPS for each (lon, lat) point, '' where no county contains it."""
+        positions = self.lookup_index(lons, lats)
+        fips = np.where(positions >= 0, self.fips[np.maximum(positions, 0)], '')
+        return fips.astype('U5')
+
+
+def attach_metrics(points, lon='lon', lat='lat', index=None, metrics_path=COUNTY_METRICS):
+    """`points` with a FIPS column and the county_changes.csv metrics for that county."""
+    index = index or CountyIndex.load_or_build()
+    out = points.copy()
+    out['FIPS'] = index.lookup(out[lon].to_numpy(), out[lat].to_numpy())
+    metrics = pd.read_csv(metrics_path, dtype={'FIPS': str})
+    return out.merge(metrics, on='FIPS', how='left')
+
+
+def _random_points(n, seed=0):
+    """Points spread over the lower 48's extent (some fall outside any county)."""
+    rng = np.random.default_rng(seed)
+    return rng.uniform(-125, -66, n), rng.uniform(24, 50, n)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('points', nargs='?', help='CSV with longitude/latitude columns')
+    parser.add_argument('--lon', default='lon')
+    parser.add_argument('--lat', default='lat')
+    parser.add_argument('--out', help='write the joined CSV here (default: print the first rows)')
+    parser.add_argument('--geojson', default=COUNTIES_GEOJSON)
+    parser.add_argument('--benchmark', type=int, metavar='N', help='time a lookup of N random points')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    cached = os.path.exists(CountyIndex.cache_path(args.geojson))
+    county_index = CountyIndex.load_or_build(args.geojson)
+    print(f"Index {'loaded' if cached else 'built'} in {time.perf_counter() - start:.2f}s: "
+          f"{len(county_index.fips):,} counties, {len(county_index.x0):,} edges")
+
+    if args.benchmark:
+        xs, ys = _random_points(args.benchmark)
+        start = time.perf_counter()
+        found = county_index.lookup(xs, ys)
+        seconds = time.perf_counter() - start
+        print(f"{args.benchmark:,} points in {seconds:.2f}s ({args.benchmark / seconds:,.0f}/s), "
+              f"{(found != '').mean():.1%} inside a county")
+    if args.points:
+        joined = attach_metrics(pd.read_csv(args.points), args.lon, args.lat, county_index)
+        if args.out:
+            joined.to_csv(args.out, index=False)
+            print(f"Wrote {len(joined):,} rows to {args.out}")
+        else:
+            print(joined.head(20).to_string())
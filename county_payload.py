@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Columnar binary payload for the county map data.
+
+county_data_embed.js is a JSON object keyed by FIPS that repeats every field
+name for every county. county_data.bin holds the same fields as one typed
+array per metric instead:
+
+  - counts as the smallest integer type that holds them
+  - rates as fixed-point integers (value * 10**decimals), with the type's
+    minimum value meaning "missing"
+  - county, state and locale names as indexes into one shared string table
+
+Layout (little-endian):
+    b'CFP1' | uint32 header length | header JSON | arrays
+
+The header JSON lists the county count, the snapshot years the fields are
+for (so readers can label p0 / u4 / fr24 ... without assuming 2020 / 2024),
+the string table and, for each field, its key, type, byte offset (from the
+start of the arrays), decimals and null value. The header is padded so the arrays start on an 8-byte boundary and
+every array is aligned to its element size, so the page can view each one
+directly as a typed array. Pre-compressed .gz (and .br, when the brotli
+package is installed) siblings are written next to it for servers that serve
+static pre-compressed files.
+
+Usage (sizes of a saved payload vs the equivalent keyed JSON):
+    python county_payload.py data/county_data.bin
+"""
+
+import gzip
+import json
+import os
+import struct
+
+import numpy as np
+import pandas as pd
+
+from exporter import atomic_write
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MAGIC = b'CFP1'
+PAYLOAD_NAME = 'county_data.bin'
+
+# key -> (column, decimals); decimals None = integer count, 'str' = string table index.
+# Same keys as county_data_embed.js, plus the locale type. Column names are
+# filled in with the snapshot years (vintages.snapshot_years); the keys stay put.
+FIELDS = {
+    'n': ('CTYNAME', 'str'),
+    's': ('STNAME', 'str'),
+    't': ('locale_type', 'str'),
+    'p0': ('POPESTIMATE_{base}', None),
+    'u0': ('UNDER5_TOT_{base}', None),
+    'u4': ('UNDER5_TOT_{latest}', None),
+    'ac': ('under5_change', None),
+    'pc': ('under5_pct_change', 1),
+    'w0': ('WOMEN_15_49_{base}', None),
+    'w4': ('WOMEN_15_49_{latest}', None),
+    # RBIRTH is published to many decimals; two are plenty for the map
+    'br11': ('RBIRTH{first}', 2),
+    'br24': ('RBIRTH{latest}', 2),
+    'brch': ('br_pct_change', 1),
+    'fr21': ('fertility_{current}', 1),
+    'fr24': ('fertility_{latest}', 1),
+    'frch': ('fertility_pct_change', 1),
+    # Cohorts (age_structure.py): the under-5s and the 25-39s of the April base, four years older
+    'c0': ('cohort_under5_{base}', None),
+    'c4': ('cohort_under5_{latest}', None),
+    'cpc': ('cohort_under5_pct_change', 1),
+    'y0': ('cohort_age25_39_{base}', None),
+    'y4': ('cohort_age25_39_{latest}', None),
+    'ypc': ('cohort_age25_39_pct_change', 1),
+}
+
+# Snapshot years of the 2024 vintages, for frames built without vintages.snapshot_years
+SNAPSHOT = {'first': 2011, 'base': 2020, 'current': 2021, 'latest': 2024}
+
+INT_TYPES = [np.int8, np.int16, np.int32]
+
+
+def snapshot_header(snapshot=None):
+    """The calendar years of `snapshot` (default SNAPSHOT) as written into payload and manifest headers."""
+    snapshot = snapshot or SNAPSHOT
+    return {key: int(snapshot[key]) for key in SNAPSHOT}
+
+
+def _smallest_int(values, nullable):
+    """Smallest signed type holding `values`, keeping its minimum free for null."""
+    lo = int(values.min()) if len(values) else 0
+    hi = int(values.max()) if len(values) else 0
+    for dtype in INT_TYPES:
+        info = np.iinfo(dtype)
+        if info.min + nullable <= lo and hi <= info.max:
+            return dtype
+    raise ValueError(f"values {lo}..{hi} do not fit in int32")
+
+
+def encode_column(series, decimals):
+    """(array, null value or None) for one metric column."""
+    values = pd.to_numeric(series, errors='coerce').to_numpy(dtype='float64')
+    missing = ~np.isfinite(values)
+    if decimals:
+        values = np.round(values * 10 ** decimals)
+    quantized = np.where(missing, 0, values).astype(np.int64)
+    dtype = _smallest_int(quantized[~missing], missing.any())
+    if not missing.any():
+        return quantized.astype(dtype), None
+    null = int(np.iinfo(dtype).min)
+    return np.where(missing, null, quantized).astype(dtype), null
+
+
+def build_payload(detail, snapshot=None):
+    """
+    bytes of the payload for a per-county frame (pipeline.county_detail or the
+    scripts' lu_merged) with columns named for `snapshot` (default SNAPSHOT);
+    fields whose column is absent are left out.
+    """
+    strings, index = [], {}
+
+    def intern(value):
+        if value not in index:
+            index[value] = len(strings)
+            strings.append(value)
+        return index[value]
+
+    fips = detail['FIPS'].astype(int).to_numpy()
+    columns = [('fips', np.asarray(fips, dtype=np.int32), None, None)]
+    for key, (col, decimals) in FIELDS.items():
+        col = col.format(**(snapshot or SNAPSHOT))
+        if col not in detail.columns:
+            continue
+        if decimals == 'str':
+            codes = np.array([intern(str(v)) for v in detail[col]], dtype=np.int64)
+            columns.append((key, codes, 'str', None))
+        else:
+            array, null = encode_column(detail[col], decimals)
+            columns.append((key, array, decimals, null))
+
+    fields, blobs, offset = [], [], 0
+    for key, array, decimals, null in columns:
+        if decimals == 'str':
+            array = array.astype(np.uint8 if len(strings) <= 256 else np.uint16 if len(strings) <= 65536
+                                 else np.uint32)
+        array = array.astype(array.dtype.newbyteorder('<'))
+        pad = -offset % array.dtype.itemsize
+        blobs.append(b'\0' * pad + array.tobytes())
+        offset += pad
+        field = {'key': key, 'type': array.dtype.name, 'offset': offset}
+        if decimals == 'str':
+            field['strings'] = True
+        elif decimals:
+            field['decimals'] = decimals
+        if null is not None:
+            field['null'] = null
+        fields.append(field)
+        offset += array.nbytes
+
+    header = json.dumps({'count': len(fips), 'years': snapshot_header(snapshot), 'strings': strings,
+                         'fields': fields},
+                        separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    # Pad with spaces so the arrays start 8-byte aligned after magic + length
+    header += b' ' * (-(len(MAGIC) + 4 + len(header)) % 8)
+    return MAGIC + struct.pack('<I', len(header)) + header + b''.join(blobs)
+
+
+def read_payload(path_or_bytes):
+    """
+    Decode a payload into a frame indexed by 5-digit FIPS (for checks and
+    tools); frame.attrs['years'] holds its snapshot years.
+    """
+    if isinstance(path_or_bytes, (bytes, bytearray)):
+        data = bytes(path_or_bytes)
+    else:
+        opener = gzip.open if str(path_or_bytes).endswith('.gz') else open
+        with opener(path_or_bytes, 'rb') as f:
+            data = f.read()
+    if data[:4] != MAGIC:
+        raise ValueError("not a county payload")
+    (header_len,) = struct.unpack_from('<I', data, 4)
+    header = json.loads(data[8:8 + header_len])
+    base = 8 + header_len
+    n = header['count']
+    out = {}
+    for field in header['fields']:
+        dtype = np.dtype(field['type']).newbyteorder('<')
+        values = np.frombuffer(data, dtype=dtype, count=n, offset=base + field['offset'])
+        if field.get('strings'):
+            out[field['key']] = [header['strings'][i] for i in values]
+            continue
+        result = values.astype('float64')
+        if 'null' in field:
+            result[values == field['null']] = np.nan
+        if field.get('decimals'):
+            result = result / 10 ** field['decimals']
+        out[field['key']] = result
+    frame = pd.DataFrame(out)
+    frame.index = frame.pop('fips').astype(int).map('{:05d}'.format)
+    # Payloads written before the header carried the years are for SNAPSHOT
+    frame.attrs['years'] = header.get('years', snapshot_header())
+    return frame
+
+
+def write_payload(out_dir, detail, snapshot=None, name=PAYLOAD_NAME):
+    """Write the payload and its .gz (and .br) siblings; returns their paths."""
+    os.makedirs(out_dir, exist_ok=True)
+    return write_precompressed(os.path.join(out_dir, name), build_payload(detail, snapshot))
+
+
+def write_precompressed(path, data):
+    """Write `data` to `path` plus .gz (and .br) siblings, each replaced atomically; returns their paths."""
+    written = [atomic_write(path, data)]
+    # mtime=0 keeps the .gz byte-identical across rebuilds of the same data
+    written.append(atomic_write(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0)))
+    if brotli is not None:
+        written.append(atomic_write(path + '.br', brotli.compress(data, quality=11)))
+    elif os.path.exists(path + '.br'):
+        # A stale sibling would be served in place of the new file
+        os.remove(path + '.br')
+    return written
+
+
+def keyed_json_size(frame):
+    """Bytes of the same data as a county_data_embed.js-style keyed JSON object."""
+    records = {}
+    for fips, row in zip(frame.index, frame.to_dict('records')):
+        records[fips] = {k: (None if np.isnan(v) else int(v) if v.is_integer() else v) if isinstance(v, float) else v
+                         for k, v in row.items()}
+    return len(json.dumps(records).encode('utf-8'))
+
+
+if __name__ == '__main__':
+    import sys
+
+    for src in sys.argv[1:]:
+        frame = read_payload(src)
+        print(f"{src}: {len(frame):,} counties, {len(frame.columns)} fields, years {frame.attrs['years']}")
+        print(f"  keyed JSON         {keyed_json_size(frame):>10,} bytes")
+        for path in (src, src + '.gz', src + '.br'):
+            if os.path.exists(path):
+                print(f"  {os.path.basename(path):<18} {os.path.getsize(path):>10,} bytes")
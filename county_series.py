@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Per-county fertility-rate series (births per 1,000 women age 15-49) for every
+county and every year, 2011-2024.
+
+pipeline.fertility_rate_ts builds the 2011-2024 series per locale_type only;
+the county detail has just fertility_2021 and fertility_2024. Here the
+BIRTHS{year} columns of both co-est vintages and the WOMEN_15_49 totals of the
+matching agesex YEAR codes (vintages.year_map) are laid out as
+counties x years arrays in one vectorised pass each, so all ~3,100 counties
+and all 14 years come out of a handful of array operations instead of a
+groupby per locale and year.
+
+Each year is taken from one vintage: 2011-2020 from co-est2020 /
+cc-est2020-agesex, 2021-2024 from co-est2024 / cc-est2024-agesex. Every year's
+births are divided by the women 15-49 of the same year (the county detail's
+fertility_2021 uses the April 2020 base instead). Counties that exist in only
+one vintage (e.g. the Connecticut planning regions) are null in the other
+vintage's years, as is any county/year without women 15-49.
+
+Written as data/county_fertility_ts.json (plus .gz), a compact matrix:
+    {"years": [2011, ...], "fips": ["01001", ...], "rates": [[r2011, ...], ...]}
+with one row per county, rates rounded to 0.1. append_series adds the years
+of a new release to an existing file without touching the years already in it.
+
+Usage:
+    python county_series.py [--source-dir DIR] [--out data/county_fertility_ts.json]
+"""
+
+import argparse
+import json
+import os
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from county_dimension import fips_str
+from county_payload import write_precompressed
+from exporter import nullable
+
+SERIES_NAME = 'county_fertility_ts.json'
+
+# fips: (counties,) integer FIPS; years: (years,); births, women, rates: (counties, years) float, NaN = missing
+CountySeries = namedtuple('CountySeries', ['fips', 'years', 'births', 'women', 'rates'])
+
+
+def component_matrix(components, fips, years, metric='BIRTHS'):
+    """{metric}{year} of a co-est frame as a len(fips) x len(years) array aligned to `fips`."""
+    out = np.full((len(fips), len(years)), np.nan)
+    rows = pd.Index(fips).get_indexer(components['FIPS'])
+    found = rows >= 0
+    for j, year in enumerate(years):
+        col = f'{metric}{year}'
+        if col in components.columns:
+            out[rows[found], j] = components[col].to_numpy(dtype=float)[found]
+    return out
+
+
+def agesex_matrix(agesex, fips, years, year_map, column='WOMEN_15_49'):
+    """
+    `column` of an agesex frame as a len(fips) x len(years) array: each
+    row lands at its county's row and at the column of the calendar year its
+    YEAR code stands for (`year_map`: calendar year -> YEAR code).
+    """
+    out = np.full((len(fips), len(years)), np.nan)
+    codes = agesex['YEAR'].to_numpy(dtype=np.int64)
+    # YEAR code -> column, -1 for codes outside `years` (the April base, earlier Julys)
+    column_of = np.full(max(codes.max(initial=0), max(year_map.values())) + 1, -1)
+    for j, year in enumerate(years):
+        if year in year_map:
+            column_of[year_map[year]] = j
+    rows = pd.Index(fips).get_indexer(agesex['FIPS'])
+    cols = column_of[codes]
+    keep = (rows >= 0) & (cols >= 0)
+    out[rows[keep], cols[keep]] = agesex[column].to_numpy(dtype=float)[keep]
+    return out
+
+
+def county_fertility_series(periods):
+    """
+    `periods`: (components, agesex, years, year_map) per vintage, each year in
+    exactly one period; a period whose agesex frame is None is skipped.
+    Returns a CountySeries over the union of their counties, sorted by FIPS.
+    """
+    periods = [p for p in periods if p[1] is not None]
+    fips = np.unique(np.concatenate([components['FIPS'].to_numpy() for components, *_ in periods]))
+    years = sorted(year for *_, years, _ in periods for year in years)
+    births = np.full((len(fips), len(years)), np.nan)
+    women = np.full((len(fips), len(years)), np.nan)
+    for components, agesex, period_years, year_map in periods:
+        cols = [years.index(year) for year in period_years]
+        births[:, cols] = component_matrix(components, fips, list(period_years))
+        women[:, cols] = agesex_matrix(agesex, fips, list(period_years), year_map)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rates = np.where(women > 0, births / women * 1000, np.nan)
+    return CountySeries(fips, np.array(years, dtype=np.int64), births, women, rates)
+
+
+def rates_frame(series):
+    """The rate matrix as a DataFrame indexed by integer FIPS with one column per year."""
+    return pd.DataFrame(series.rates, index=pd.Index(series.fips, name='FIPS'), columns=series.years)
+
+
+def series_json(series, decimals=1):
+    """Compact {"years", "fips", "rates"} document, NaN as null."""
+    rounded = np.round(series.rates, decimals)
+    rows = np.array(nullable(rounded.ravel()), dtype=object).reshape(rounded.shape).tolist()
+    return {'years': series.years.tolist(), 'fips': fips_str(series.fips), 'rates': rows}
+
+
+def write_series(out_dir, series, name=SERIES_NAME):
+    """Write the series matrix (plus .gz); returns the paths."""
+    os.makedirs(out_dir, exist_ok=True)
+    data = json.dumps(series_json(series), separators=(',', ':')).encode('utf-8')
+    return write_precompressed(os.path.join(out_dir, name), data)
+
+
+def read_series(path):
+    """A written series matrix as a CountySeries of rates only (births and women None)."""
+    with open(path) as f:
+        doc = json.load(f)
+    fips = np.array([int(v) for v in doc['fips']], dtype=np.int64)
+    years = np.array(doc['years'], dtype=np.int64)
+    rates = np.array([[np.nan if v is None else v for v in row] for row in doc['rates']], dtype=float)
+    return CountySeries(fips, years, None, None, rates.reshape(len(fips), len(years)))
+
+
+def concat_series(*parts):
+    """
+    The rates of series over disjoint years as one series over the union of
+    their counties, years in order (births and women None). A county missing
+    from a part is null in that part's years.
+    """
+    fips = np.unique(np.concatenate([part.fips for part in parts]))
+    years = np.concatenate([part.years for part in parts])
+    if len(np.unique(years)) != len(years):
+        raise ValueError(f"series overlap in years: {sorted(years.tolist())}")
+    blocks = []
+    for part in parts:
+        block = np.full((len(fips), len(part.years)), np.nan)
+        block[np.searchsorted(fips, part.fips)] = part.rates
+        blocks.append(block)
+    order = np.argsort(years, kind='stable')
+    return CountySeries(fips, years[order], None, None, np.hstack(blocks)[:, order])
+
+
+def append_series(out_dir, series, name=SERIES_NAME):
+    """Add the years of `series` to the series already written in `out_dir` (write it if there is none)."""
+    path = os.path.join(out_dir, name)
+    if os.path.exists(path):
+        series = concat_series(read_series(path), series)
+    return write_series(out_dir, series, name)
+
+
+if __name__ == '__main__':
+    import pipeline
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--source-dir', default=pipeline.SOURCE_DIR)
+    parser.add_argument('--out', default=os.path.join(pipeline.OUTPUT_DIR, SERIES_NAME))
+    args = parser.parse_args()
+
+    src = pipeline.source_paths(args.source_dir)
+    series = county_fertility_series(pipeline.vintage_periods(
+        pipeline.load_components(src['components_10']), pipeline.load_components(src['components_24']),
+        pipeline.load_agesex(src['agesex_10'], optional=True), pipeline.load_agesex(src['agesex_24'])))
+    frame = rates_frame(series)
+    print(frame.describe().T[['count', 'mean', 'min', 'max']].round(1).to_string())
+    written = write_series(os.path.dirname(os.path.abspath(args.out)), series, os.path.basename(args.out))
+    print(f"\nExported {written[0]}: {len(series.fips)} counties x {len(series.years)} years, "
+          f"{os.path.getsize(written[0]):,} bytes ({os.path.getsize(written[1]):,} gzipped)")
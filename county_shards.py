@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+County map data split by state, loaded on demand.
+
+county_data_embed.js and county_data.bin carry every field of every county,
+so the page fetches all of it before the map can paint, and that grows with
+each metric added per county. Here the same records are written as one file
+per state plus a small manifest:
+
+    data/counties/manifest.json   national figures, the snapshot years, the
+                                  FIPS -> shard map and the few fields the
+                                  map is coloured by
+    data/counties/01.json         {"01001": {"n": ..., "s": ..., ...}, ...}
+    data/counties/02.json         ...
+
+The manifest is columnar (one array per field, string fields as indexes into
+one string table) and holds only SUMMARY_KEYS, so its size depends on the
+number of counties, not on the number of fields; the page paints from it and
+fetches a state's shard the first time one of its counties is hovered.
+
+Shards are written first and the manifest last, each atomically, so a reader
+never sees a manifest that points at shards from another build. Shards of
+states no longer in the data are removed.
+
+Usage (sizes of a written shard directory):
+    python county_shards.py [data/counties]
+"""
+
+import argparse
+import json
+import os
+import re
+
+import numpy as np
+
+from county_dimension import fips_str
+from county_payload import snapshot_header
+from exporter import atomic_write, column_values, records, write_json
+
+SHARD_DIR = 'counties'
+MANIFEST_NAME = 'manifest.json'
+SHARDS_VERSION = 1
+SHARD_FILE = re.compile(r'^\d{2}\.json$')
+
+# Keys of the shard records the map is coloured by: locale type (only large
+# urban counties are highlighted), under-5 change and the latest fertility rate
+SUMMARY_KEYS = ['t', 'ac', 'pc', 'fr24']
+
+
+def shard_keys(fips):
+    """2-digit state FIPS of each integer county FIPS: the shard it is written to."""
+    return [f'{code:02d}' for code in (np.asarray(fips, dtype=np.int64) // 1000).tolist()]
+
+
+def build_manifest(fips, shards, detail, fields, summary_keys=SUMMARY_KEYS, national=None, snapshot=None):
+    """
+    The manifest document for counties `fips` in `shards` (their shard keys),
+    with the years of `snapshot` the record fields are for.
+    """
+    names = sorted(set(shards))
+    position = {name: i for i, name in enumerate(names)}
+    strings, index = [], {}
+    summary = {}
+    for key in summary_keys:
+        column, kind = fields[key]
+        values = column_values(detail, column, kind)
+        if kind == 'str':
+            for value in values:
+                if value is not None and value not in index:
+                    index[value] = len(strings)
+                    strings.append(value)
+            values = [None if value is None else index[value] for value in values]
+        summary[key] = values
+    return {
+        'version': SHARDS_VERSION,
+        'national': national or {},
+        'years': snapshot_header(snapshot),
+        'shards': names,
+        'fips': fips_str(fips),
+        # index into `shards` per county
+        'shard': [position[name] for name in shards],
+        'strings': strings,
+        # string fields (kind 'str') are indexes into `strings`
+        'string_keys': [key for key in summary_keys if fields[key][1] == 'str'],
+        'summary': summary,
+    }
+
+
+def write_shards(out_dir, detail, fields, summary_keys=SUMMARY_KEYS, national=None, snapshot=None):
+    """
+    Write one {FIPS: record} shard per state of a per-county frame
+    (pipeline.county_detail), records built from `fields` ({key: (column,
+    exporter kind)}), then the manifest; returns the paths.
+    """
+    directory = os.path.join(out_dir, SHARD_DIR)
+    os.makedirs(directory, exist_ok=True)
+    fips = detail['FIPS'].to_numpy(dtype=np.int64)
+    keys = fips_str(fips)
+    shards = shard_keys(fips)
+
+    by_shard = {}
+    for shard, key, record in zip(shards, keys, records(detail, fields)):
+        by_shard.setdefault(shard, {})[key] = record
+    written = [write_json(os.path.join(directory, f'{shard}.json'), by_shard[shard]) for shard in sorted(by_shard)]
+    for name in os.listdir(directory):
+        if SHARD_FILE.match(name) and name[:2] not in by_shard:
+            os.remove(os.path.join(directory, name))
+
+    manifest = build_manifest(fips, shards, detail, fields, summary_keys, national, snapshot)
+    written.append(atomic_write(os.path.join(directory, MANIFEST_NAME), json.dumps(manifest, separators=(',', ':'))))
+    return written
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('directory', nargs='?',
+                        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', SHARD_DIR))
+    args = parser.parse_args()
+
+    with open(os.path.join(args.directory, MANIFEST_NAME)) as f:
+        manifest = json.load(f)
+    sizes = [os.path.getsize(os.path.join(args.directory, f'{name}.json')) for name in manifest['shards']]
+    print(f"{args.directory}: {len(manifest['fips']):,} counties in {len(sizes)} shards, "
+          f"years {manifest.get('years')}")
+    print(f"  manifest        {os.path.getsize(os.path.join(args.directory, MANIFEST_NAME)):>10,} bytes "
+          f"({', '.join(manifest['summary'])})")
+    print(f"  shards total    {sum(sizes):>10,} bytes")
+    print(f"  largest shard   {max(sizes):>10,} bytes")
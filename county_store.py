@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Local SQLite store of the Census inputs in long format.
+
+Every question about a county or a year otherwise starts with parsing the
+CSVs. `build` loads the typology, both co-est vintages and both agesex
+vintages once into one SQLite file:
+
+    sources      one row per source file: kind, vintage, size, mtime and its
+                 parsed columns (to rebuild the census_schema frames exactly)
+    typology     county_summary_final.csv as it is
+    places       one row per county (and state total) of each file: FIPS,
+                 STATE, COUNTY, STNAME, CTYNAME, locale_type, file order
+    components   (source, fips, year): popestimate, births, rbirth
+    agesex       (source, fips, year_code): calendar year (NULL for the April
+                 base), popestimate, under5_tot, the female 15-49 groups,
+                 women_15_49 and every age x sex group (age_structure.py)
+
+Both fact tables carry the county's locale_type and are indexed on
+(fips, year) and (locale_type, year). A year covered by two vintages is in
+the table twice; `preferred` = 1 marks the vintage the pipeline takes it from
+(vintages.assign_years), so a series has one row per year:
+
+    SELECT year, rbirth FROM components WHERE fips = 17031 AND preferred ORDER BY year;
+
+    SELECT a.fips, a.women_15_49, b.women_15_49
+    FROM agesex a JOIN agesex b ON b.fips = a.fips AND b.year = 2024 AND b.preferred
+    WHERE a.year = 2020 AND a.preferred AND b.women_15_49 < 0.95 * a.women_15_49;
+
+census_schema.read_components / read_agesex / read_typology read from the
+store instead of the CSVs when CENSUS_STORE names a store file (a source
+missing from it is a FileNotFoundError, like a missing file), so the scripts
+and the pipeline run against it unchanged. A source file that is still on
+disk must have the size and mtime recorded when the store was built; if it
+was replaced since, reading it raises ValueError rather than serving the old
+data:
+
+    CENSUS_STORE=census.sqlite python process_fertility_data.py
+
+Only the columns the analyses parse are stored: readers asking for extra
+agesex columns other than age_structure.AGE_COLUMNS still read the CSV.
+
+Usage:
+    python county_store.py build [--source-dir DIR] [--db census.sqlite]
+    python county_store.py sql "SELECT ..." [--db census.sqlite]
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+import census_schema
+from age_structure import AGE_COLUMNS, age_columns
+from census_schema import AGESEX_COUNTS, COMPONENT_COLUMN, COUNT_DTYPE, GEO_DTYPES, RATE_DTYPE, WOMEN_15_49_COLS
+from county_dimension import CountyDimension, fips_code
+from long_format import components_long
+from vintages import assign_years, estimate_years, year_map
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+STORE_PATH = os.path.join(REPO_DIR, 'census.sqlite')
+STORE_VERSION = 3
+
+# Age x sex groups stored next to AGESEX_COUNTS (those already in it are not repeated)
+STORED_AGE_COLUMNS = [col for col in AGE_COLUMNS if col not in AGESEX_COUNTS]
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE sources (name TEXT PRIMARY KEY, kind TEXT NOT NULL, vintage INTEGER, size INTEGER, mtime REAL,
+                      columns TEXT NOT NULL);
+CREATE TABLE places (source TEXT NOT NULL, row INTEGER NOT NULL, fips INTEGER NOT NULL, state INTEGER,
+                     county INTEGER, stname TEXT, ctyname TEXT, locale_type TEXT, PRIMARY KEY (source, row));
+CREATE TABLE components (source TEXT NOT NULL, fips INTEGER NOT NULL, year INTEGER NOT NULL, locale_type TEXT,
+                         preferred INTEGER NOT NULL, popestimate INTEGER, births INTEGER, rbirth REAL);
+CREATE TABLE agesex (source TEXT NOT NULL, row INTEGER NOT NULL, fips INTEGER NOT NULL, year_code INTEGER NOT NULL,
+                     year INTEGER, locale_type TEXT, preferred INTEGER NOT NULL, popestimate INTEGER,
+                     under5_tot INTEGER, age1519_fem INTEGER, age2024_fem INTEGER, age2529_fem INTEGER,
+                     age3034_fem INTEGER, age3539_fem INTEGER, age4044_fem INTEGER, age4549_fem INTEGER,
+                     women_15_49 INTEGER, {age_columns});
+""".format(age_columns=', '.join(f'{col.lower()} INTEGER' for col in STORED_AGE_COLUMNS))
+
+INDEXES = """
+CREATE INDEX components_fips_year ON components (fips, year);
+CREATE INDEX components_locale_year ON components (locale_type, year);
+CREATE INDEX components_source ON components (source);
+CREATE INDEX agesex_fips_year ON agesex (fips, year);
+CREATE INDEX agesex_locale_year ON agesex (locale_type, year);
+CREATE INDEX agesex_source_row ON agesex (source, row);
+"""
+
+
+def connect(path):
+    """Read-only connection to a built store."""
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    return sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+
+
+# ---------------------------------------------------------------------------
+# Build
+# ---------------------------------------------------------------------------
+
+def _add_source(con, path, kind, vintage, df):
+    stat = os.stat(path)
+    con.execute('INSERT INTO sources VALUES (?, ?, ?, ?, ?, ?)',
+                (os.path.basename(path), kind, vintage, stat.st_size, stat.st_mtime, json.dumps(list(df.columns))))
+
+
+def _add_places(con, name, df, counties):
+    """One places row per distinct FIPS of `df`, in file order; returns the FIPS column."""
+    fips = fips_code(df['STATE'], df['COUNTY'])
+    first = np.sort(np.unique(fips, return_index=True)[1])
+    places = pd.DataFrame({
+        'source': name,
+        'row': np.arange(len(first)),
+        'fips': fips[first].astype(np.int64),
+        'state': df['STATE'].to_numpy(dtype=np.int64)[first],
+        'county': df['COUNTY'].to_numpy(dtype=np.int64)[first],
+        'stname': df['STNAME'].astype(str).to_numpy()[first],
+        'ctyname': df['CTYNAME'].astype(str).to_numpy()[first],
+        'locale_type': counties.lookup('locale_type', fips[first]),
+    })
+    places.to_sql('places', con, if_exists='append', index=False)
+    return fips
+
+
+def _add_components(con, path, df, counties, preferred_years):
+    name = os.path.basename(path)
+    _add_source(con, path, 'components', estimate_years(df)[-1], df)
+    df = df.assign(FIPS=_add_places(con, name, df, counties))
+    counties.attach(df)
+    long = components_long(df)
+    long.columns = [col.lower() for col in long.columns]
+    long.insert(0, 'source', name)
+    long.insert(4, 'preferred', long['year'].isin(preferred_years).astype(int))
+    long.to_sql('components', con, if_exists='append', index=False)
+
+
+def _add_agesex(con, path, df, counties, components, preferred_years):
+    name = os.path.basename(path)
+    _add_source(con, path, 'agesex', estimate_years(components)[-1], df)
+    fips = _add_places(con, name, df, counties)
+    code_to_year = {code: year for year, code in year_map(df, components).items()}
+    years = df['YEAR'].map(code_to_year)
+    long = pd.DataFrame({
+        'source': name,
+        'row': np.arange(len(df)),
+        'fips': fips.astype(np.int64),
+        'year_code': df['YEAR'].to_numpy(dtype=np.int64),
+        'year': years.astype('Int64'),
+        'locale_type': counties.lookup('locale_type', fips),
+        'preferred': years.isin(preferred_years).astype(int).to_numpy(),
+    })
+    for col in AGESEX_COUNTS:
+        long[col.lower()] = df[col].to_numpy(dtype=np.int64)
+    long['women_15_49'] = df[WOMEN_15_49_COLS].sum(axis=1).to_numpy(dtype=np.int64)
+    for col in STORED_AGE_COLUMNS:
+        if col in df.columns:
+            long[col.lower()] = df[col].to_numpy(dtype=np.int64)
+    long.to_sql('agesex', con, if_exists='append', index=False)
+
+
+def build_store(path, typology_path, components_paths, agesex_paths):
+    """
+    Write the store at `path` (replaced atomically) from the typology, the
+    co-est files (oldest vintage first) and each vintage's agesex file (None
+    to skip one). Returns the path.
+    """
+    typology = pd.read_csv(typology_path, encoding='latin-1')
+    counties = CountyDimension.from_typology(typology)
+    components = [census_schema.read_components(p, store='') for p in components_paths]
+    preferred = assign_years(*components, leading_estimates=True)
+
+    tmp = f'{path}.tmp{os.getpid()}'
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    try:
+        with sqlite3.connect(tmp) as con:
+            con.executescript(SCHEMA)
+            con.execute('INSERT INTO meta VALUES (?, ?)', ('version', str(STORE_VERSION)))
+            _add_source(con, typology_path, 'typology', None, typology)
+            typology.to_sql('typology', con, index=False)
+            for p, df, years in zip(components_paths, components, preferred):
+                _add_components(con, p, df, counties, years)
+            for p, agesex_path, df, years in zip(components_paths, agesex_paths, components, preferred):
+                if agesex_path is not None and os.path.exists(agesex_path):
+                    agesex = census_schema.read_agesex(agesex_path, store='',
+                                                       extra=age_columns(census_schema.read_header(agesex_path)))
+                    _add_agesex(con, agesex_path, agesex, counties, df, years)
+            con.executescript(INDEXES)
+        con.close()
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return path
+
+
+# ---------------------------------------------------------------------------
+# Read back as census_schema frames
+# ---------------------------------------------------------------------------
+
+def _check_version(con, store):
+    row = con.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+    if row is None or int(row[0]) != STORE_VERSION:
+        raise ValueError(f"{store}: county store version {row and row[0]}, expected {STORE_VERSION}; rebuild it")
+
+
+def _source(con, path, kind):
+    """
+    (name, parsed columns) of a stored source; FileNotFoundError if it is not
+    in the store, ValueError if the file at `path` changed since the build.
+    """
+    name = os.path.basename(path)
+    row = con.execute('SELECT columns, size, mtime FROM sources WHERE name = ? AND kind = ?',
+                      (name, kind)).fetchone()
+    if row is None:
+        raise FileNotFoundError(f"{name} is not in the county store")
+    columns, size, mtime = row
+    if os.path.exists(path):
+        stat = os.stat(path)
+        if (stat.st_size, stat.st_mtime) != (size, mtime):
+            raise ValueError(f"{path} changed since the county store was built; rebuild the store "
+                             f"(python county_store.py build) or unset {census_schema.STORE_ENV}")
+    return name, json.loads(columns)
+
+
+@contextlib.contextmanager
+def _open(store):
+    """Read connection to `store`, closed on leaving the with block."""
+    with contextlib.closing(connect(store)) as con:
+        _check_version(con, store)
+        yield con
+
+
+def _places(con, name):
+    return pd.read_sql_query('SELECT fips, state, county, stname, ctyname FROM places WHERE source = ? ORDER BY row',
+                             con, params=(name,))
+
+
+def _geography(frame, columns):
+    """The GEO_DTYPES columns of `frame` (places rows) as census_schema parses them."""
+    out = {}
+    for col, dtype in GEO_DTYPES.items():
+        if col in columns:
+            values = frame[col.lower()]
+            out[col] = pd.Categorical(values) if dtype == 'category' else values.to_numpy(dtype=dtype)
+    return out
+
+
+def read_components(store, path):
+    """The census_schema.read_components frame of `path` from the store."""
+    with _open(store) as con:
+        name, columns = _source(con, path, 'components')
+        places = _places(con, name)
+        long = pd.read_sql_query('SELECT fips, year, popestimate, births, rbirth FROM components WHERE source = ?',
+                                 con, params=(name,))
+    rows = pd.Index(places['fips']).get_indexer(long['fips'])
+    frame = pd.DataFrame(_geography(places, columns))
+    for col in columns:
+        match = COMPONENT_COLUMN.match(col)
+        if match is None:
+            continue
+        metric, year = match.group(1), int(col[len(match.group(1)):])
+        values = np.full(len(places), np.nan)
+        at_year = (long['year'] == year).to_numpy()
+        values[rows[at_year]] = long[metric.lower()].to_numpy(dtype=float)[at_year]
+        frame[col] = values if metric == 'RBIRTH' else np.nan_to_num(values).astype(COUNT_DTYPE)
+    return frame[columns].astype({col: RATE_DTYPE for col in columns if col.startswith('RBIRTH')})
+
+
+def read_agesex(store, path, extra=()):
+    """The census_schema.read_agesex frame of `path` (plus the `extra` AGE_COLUMNS) from the store."""
+    with _open(store) as con:
+        name, columns = _source(con, path, 'agesex')
+        places = _places(con, name).set_index('fips', drop=False)
+        long = pd.read_sql_query('SELECT * FROM agesex WHERE source = ? ORDER BY row', con, params=(name,))
+    frame = pd.DataFrame(_geography(places.loc[long['fips']].reset_index(drop=True), columns))
+    if 'YEAR' in columns:
+        frame['YEAR'] = long['year_code'].to_numpy(dtype=census_schema.AGESEX_DTYPES['YEAR'])
+    wanted = [col for col in columns if col in GEO_DTYPES or col == 'YEAR' or col in AGESEX_COUNTS or col in extra]
+    for col in wanted:
+        if col not in frame.columns:
+            frame[col] = long[col.lower()].to_numpy(dtype=COUNT_DTYPE)
+    return frame[wanted]
+
+
+def read_typology(store, path):
+    """The typology file `path` (county_summary_final.csv) as pd.read_csv returns it."""
+    with _open(store) as con:
+        _source(con, path, 'typology')
+        return pd.read_sql_query('SELECT * FROM typology', con)
+
+
+if __name__ == '__main__':
+    import time
+
+    import pipeline
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['build', 'sql'])
+    parser.add_argument('query', nargs='?', help='SQL for the sql command')
+    parser.add_argument('--source-dir', default=pipeline.SOURCE_DIR)
+    parser.add_argument('--db', default=STORE_PATH)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        src = pipeline.source_paths(args.source_dir)
+        start = time.perf_counter()
+        build_store(args.db, src['county_types'], [src['components_10'], src['components_24']],
+                    [src['agesex_10'], src['agesex_24']])
+        with contextlib.closing(connect(args.db)) as con:
+            counts = {table: con.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                      for table in ('typology', 'places', 'components', 'agesex')}
+        print(f"Built {args.db} in {time.perf_counter() - start:.1f}s "
+              f"({os.path.getsize(args.db) / 1e6:.1f} MB): "
+              + ', '.join(f"{table} {n:,}" for table, n in counts.items()))
+    else:
+        if not args.query:
+            parser.error('sql needs a query')
+        with contextlib.closing(connect(args.db)) as con:
+            start = time.perf_counter()
+            result = pd.read_sql_query(args.query, con)
+            seconds = time.perf_counter() - start
+        print(result.to_string(index=False, max_rows=40))
+        print(f"\n{len(result):,} rows in {seconds * 1000:.1f} ms")
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Memory-mapped county x year x metric cube.
+
+The pipeline writes every county's yearly POPESTIMATE, UNDER5_TOT,
+WOMEN_15_49, BIRTHS and RBIRTH for 2010-2024 as one dense float64 array per
+metric (counties x years, NaN = missing), each a plain .npy file, plus a small
+index.json with the FIPS, years, metrics and each county's locale_type:
+
+    data/cube/index.json
+    data/cube/POPESTIMATE.npy
+    data/cube/UNDER5_TOT.npy
+    ...
+
+DataCube opens the arrays with mmap_mode='r', so loading is instant, only the
+pages a slice touches are read, and several processes reading the same cube
+share those pages through the OS cache.
+
+Years 2010-2020 come from the 2020 vintages (co-est2020, cc-est2020-agesex),
+2021-2024 from the 2024 vintages, as in the pipeline's time series.
+POPESTIMATE, BIRTHS and RBIRTH are the co-est columns; UNDER5_TOT and
+WOMEN_15_49 are the agesex July estimates (vintages.year_map). append_cube
+adds a new release's years to a saved cube; the years already there are
+copied over unchanged.
+
+    cube = DataCube('data/cube')
+    cube.county('06037')                          # years x metrics
+    cube.year(2024)                               # counties x metrics
+    cube.locale('Large urban', 'UNDER5_TOT')      # counties x years
+    cube.select('BIRTHS', locale_type='Rural', years=[2011, 2024])
+
+Usage:
+    python data_cube.py [data/cube] [--county FIPS] [--locale TYPE] [--year YEAR] [--metric METRIC]
+"""
+
+import argparse
+import io
+import json
+import os
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from county_dimension import fips_str
+from county_series import agesex_matrix, component_matrix
+from exporter import atomic_write
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+CUBE_DIR = os.path.join(REPO_DIR, 'data', 'cube')
+INDEX_NAME = 'index.json'
+CUBE_VERSION = 1
+
+COMPONENT_METRICS = ['POPESTIMATE', 'BIRTHS', 'RBIRTH']
+AGESEX_METRICS = ['UNDER5_TOT', 'WOMEN_15_49']
+METRICS = ['POPESTIMATE', 'UNDER5_TOT', 'WOMEN_15_49', 'BIRTHS', 'RBIRTH']
+
+# fips: (counties,) integer FIPS; years: (years,); locale_type: (counties,) object;
+# values: metric -> (counties, years) float64
+Cube = namedtuple('Cube', ['fips', 'years', 'locale_type', 'values'])
+
+
+def build_cube(fips, periods, locale_type):
+    """
+    Cube over `fips` from `periods`: (components, agesex, years, year_map) per
+    vintage, each year in exactly one period. An agesex frame of None leaves
+    its period's agesex metrics missing.
+    """
+    years = sorted(year for *_, period_years, _ in periods for year in period_years)
+    values = {metric: np.full((len(fips), len(years)), np.nan) for metric in METRICS}
+    for components, agesex, period_years, year_map in periods:
+        cols = [years.index(year) for year in period_years]
+        for metric in COMPONENT_METRICS:
+            values[metric][:, cols] = component_matrix(components, fips, list(period_years), metric)
+        if agesex is not None:
+            for metric in AGESEX_METRICS:
+                values[metric][:, cols] = agesex_matrix(agesex, fips, list(period_years), year_map, metric)
+    return Cube(np.asarray(fips), np.array(years, dtype=np.int64), np.asarray(locale_type, dtype=object), values)
+
+
+def write_cube(cube, directory=CUBE_DIR):
+    """
+    One <METRIC>.npy per metric plus index.json, each replaced atomically
+    (readers holding the old memmaps keep their files); returns the paths.
+    """
+    os.makedirs(directory, exist_ok=True)
+    written = []
+    for metric in METRICS:
+        buffer = io.BytesIO()
+        np.save(buffer, np.ascontiguousarray(cube.values[metric], dtype=np.float64))
+        written.append(atomic_write(os.path.join(directory, f'{metric}.npy'), buffer.getvalue()))
+    locales = sorted({v for v in cube.locale_type if isinstance(v, str)})
+    codes = {locale: i for i, locale in enumerate(locales)}
+    index = {
+        'version': CUBE_VERSION,
+        'fips': fips_str(cube.fips),
+        'years': cube.years.tolist(),
+        'metrics': METRICS,
+        'locales': locales,
+        # index into `locales` per county, -1 = no locale_type
+        'locale_codes': [codes.get(v, -1) for v in cube.locale_type],
+    }
+    written.append(atomic_write(os.path.join(directory, INDEX_NAME), json.dumps(index, separators=(',', ':'))))
+    return written
+
+
+def read_cube(directory):
+    """A saved cube loaded fully into memory (not memory-mapped, so its files can be rewritten)."""
+    saved = DataCube(directory)
+    values = {metric: np.load(os.path.join(directory, f'{metric}.npy')) for metric in saved.metrics}
+    return Cube(saved.fips, saved.years, saved.locale_type, values)
+
+
+def concat_cubes(*parts):
+    """
+    Cubes over disjoint years as one cube over the union of their counties,
+    years in order. A county's locale_type is taken from the last part that
+    has it; a county missing from a part is NaN in that part's years.
+    """
+    fips = np.unique(np.concatenate([part.fips for part in parts]))
+    years = np.concatenate([part.years for part in parts])
+    if len(np.unique(years)) != len(years):
+        raise ValueError(f"cubes overlap in years: {sorted(years.tolist())}")
+    order = np.argsort(years, kind='stable')
+    locale_type = np.full(len(fips), None, dtype=object)
+    values = {}
+    for metric in METRICS:
+        blocks = []
+        for part in parts:
+            block = np.full((len(fips), len(part.years)), np.nan)
+            block[np.searchsorted(fips, part.fips)] = part.values[metric]
+            blocks.append(block)
+        values[metric] = np.hstack(blocks)[:, order]
+    for part in parts:
+        rows = np.searchsorted(fips, part.fips)
+        known = np.array([isinstance(v, str) for v in part.locale_type], dtype=bool)
+        locale_type[rows[known]] = part.locale_type[known]
+    return Cube(fips, years[order], locale_type, values)
+
+
+def append_cube(cube, directory=CUBE_DIR):
+    """Add the years of `cube` to the cube saved in `directory` (write it if there is none)."""
+    if os.path.exists(os.path.join(directory, INDEX_NAME)):
+        cube = concat_cubes(read_cube(directory), cube)
+    return write_cube(cube, directory)
+
+
+class DataCube:
+    """Read-only access to a saved cube; each metric is memory-mapped on first use."""
+
+    def __init__(self, directory=CUBE_DIR):
+        self.directory = directory
+        with open(os.path.join(directory, INDEX_NAME)) as f:
+            index = json.load(f)
+        if index.get('version') != CUBE_VERSION:
+            raise ValueError(f"{directory}: cube version {index.get('version')}, expected {CUBE_VERSION}")
+        self.fips = np.array([int(v) for v in index['fips']], dtype=np.int64)
+        self.years = np.array(index['years'], dtype=np.int64)
+        self.metrics = list(index['metrics'])
+        locales = np.array(index['locales'] + [None], dtype=object)
+        self.locale_type = locales[np.array(index['locale_codes'], dtype=np.int64)]
+        self._arrays = {}
+
+    def array(self, metric):
+        """The counties x years memmap of `metric`."""
+        if metric not in self.metrics:
+            raise KeyError(f"unknown metric {metric!r}; metrics: {', '.join(self.metrics)}")
+        if metric not in self._arrays:
+            self._arrays[metric] = np.load(os.path.join(self.directory, f'{metric}.npy'), mmap_mode='r')
+        return self._arrays[metric]
+
+    def rows(self, fips=None, locale_type=None):
+        """Row positions for counties (integer or 5-digit string FIPS) and/or a locale_type."""
+        rows = np.arange(len(self.fips))
+        if fips is not None:
+            codes = np.array([int(v) for v in np.atleast_1d(fips)], dtype=np.int64)
+            rows = np.searchsorted(self.fips, codes)
+            found = (rows < len(self.fips)) & (self.fips[np.minimum(rows, len(self.fips) - 1)] == codes)
+            if not found.all():
+                raise KeyError(f"FIPS not in cube: {', '.join(fips_str(codes[~found]))}")
+        if locale_type is not None:
+            rows = rows[self.locale_type[rows] == locale_type]
+        return rows
+
+    def columns(self, years=None):
+        if years is None:
+            return np.arange(len(self.years))
+        wanted = np.atleast_1d(np.asarray(years, dtype=np.int64))
+        cols = np.searchsorted(self.years, wanted)
+        if ((cols >= len(self.years)) | (self.years[np.minimum(cols, len(self.years) - 1)] != wanted)).any():
+            raise KeyError(f"years outside the cube ({self.years[0]}-{self.years[-1]}): {wanted.tolist()}")
+        return cols
+
+    def select(self, metric, fips=None, locale_type=None, years=None):
+        """counties x years array of `metric`, reading only the selected rows."""
+        return self.array(metric)[self.rows(fips, locale_type)][:, self.columns(years)]
+
+    def county(self, fips):
+        """One county: years x metrics."""
+        row = self.rows([fips])[0]
+        return pd.DataFrame({metric: self.array(metric)[row] for metric in self.metrics},
+                            index=pd.Index(self.years, name='year'))
+
+    def year(self, year, metrics=None):
+        """One year: counties (integer FIPS) x metrics, with locale_type."""
+        col = self.columns([year])[0]
+        frame = pd.DataFrame({metric: self.array(metric)[:, col] for metric in metrics or self.metrics},
+                             index=pd.Index(self.fips, name='FIPS'))
+        frame.insert(0, 'locale_type', self.locale_type)
+        return frame
+
+    def locale(self, locale_type, metric, years=None):
+        """Counties of one locale_type: integer FIPS x years for `metric`."""
+        rows = self.rows(locale_type=locale_type)
+        cols = self.columns(years)
+        return pd.DataFrame(self.array(metric)[rows][:, cols], index=pd.Index(self.fips[rows], name='FIPS'),
+                            columns=self.years[cols])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('directory', nargs='?', default=CUBE_DIR)
+    parser.add_argument('--county', help='5-digit FIPS: every metric for every year')
+    parser.add_argument('--locale', help='locale_type: --metric for its counties')
+    parser.add_argument('--year', type=int, help='every metric for every county in one year')
+    parser.add_argument('--metric', default='UNDER5_TOT')
+    args = parser.parse_args()
+
+    cube = DataCube(args.directory)
+    print(f"{args.directory}: {len(cube.fips):,} counties x {len(cube.years)} years "
+          f"({cube.years[0]}-{cube.years[-1]}) x {len(cube.metrics)} metrics")
+    if args.county:
+        print(cube.county(args.county).to_string())
+    if args.locale:
+        frame = cube.locale(args.locale, args.metric)
+        print(f"\n{args.locale}: {args.metric} summed over {len(frame)} counties")
+        print(frame.sum(min_count=1).to_string())
+    if args.year:
+        print(cube.year(args.year).describe().T.to_string())
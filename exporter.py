@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Columnar export of the site data files.
+
+The final frames are serialized straight from their column arrays: every
+column is converted to Python values once (`.tolist()`, NaN -> None where a
+field is nullable) and the rows are zipped together from those lists, instead
+of walking the frame with iterrows and checking each field with pd.notna. The
+same helpers produce every target format:
+
+  - records(frame)             JSON records (list of dicts)
+  - grouped(frame, by, order)  {group: [records]} for the grouped JS constants
+  - keyed(keys, frame)         {key: {field: value}}, the compact county embed
+  - write_json / write_js / write_csv
+
+Fields are given as {output name: (column, kind)} with kind one of 'str',
+'int', 'float' or 'optional' (a float that is null where missing); a missing
+'optional' column is all null, and a missing 'str' value is null.
+
+Every file is written to a temporary sibling and moved into place with
+os.replace, so the site and query_service.py never read a half-written file
+and an interrupted build leaves the previous file intact.
+
+Usage (row-wise vs columnar export time for the large urban and all counties):
+    python exporter.py [--source-dir DIR]
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+
+def atomic_write(path, data):
+    """Write `data` (str or bytes) to a temporary sibling, then replace `path` with it."""
+    tmp = f'{path}.tmp{os.getpid()}'
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(data.encode('utf-8') if isinstance(data, str) else data)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return path
+
+
+def write_json(path, obj, indent=None):
+    return atomic_write(path, json.dumps(obj, indent=indent))
+
+
+def write_js(path, const_name, obj):
+    return atomic_write(path, f'const {const_name} = {json.dumps(obj)};')
+
+
+def write_csv(path, frame):
+    return atomic_write(path, frame.to_csv(index=False))
+
+
+def nullable(values):
+    """Python floats of `values` with None for NaN."""
+    values = np.asarray(values, dtype=float)
+    out = values.astype(object)
+    out[np.isnan(values)] = None
+    return out.tolist()
+
+
+def column_values(frame, column, kind=None):
+    """
+    One column as a list of Python values. Without a `kind` floats are
+    nullable and anything else is taken as it is.
+    """
+    if column not in frame.columns:
+        if kind == 'optional':
+            return [None] * len(frame)
+        raise KeyError(column)
+    series = frame[column]
+    if kind is None and pd.api.types.is_float_dtype(series.dtype):
+        kind = 'optional'
+    if kind == 'int':
+        return series.to_numpy(dtype=np.int64).tolist()
+    if kind == 'float':
+        return series.to_numpy(dtype=float).tolist()
+    if kind == 'optional':
+        return nullable(pd.to_numeric(series, errors='coerce'))
+    if kind == 'str':
+        return series.astype(object).where(series.notna(), None).tolist()
+    return series.tolist()
+
+
+def _columns(frame, fields):
+    if fields is None:
+        fields = {column: (column, None) for column in frame.columns}
+    return list(fields), [column_values(frame, column, kind) for column, kind in fields.values()]
+
+
+def records(frame, fields=None):
+    """[{field: value}] per row (all columns as they are by default)."""
+    names, columns = _columns(frame, fields)
+    return [dict(zip(names, row)) for row in zip(*columns)]
+
+
+def keyed(keys, frame, fields=None):
+    """{key: {field: value}} with one key per row."""
+    names, columns = _columns(frame, fields)
+    return {key: dict(zip(names, row)) for key, row in zip(keys, zip(*columns))}
+
+
+def grouped(frame, by, order, fields=None, sort='year'):
+    """
+    {group: records} for each value of `by` in `order` (in that order, empty
+    if the frame has no rows for it), rows sorted by `sort` within a group.
+    """
+    if sort is not None:
+        frame = frame.sort_values(sort, kind='stable')
+    out = {group: [] for group in order}
+    for group, record in zip(frame[by].tolist(), records(frame, fields)):
+        if group in out:
+            out[group].append(record)
+    return out
+
+
+def _compare(source_dir):
+    """(counties, row-wise seconds, columnar seconds) of the county embed and grouped series."""
+    import time
+
+    import pipeline
+
+    src = pipeline.source_paths(source_dir)
+    counties = pipeline.load_county_types(src['county_types'])
+    df_10 = pipeline.add_locale_type(pipeline.load_components(src['components_10']), counties)
+    df_24 = pipeline.add_locale_type(pipeline.load_components(src['components_24']), counties)
+    agesex = pipeline.add_locale_type(pipeline.load_agesex(src['agesex_24']), counties)
+    snapshot = pipeline.snapshot_years(df_10, df_24, agesex)
+    ts = pd.DataFrame(pipeline.birth_rate_ts(df_10, df_24))
+    fields = pipeline.embed_fields(snapshot)
+
+    def rowwise(lu):
+        embed = {}
+        for fips, (_, row) in zip(lu['FIPS'], lu.iterrows()):
+            embed[fips] = {key: (row[col] if kind == 'str' else int(row[col]) if kind == 'int'
+                                 else float(row[col]) if kind == 'float'
+                                 else float(row[col]) if pd.notna(row.get(col)) else None)
+                           for key, (col, kind) in fields.items()}
+        by_type = {}
+        for locale in pipeline.LOCALE_ORDER:
+            locale_data = ts[ts['locale_type'] == locale].sort_values('year')
+            by_type[locale] = [{'year': int(row['year']), 'rate': row['birth_rate']}
+                               for _, row in locale_data.iterrows()]
+        return embed, by_type
+
+    def columnar(lu):
+        return (keyed(lu['FIPS'].tolist(), lu, fields),
+                grouped(ts, 'locale_type', pipeline.LOCALE_ORDER,
+                        {'year': ('year', 'int'), 'rate': ('birth_rate', 'float')}))
+
+    results = []
+    for lu in (pipeline.large_urban_detail(agesex, df_10, df_24, snapshot),
+               pipeline.county_detail(agesex, df_10, df_24, snapshot)):
+        timings = []
+        for build in (rowwise, columnar):
+            start = time.perf_counter()
+            built = build(lu)
+            timings.append(time.perf_counter() - start)
+        assert json.dumps(built) == json.dumps(rowwise(lu))
+        results.append((len(lu), *timings))
+    return results
+
+
+if __name__ == '__main__':
+    import pipeline
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--source-dir', default=pipeline.SOURCE_DIR)
+    args = parser.parse_args()
+
+    for n, rowwise_seconds, columnar_seconds in _compare(args.source_dir):
+        print(f"  {n:>5,} counties: iterrows {rowwise_seconds * 1000:8.1f} ms, "
+              f"columnar {columnar_seconds * 1000:6.1f} ms")
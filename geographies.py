@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Under-5, birth-rate and fertility metrics for any number of county groupings.
+
+pipeline.birth_rate_ts, fertility_rate_ts and under5_by_type aggregate by the
+EIG locale_type only. Here any grouping of counties is aggregated the same
+way: locale_type, state, metro area (CBSA, from the Census delineation
+crosswalk) or user-defined groups from a county -> group CSV. Each county
+belongs to at most one group per grouping.
+
+Every rate is a ratio of county sums, so the county x year table
+(data_cube.build_cube) is reduced once to the partial sums they all need
+(RBIRTH x POPESTIMATE, POPESTIMATE, BIRTHS, WOMEN_15_49, the April-base and
+latest UNDER5_TOT, and how many counties report each), and the groups of all
+groupings are summed together in one np.add.reduceat over those columns.
+Adding a grouping costs one more set of rows in that reduction, not another
+pipeline run.
+
+The outputs extend the locale_type files: a grouping's records carry its name
+as the group key where those have locale_type, and otherwise the same fields,
+so the locale_type grouping reproduces birth_rate_ts.json (without the
+intervals), fertility_rate_ts.json (up to record order) and
+under5_by_type.json:
+
+    geographies/birth_rate_ts_state.json      [{"state": "Alabama", "year": 2011, "birth_rate": 12.04}, ...]
+    geographies/fertility_rate_ts_cbsa.json   [{"cbsa": ..., "year", "fertility_rate", "births", "women_15_49"}]
+    geographies/under5_state.json             [{"state": ..., "under5_{base}", "under5_{latest}", "change", "pct_change"}]
+
+A crosswalk is either the Census CBSA delineation file saved as CSV (title
+rows above the header and notes below the table are skipped; the group is
+'CBSA Title' unless another column is named) or any CSV with a 5-digit FIPS
+column ('FIPS', 'fips' or 'county_fips') and a group column (default: the
+first other column).
+
+Usage:
+    python geographies.py [--source-dir DIR] [--crosswalk cbsa=/path/to/list1.csv[:COLUMN]]
+                          [--crosswalk NAME=/path/to/groups.csv] [--out-dir DIR]
+"""
+
+import argparse
+import os
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from county_dimension import fips_code
+from exporter import write_json
+
+GEOGRAPHY_DIR = 'geographies'
+DELINEATION_COLUMNS = ('FIPS State Code', 'FIPS County Code')
+DELINEATION_GROUP = 'CBSA Title'
+FIPS_COLUMNS = ('FIPS', 'fips', 'county_fips')
+
+# labels: group of each county in the table (None = in no group); order: the
+# groups in output order (None = sorted), counties outside it are left out
+Grouping = namedtuple('Grouping', ['name', 'labels', 'order'], defaults=[None])
+
+
+def county_labels(fips, column, *frames):
+    """`column` of each integer FIPS in `fips`, from the first frame that has the county."""
+    labels = pd.concat([df[['FIPS', column]].astype({column: object}) for df in frames if df is not None])
+    return labels.drop_duplicates('FIPS').set_index('FIPS')[column].reindex(fips).to_numpy(dtype=object)
+
+
+def _header_row(path):
+    with open(path, encoding='latin-1') as f:
+        for i, line in enumerate(f):
+            if any(col in line for col in DELINEATION_COLUMNS + FIPS_COLUMNS):
+                return i
+            if i > 20:
+                break
+    raise ValueError(f"{path}: no FIPS column in the first rows")
+
+
+def read_crosswalk(path, column=None, optional=False):
+    """
+    Series of group labels indexed by integer FIPS from a crosswalk CSV (see
+    the module docstring); None if `optional` and the file does not exist.
+    """
+    try:
+        df = pd.read_csv(path, dtype=str, encoding='latin-1', skiprows=_header_row(path))
+    except FileNotFoundError:
+        if optional:
+            return None
+        raise
+    if all(col in df.columns for col in DELINEATION_COLUMNS):
+        df = df.dropna(subset=list(DELINEATION_COLUMNS))
+        fips = fips_code(df[DELINEATION_COLUMNS[0]], df[DELINEATION_COLUMNS[1]])
+        column = column or DELINEATION_GROUP
+    else:
+        fips_col = next(col for col in FIPS_COLUMNS if col in df.columns)
+        df = df.dropna(subset=[fips_col])
+        fips = pd.to_numeric(df[fips_col]).to_numpy(dtype=np.int64)
+        column = column or next(col for col in df.columns if col != fips_col)
+    labels = pd.Series(df[column].str.strip().to_numpy(dtype=object), index=pd.Index(fips, name='FIPS'))
+    return labels[~labels.index.duplicated()].dropna()
+
+
+def group_codes(grouping):
+    """(code of each county's group, -1 = none; the groups in output order)."""
+    labels = pd.Series(grouping.labels, dtype=object)
+    if grouping.order is None:
+        order = sorted(labels.dropna().unique().tolist())
+    else:
+        order = list(grouping.order)
+    return pd.Index(order, dtype=object).get_indexer(labels), order
+
+
+def grouped_sums(partials, groupings):
+    """
+    Sum every partial (counties x k array) over the groups of every grouping
+    in one pass. Returns {grouping name: (groups, {partial: groups x k})};
+    a group without counties sums to 0.
+    """
+    names = list(partials)
+    widths = [partials[name].shape[1] for name in names]
+    values = np.hstack([partials[name] for name in names])
+
+    rows, ids, spans, offset = [], [], {}, 0
+    for grouping in groupings:
+        codes, order = group_codes(grouping)
+        members = np.flatnonzero(codes >= 0)
+        rows.append(members)
+        ids.append(codes[members] + offset)
+        spans[grouping.name] = (offset, order)
+        offset += len(order)
+    rows, ids = np.concatenate(rows), np.concatenate(ids)
+    by_group = np.argsort(ids, kind='stable')
+    rows, ids = rows[by_group], ids[by_group]
+
+    sums = np.zeros((offset, values.shape[1]))
+    if len(ids):
+        starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+        sums[ids[starts]] = np.add.reduceat(values[rows], starts, axis=0)
+
+    edges = np.cumsum([0] + widths)
+    out = {}
+    for name, (start, order) in spans.items():
+        block = sums[start:start + len(order)]
+        out[name] = (order, {partial: block[:, edges[i]:edges[i + 1]] for i, partial in enumerate(names)})
+    return out
+
+
+def county_partials(cube, under5):
+    """
+    The per-county sums of every published rate: counties x years from the
+    cube, and counties x 2 (April base, latest July) for the under-5 change.
+    """
+    pop, rate = cube.values['POPESTIMATE'], cube.values['RBIRTH']
+    births, women = cube.values['BIRTHS'], cube.values['WOMEN_15_49']
+    return {
+        # Like long_format.birth_rates: a county without RBIRTH still counts in the population
+        'weighted': np.nan_to_num(rate * pop),
+        'population': np.nan_to_num(pop),
+        'population_n': np.isfinite(pop).astype(float),
+        'births': np.nan_to_num(births),
+        'births_n': np.isfinite(births).astype(float),
+        'women': np.nan_to_num(women),
+        'women_n': np.isfinite(women).astype(float),
+        'under5': np.nan_to_num(under5),
+    }
+
+
+def birth_rate_records(name, order, sums, years, rated):
+    """Population-weighted RBIRTH per group and year, as birth_rate_ts records keyed by `name`."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rates = sums['weighted'] / sums['population']
+    present = (sums['population_n'] > 0) & rated[None, :]
+    return [{name: group, 'year': int(year), 'birth_rate': round(float(rates[i, j]), 2)}
+            for i, group in enumerate(order) for j, year in enumerate(years) if present[i, j]]
+
+
+def fertility_rate_records(name, order, sums, years):
+    """Births per 1,000 women 15-49 per group and year, as fertility_rate_ts records keyed by `name`."""
+    births, women = sums['births'], sums['women']
+    present = (sums['births_n'] > 0) & (sums['women_n'] > 0) & (women > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rates = births / women * 1000
+    return [{name: group, 'year': int(year), 'fertility_rate': round(float(rates[i, j]), 2),
+             'births': int(births[i, j]), 'women_15_49': int(women[i, j])}
+            for i, group in enumerate(order) for j, year in enumerate(years) if present[i, j]]
+
+
+def under5_records(name, order, sums, snapshot):
+    """Under-5 change per group from the April base to the latest July, as under5_by_type records."""
+    records = []
+    for group, (base, latest) in zip(order, sums['under5']):
+        change = latest - base
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pct_change = round(float(np.float64(change) / base * 100), 1)
+        records.append({
+            name: group,
+            f"under5_{snapshot['base']}": int(base),
+            f"under5_{snapshot['latest']}": int(latest),
+            'change': int(change),
+            'pct_change': pct_change
+        })
+    return records
+
+
+def aggregate(cube, groupings, under5, snapshot):
+    """
+    {grouping name: {'birth_rate_ts', 'fertility_rate_ts', 'under5': records}}
+    for a cube, the groupings of its counties and their counties x 2 under-5
+    counts at the snapshot's April base and latest July estimate.
+    """
+    years = cube.years.tolist()
+    # Years without any RBIRTH (the 2010 estimates) are populations, not rates
+    rated = np.isfinite(cube.values['RBIRTH']).any(axis=0)
+    out = {}
+    for name, (order, sums) in grouped_sums(county_partials(cube, under5), groupings).items():
+        out[name] = {
+            'birth_rate_ts': birth_rate_records(name, order, sums, years, rated),
+            'fertility_rate_ts': fertility_rate_records(name, order, sums, years),
+            'under5': under5_records(name, order, sums, snapshot),
+        }
+    return out
+
+
+def write_geographies(out_dir, metrics):
+    """One JSON file per grouping and metric under out_dir/geographies; returns the paths."""
+    directory = os.path.join(out_dir, GEOGRAPHY_DIR)
+    os.makedirs(directory, exist_ok=True)
+    return [write_json(os.path.join(directory, f'{kind}_{name}.json'), records)
+            for name, outputs in metrics.items() for kind, records in outputs.items()]
+
+
+def parse_crosswalk(text):
+    """NAME=PATH[:COLUMN] -> (name, path, column or None)."""
+    name, _, spec = text.partition('=')
+    if not name or not spec:
+        raise argparse.ArgumentTypeError(f"expected NAME=PATH[:COLUMN], got {text!r}")
+    path, sep, column = spec.rpartition(':')
+    if not sep or os.path.exists(spec):
+        return name, spec, None
+    return name, path, column
+
+
+if __name__ == '__main__':
+    import pipeline
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--source-dir', default=pipeline.SOURCE_DIR)
+    parser.add_argument('--crosswalk', type=parse_crosswalk, action='append', default=[],
+                        help='NAME=PATH[:COLUMN] county -> group CSV (repeatable)')
+    parser.add_argument('--out-dir', help='write the JSON files here')
+    args = parser.parse_args()
+
+    src = pipeline.source_paths(args.source_dir)
+    counties = pipeline.load_county_types(src['county_types'])
+    df_10 = pipeline.add_locale_type(pipeline.load_components(src['components_10']), counties)
+    df_24 = pipeline.add_locale_type(pipeline.load_components(src['components_24']), counties)
+    agesex_10 = pipeline.add_locale_type(pipeline.load_agesex(src['agesex_10'], optional=True), counties)
+    agesex_24 = pipeline.add_locale_type(pipeline.load_agesex(src['agesex_24']), counties)
+    snapshot = pipeline.snapshot_years(df_10, df_24, agesex_24)
+    crosswalks = [read_crosswalk(path, column) for _, path, column in args.crosswalk]
+    metrics = pipeline.geography_metrics(df_10, df_24, agesex_10, agesex_24, snapshot, *crosswalks,
+                                         names=[name for name, *_ in args.crosswalk])
+    for name, outputs in metrics.items():
+        latest = max(row['year'] for row in outputs['fertility_rate_ts'])
+        print(f"\n{name}: {len(outputs['under5'])} groups; fertility rate {latest}:")
+        rows = pd.DataFrame([row for row in outputs['fertility_rate_ts'] if row['year'] == latest])
+        print(rows.sort_values('fertility_rate').to_string(index=False, max_rows=12))
+    if args.out_dir:
+        print(f"\nExported {len(write_geographies(args.out_dir, metrics))} files to {args.out_dir}")
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Per-stage instrumentation for pipeline runs.
+
+Each stage records wall time, CPU time, the growth of the process's peak RSS,
+the tracemalloc peak while it ran (when --trace-memory is on) and rows in/out,
+and the run is written as JSON next to summary_stats.json (run_report.json).
+One stage can also be run under cProfile; its stats are dumped next to the
+report. Stages a run reuses from the build cache (or skips because nothing
+needs them) keep the time of the last run that built them, carried over from
+the previous report, so the slowest stage can still be found after a fully
+cached rerun.
+
+Stages run on a thread pool, so RSS and tracemalloc figures are process-wide:
+with --workers 1 they belong to the stage alone, with more workers they
+include whatever ran concurrently. CPU time is the stage's own thread; work a
+stage hands to a process pool shows up as child CPU time.
+
+Usage (print a saved report, slowest stages first):
+    python instrumentation.py data/run_report.json
+"""
+
+import cProfile
+import json
+import os
+import platform
+import resource
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+
+REPORT_NAME = 'run_report.json'
+REPORT_VERSION = 1
+
+
+def count_rows(obj):
+    """Rows in a stage input/output: frame length, list/dict length, None -> 0."""
+    if obj is None:
+        return 0
+    if isinstance(obj, (pd.DataFrame, pd.Series, list, tuple, dict)):
+        return len(obj)
+    return 1
+
+
+def _maxrss_mb(who=resource.RUSAGE_SELF):
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+class RunReport:
+    """Collects stage records for one run and writes them as JSON."""
+
+    def __init__(self, trace_memory=False, profile_stage=None, profile_dir=None, meta=None, previous=None):
+        self.trace_memory = trace_memory
+        self.profile_stage = profile_stage
+        self.profile_dir = profile_dir
+        self.meta = dict(meta or {})
+        self.previous = previous or {}
+        self.stages = {}
+        self.started_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        if trace_memory:
+            tracemalloc.start()
+
+    def call(self, name, func, *args):
+        """Run `func(*args)` as stage `name` and record it; returns (result, seconds)."""
+        rss_before = _maxrss_mb()
+        child_cpu_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+        traced_before = tracemalloc.get_traced_memory()[0] if self.trace_memory else 0
+        cpu_start = time.thread_time()
+        start = time.perf_counter()
+        if name == self.profile_stage:
+            profiler = cProfile.Profile()
+            result = profiler.runcall(func, *args)
+            profile_path = self._dump_profile(name, profiler)
+        else:
+            result = func(*args)
+            profile_path = None
+        seconds = time.perf_counter() - start
+        cpu = time.thread_time() - cpu_start
+        child_cpu_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+        record = {
+            'status': 'run',
+            'seconds': round(seconds, 4),
+            'cpu_seconds': round(cpu, 4),
+            'child_cpu_seconds': round((child_cpu_after.ru_utime + child_cpu_after.ru_stime)
+                                       - (child_cpu_before.ru_utime + child_cpu_before.ru_stime), 4),
+            'rss_growth_mb': round(_maxrss_mb() - rss_before, 1),
+            'rows_in': [count_rows(arg) for arg in args],
+            'rows_out': count_rows(result),
+        }
+        if self.trace_memory:
+            # tracemalloc's peak is global; reset_peak would race with other
+            # stages, so this is the peak over the run so far above our start
+            record['traced_peak_mb'] = round((tracemalloc.get_traced_memory()[1] - traced_before) / 1e6, 1)
+        if profile_path:
+            record['profile'] = profile_path
+        with self._lock:
+            self.stages[name] = record
+        return result, seconds
+
+    def cached(self, name, result):
+        """Record a stage whose stored result was reused."""
+        self._not_run(name, {'status': 'cached', 'rows_out': count_rows(result)})
+
+    def skipped(self, name):
+        """Record a stage that was not needed this run."""
+        self._not_run(name, {'status': 'skipped'})
+
+    def _not_run(self, name, record):
+        last_run = self._last_run(name)
+        if last_run:
+            record['last_run'] = last_run
+        with self._lock:
+            self.stages[name] = record
+
+    def _last_run(self, name):
+        """started_at and seconds of the last run that built `name`, per the previous report."""
+        rec = self.previous.get('stages', {}).get(name, {})
+        if rec.get('status') == 'run':
+            return {'started_at': self.previous['started_at'], 'seconds': rec['seconds']}
+        return rec.get('last_run')
+
+    def _dump_profile(self, name, profiler):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        path = os.path.join(self.profile_dir, f'profile_{name}.prof')
+        profiler.dump_stats(path)
+        return path
+
+    def as_dict(self):
+        return {
+            'version': REPORT_VERSION,
+            'started_at': self.started_at,
+            'seconds': round(time.perf_counter() - self._start, 4),
+            'peak_rss_mb': round(_maxrss_mb(), 1),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            **self.meta,
+            'stages': self.stages,
+        }
+
+    def write(self, out_dir):
+        if self.trace_memory:
+            tracemalloc.stop()
+        os.makedirs(out_dir, exist_ok=True)
+        path = os.path.join(out_dir, REPORT_NAME)
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2)
+        return path
+
+
+def source_files_meta(paths):
+    """Name, size and mtime of each source file, to tell data vintages apart across reports."""
+    meta = {}
+    for key, path in paths.items():
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            meta[key] = {'file': os.path.basename(path), 'missing': True}
+            continue
+        meta[key] = {'file': os.path.basename(path), 'bytes': st.st_size,
+                     'modified': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(st.st_mtime))}
+    return meta
+
+
+def read_report(report_path):
+    """A saved report as a dict, or None if there is none (or it is unreadable)."""
+    try:
+        with open(report_path) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def slowest_stage(report):
+    """
+    Name of the stage that took longest in a report (dict), counting cached or
+    skipped stages at the time of the run that last built them, or None.
+    """
+    timed = {}
+    for name, rec in (report or {}).get('stages', {}).items():
+        if rec.get('status') == 'run':
+            timed[name] = rec['seconds']
+        elif rec.get('last_run'):
+            timed[name] = rec['last_run']['seconds']
+    return max(timed, key=timed.get) if timed else None
+
+
+def print_report(report):
+    print(f"Run {report['started_at']}: {report['seconds']:.2f}s, peak RSS {report['peak_rss_mb']:.0f} MB")
+    print(f"\n{'stage':<22}{'seconds':>9}{'cpu':>9}{'RSS +MB':>9}{'rows in':>26}{'rows out':>10}")
+    stages = sorted(report['stages'].items(), key=lambda item: -item[1].get('seconds', 0))
+    for name, rec in stages:
+        if rec['status'] != 'run':
+            rows_out = f"{rec['rows_out']:,}" if 'rows_out' in rec else '-'
+            print(f"{name:<22}{rec['status']:>9}{'':>35}{rows_out:>10}")
+            continue
+        rows_in = ' + '.join(f'{n:,}' for n in rec['rows_in']) or '-'
+        print(f"{name:<22}{rec['seconds']:>9.3f}{rec['cpu_seconds']:>9.3f}{rec['rss_growth_mb']:>9.1f}"
+              f"{rows_in:>26}{rec['rows_out']:>10,}")
+
+
+if __name__ == '__main__':
+    import sys
+
+    for src in sys.argv[1:] or [os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', REPORT_NAME)]:
+        with open(src) as f:
+            print_report(json.load(f))
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Long-format engine for the per-locale, per-year metrics.
+
+The co-est files are wide (POPESTIMATE{year}, RBIRTH{year}, BIRTHS{year} for
+every year) and the agesex files are long by YEAR code. Both are reshaped once
+into a (FIPS, year) table, and every weighted rate and sum for every locale and
+year then comes out of a single groupby instead of a mask-subset-groupby per
+locale/year cell.
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+COMPONENT_METRICS = ('POPESTIMATE', 'BIRTHS', 'RBIRTH')
+WIDE_COLUMN = re.compile(r'^([A-Z]+?)(\d{4})$')
+
+
+def wide_years(df, metric):
+    """Years for which `df` has a {metric}{year} column."""
+    years = []
+    for col in df.columns:
+        m = WIDE_COLUMN.match(col)
+        if m and m.group(1) == metric:
+            years.append(int(m.group(2)))
+    return sorted(years)
+
+
+def components_long(df, keys=('FIPS', 'locale_type'), metrics=COMPONENT_METRICS, years=None):
+    """
+    Reshape a co-est alldata frame to one row per (county, year) with one
+    column per metric. Years missing a metric (e.g. RBIRTH for the partial
+    base year) are NaN. `years` restricts the output to those years.
+    """
+    keys = list(keys)
+    available = sorted(set().union(*(wide_years(df, m) for m in metrics)))
+    if years is not None:
+        available = [y for y in available if y in set(years)]
+    n = len(df)
+    long = pd.DataFrame({key: np.repeat(df[key].to_numpy(), len(available)) for key in keys})
+    long['year'] = np.tile(np.array(available, dtype=np.int64), n)
+    for metric in metrics:
+        block = np.full((n, len(available)), np.nan)
+        for j, year in enumerate(available):
+            col = f'{metric}{year}'
+            if col in df.columns:
+                block[:, j] = df[col].to_numpy(dtype=float)
+        long[metric] = block.ravel()
+    return long
+
+
+def agesex_long(df, year_map, keys=('FIPS', 'locale_type'), values=('POPESTIMATE', 'UNDER5_TOT', 'WOMEN_15_49')):
+    """
+    The agesex frame is already long by YEAR code; keep the needed columns and
+    add the calendar year from `year_map` (calendar year -> YEAR code). Codes
+    with no calendar year (the April base) get year NaN but keep their YEAR.
+    """
+    code_to_year = {code: year for year, code in year_map.items()}
+    cols = list(keys) + ['YEAR'] + [v for v in values if v in df.columns]
+    long = df[cols].copy()
+    long['year'] = long['YEAR'].map(code_to_year)
+    return long
+
+
+def birth_rates(long, by=('locale_type',)):
+    """Population-weighted RBIRTH for every group and year in one pass."""
+    by = list(by)
+    # Years without an RBIRTH column at all are not rates, just populations
+    rated = long[long.groupby('year')['RBIRTH'].transform('count') > 0]
+    sums = (rated.assign(_weighted=rated['RBIRTH'] * rated['POPESTIMATE'])
+            .groupby(by + ['year'])[['_weighted', 'POPESTIMATE']].sum())
+    sums['birth_rate'] = sums['_weighted'] / sums['POPESTIMATE']
+    return sums[['birth_rate']].reset_index()
+
+
+def fertility_rates(births_long, women_long, by=('locale_type',)):
+    """Births per 1,000 women 15-49 for every group and year in one pass."""
+    by = list(by)
+    births = births_long.dropna(subset=['BIRTHS']).groupby(by + ['year'])['BIRTHS'].sum()
+    women_long = women_long.dropna(subset=['year']).astype({'year': np.int64})
+    women = women_long.groupby(by + ['year'])['WOMEN_15_49'].sum()
+    table = pd.concat({'births': births, 'women_15_49': women}, axis=1, join='inner')
+    table = table[table['women_15_49'] > 0]
+    table['fertility_rate'] = table['births'] / table['women_15_49'] * 1000
+    return table.reset_index()
+
+
+def year_code_sums(agesex, value, codes, by=('locale_type',)):
+    """Sum of `value` per group for each YEAR code in `codes` (groups x codes)."""
+    subset = agesex[agesex['YEAR'].isin(codes)]
+    return subset.groupby(list(by) + ['YEAR'])[value].sum().unstack('YEAR').reindex(columns=list(codes))
+
+
+def in_order(table, order, col='locale_type', sort=('year',)):
+    """Rows of `table` for the values in `order`, in that order, then by `sort`."""
+    table = table[table[col].isin(order)].copy()
+    table['_rank'] = table[col].map({v: i for i, v in enumerate(order)})
+    return table.sort_values(['_rank'] + list(sort)).drop(columns='_rank')
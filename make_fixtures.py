@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Write synthetic, Census-shaped input files for benchmarking the pipeline
+without the real downloads.
+
+Produces the same file names and column layouts the scripts read:
+  county_summary_final.csv   EIG typology (county_fips, locale_type, ...)
+  co-est2020-alldata.csv     components of change 2010-2020, state + county rows
+  co-est2024-alldata.csv     components of change 2020-2024, state + county rows
+  cc-est2020-agesex-all.csv  age/sex by county, YEAR codes 1-13
+  cc-est2024-agesex-all.csv  age/sex by county, YEAR codes 1-6
+
+--scale 1 gives 3,144 counties in 51 states; larger scales add more synthetic
+states with the same county mix (state codes past 56 do not exist in real
+data, which keeps every FIPS unique).
+
+Usage:
+    python make_fixtures.py OUT_DIR [--scale 1] [--seed 0]
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+BASE_STATES = 51
+BASE_COUNTIES = 3144
+
+LOCALE_TYPES = ['Large urban', 'Mid-sized urban', 'Small urban', 'Suburban', 'Small town', 'Rural']
+LOCALE_SHARES = [0.03, 0.05, 0.10, 0.20, 0.22, 0.40]
+
+# Five-year groups in the agesex files, then the broader bands
+AGE_GROUPS = ['UNDER5', 'AGE513', 'AGE1417', 'AGE1824', 'AGE16PLUS', 'AGE18PLUS', 'AGE1544', 'AGE2544',
+              'AGE4564', 'AGE65PLUS', 'AGE04', 'AGE59', 'AGE1014', 'AGE1519', 'AGE2024', 'AGE2529',
+              'AGE3034', 'AGE3539', 'AGE4044', 'AGE4549', 'AGE5054', 'AGE5559', 'AGE6064', 'AGE6569',
+              'AGE7074', 'AGE7579', 'AGE8084', 'AGE85PLUS']
+
+# Share of total population in each group (rough US age structure)
+AGE_SHARES = {
+    'UNDER5': 0.056, 'AGE513': 0.105, 'AGE1417': 0.052, 'AGE1824': 0.093, 'AGE16PLUS': 0.80,
+    'AGE18PLUS': 0.78, 'AGE1544': 0.39, 'AGE2544': 0.265, 'AGE4564': 0.25, 'AGE65PLUS': 0.17,
+    'AGE04': 0.056, 'AGE59': 0.060, 'AGE1014': 0.064, 'AGE1519': 0.066, 'AGE2024': 0.064,
+    'AGE2529': 0.068, 'AGE3034': 0.069, 'AGE3539': 0.067, 'AGE4044': 0.063, 'AGE4549': 0.060,
+    'AGE5054': 0.063, 'AGE5559': 0.064, 'AGE6064': 0.064, 'AGE6569': 0.055, 'AGE7074': 0.045,
+    'AGE7579': 0.030, 'AGE8084': 0.018, 'AGE85PLUS': 0.019,
+}
+
+COMPONENTS = ['NPOPCHG', 'BIRTHS', 'DEATHS', 'NATURALCHG', 'INTERNATIONALMIG', 'DOMESTICMIG', 'NETMIG', 'RESIDUAL']
+RATES = ['RBIRTH', 'RDEATH', 'RNATURALCHG', 'RINTERNATIONALMIG', 'RDOMESTICMIG', 'RNETMIG']
+
+
+def make_geography(scale, rng):
+    """One row per county: STATE, COUNTY, STNAME, CTYNAME, base population, locale_type."""
+    n_states = max(1, int(round(BASE_STATES * scale)))
+    per_state = rng.multinomial(int(round(BASE_COUNTIES * scale)) - n_states, np.ones(n_states) / n_states) + 1
+    per_state = np.minimum(per_state, 499)
+    states = np.repeat(np.arange(1, n_states + 1), per_state)
+    county = np.concatenate([np.arange(1, k + 1) * 2 - 1 for k in per_state])
+    # Log-normal county sizes: a few very large counties, a long rural tail
+    pop = np.clip(rng.lognormal(10.3, 1.45, len(states)), 60, 10_000_000).astype(np.int64)
+    locale = rng.choice(LOCALE_TYPES, size=len(states), p=LOCALE_SHARES)
+    locale[pop >= 1_000_000] = 'Large urban'
+    return pd.DataFrame({
+        'STATE': states,
+        'COUNTY': county,
+        'STNAME': [f'State {s}' for s in states],
+        'CTYNAME': [f'County {s}-{c}' for s, c in zip(states, county)],
+        'pop': pop,
+        'locale_type': locale,
+    })
+
+
+def typology(geo):
+    return pd.DataFrame({
+        'county_fips': geo['STATE'] * 1000 + geo['COUNTY'],
+        'county_name': geo['CTYNAME'],
+        'state_name': geo['STNAME'],
+        'locale_type': geo['locale_type'],
+    })
+
+
+def components(geo, years, rate_years, base_col, rng, extra=None):
+    """co-est alldata layout: geography, base, then one column per component and year."""
+    n = len(geo)
+    growth = rng.normal(0.004, 0.01, n)
+    data = {'SUMLEV': 50, 'REGION': (geo['STATE'] % 4) + 1, 'DIVISION': (geo['STATE'] % 9) + 1,
+            'STATE': geo['STATE'], 'COUNTY': geo['COUNTY'], 'STNAME': geo['STNAME'], 'CTYNAME': geo['CTYNAME']}
+    for col in extra or []:
+        data[col] = geo['pop']
+    data[base_col] = geo['pop']
+    pops = {y: (geo['pop'] * (1 + growth) ** (y - years[0])).round().astype(np.int64) for y in years}
+    birth_rate = np.clip(rng.normal(11.0, 2.0, n), 4, 25)
+    for y in years:
+        data[f'POPESTIMATE{y}'] = pops[y]
+    values = {
+        'BIRTHS': {y: (pops[y] * birth_rate * (1 - 0.01 * (y - years[0])) / 1000).round().astype(np.int64)
+                   for y in years},
+        'DEATHS': {y: (pops[y] * rng.normal(9.5, 1.5, n).clip(3) / 1000).round().astype(np.int64) for y in years},
+    }
+    for comp in COMPONENTS:
+        for y in years:
+            if comp in values:
+                data[f'{comp}{y}'] = values[comp][y]
+            elif comp == 'NATURALCHG':
+                data[f'{comp}{y}'] = values['BIRTHS'][y] - values['DEATHS'][y]
+            else:
+                data[f'{comp}{y}'] = (pops[y] * rng.normal(0, 0.004, n)).round().astype(np.int64)
+    for rate in RATES:
+        for y in rate_years:
+            source = {'RBIRTH': 'BIRTHS', 'RDEATH': 'DEATHS'}.get(rate, rate[1:])
+            data[f'{rate}{y}'] = (data[f'{source}{y}'] / pops[y] * 1000).round(6)
+    county_rows = pd.DataFrame(data)
+
+    numeric = [c for c in county_rows.columns if c not in ('SUMLEV', 'REGION', 'DIVISION', 'STATE', 'COUNTY',
+                                                            'STNAME', 'CTYNAME')]
+    state_rows = county_rows.groupby(['STATE', 'STNAME'], as_index=False)[numeric].sum()
+    for rate in RATES:
+        for y in rate_years:
+            source = {'RBIRTH': 'BIRTHS', 'RDEATH': 'DEATHS'}.get(rate, rate[1:])
+            state_rows[f'{rate}{y}'] = (state_rows[f'{source}{y}'] / state_rows[f'POPESTIMATE{y}'] * 1000).round(6)
+    state_rows['SUMLEV'] = 40
+    state_rows['REGION'] = (state_rows['STATE'] % 4) + 1
+    state_rows['DIVISION'] = (state_rows['STATE'] % 9) + 1
+    state_rows['COUNTY'] = 0
+    state_rows['CTYNAME'] = state_rows['STNAME']
+    out = pd.concat([state_rows[county_rows.columns], county_rows], ignore_index=True)
+    return out.sort_values(['STATE', 'COUNTY'], kind='stable')
+
+
+def agesex(geo, year_codes, rng, footnotes=0):
+    """cc-est agesex layout: one row per county and YEAR code, TOT/MALE/FEM per age group."""
+    frames = []
+    n = len(geo)
+    for i, code in enumerate(year_codes):
+        pop = (geo['pop'] * (1 + 0.003 * i) * rng.normal(1, 0.002, n)).round().astype(np.int64)
+        data = {'SUMLEV': 50, 'STATE': geo['STATE'], 'COUNTY': geo['COUNTY'], 'STNAME': geo['STNAME'],
+                'CTYNAME': geo['CTYNAME'], 'YEAR': code, 'POPESTIMATE': pop}
+        fem_share = rng.normal(0.505, 0.01, n)
+        data['POPEST_MALE'] = (pop * (1 - fem_share)).round().astype(np.int64)
+        data['POPEST_FEM'] = pop - data['POPEST_MALE']
+        for group in AGE_GROUPS:
+            # Under-5 shrinks a little each year, like the real series
+            drift = 1 - 0.012 * i if group in ('UNDER5', 'AGE04') else 1
+            total = (pop * AGE_SHARES[group] * drift * rng.normal(1, 0.05, n)).round().astype(np.int64)
+            fem = (total * fem_share).round().astype(np.int64)
+            data[f'{group}_TOT'] = total
+            data[f'{group}_MALE'] = total - fem
+            data[f'{group}_FEM'] = fem
+        for sex, offset in (('TOT', 0), ('MALE', -1.2), ('FEM', 1.2)):
+            data[f'MEDIAN_AGE_{sex}'] = (rng.normal(40, 4, n) + offset).round(1)
+        frames.append(pd.DataFrame(data))
+    out = pd.concat(frames, ignore_index=True).sort_values(['STATE', 'COUNTY', 'YEAR'], kind='stable')
+    if footnotes:
+        # The 2020 vintage carries a few non-numeric footnote values
+        out['AGE1519_FEM'] = out['AGE1519_FEM'].astype(object)
+        rows = rng.choice(len(out), size=min(footnotes, len(out)), replace=False)
+        out.iloc[rows, out.columns.get_loc('AGE1519_FEM')] = 'X'
+    return out
+
+
+def write_fixtures(out_dir, scale=1.0, seed=0):
+    """Write all five input files to `out_dir`; returns their paths."""
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    geo = make_geography(scale, rng)
+    files = {
+        'county_summary_final.csv': typology(geo),
+        'co-est2020-alldata.csv': components(geo, list(range(2010, 2021)), list(range(2011, 2021)),
+                                             'ESTIMATESBASE2010', rng, extra=['CENSUS2010POP']),
+        'co-est2024-alldata.csv': components(geo, list(range(2020, 2025)), list(range(2021, 2025)),
+                                             'ESTIMATESBASE2020', rng),
+        'cc-est2020-agesex-all.csv': agesex(geo, list(range(1, 14)), rng, footnotes=5),
+        'cc-est2024-agesex-all.csv': agesex(geo, list(range(1, 7)), rng),
+    }
+    paths = []
+    for name, df in files.items():
+        path = os.path.join(out_dir, name)
+        df.to_csv(path, index=False)
+        paths.append(path)
+    return paths
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('out_dir')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiple of the ~3,144 real counties')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    for p in write_fixtures(args.out_dir, args.scale, args.seed):
+        print(f"{p}: {os.path.getsize(p) / 1e6:.1f} MB")
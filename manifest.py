@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Per-stage build manifests for incremental pipeline runs.
+
+Each stage's manifest records what its result was built from: the content
+hashes of the files it reads (and of the county store, when CENSUS_STORE
+redirects those reads to it), the module-level parameters its code refers to
+(POPULATION_THRESHOLD, LOCALE_ORDER, year ranges, ...), a hash of its source
+code and of the local helpers it calls, and the fingerprints of the stages it
+depends on. A rerun whose fingerprint matches the stored one reuses the pickled
+result instead of running the stage again.
+"""
+
+import functools
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import threading
+import time
+import types
+
+import census_cache
+import census_schema
+
+MANIFEST_VERSION = 1
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+PARAM_TYPES = (str, int, float, bool, tuple, list, dict, range, frozenset, set)
+
+
+def _is_local(obj):
+    try:
+        path = inspect.getsourcefile(obj)
+    except TypeError:
+        return False
+    return path is not None and os.path.dirname(os.path.abspath(path)) == REPO_DIR
+
+
+def _referenced_names(code):
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= _referenced_names(const)
+    return names
+
+
+def code_fingerprint(func):
+    """
+    (code hash, params) for `func`: its source plus the source of every local
+    function and class it reaches through module globals (and through the
+    methods of those classes), and the repr of every simple module-level
+    constant they refer to.
+    """
+    h = hashlib.sha256()
+    params = {}
+    seen = set()
+
+    def walk(obj):
+        if id(obj) in seen:
+            return
+        seen.add(id(obj))
+        if not inspect.isclass(obj):
+            h.update(inspect.getsource(obj).encode())
+            follow(obj)
+            return
+        try:
+            h.update(inspect.getsource(obj).encode())
+        except OSError:
+            # namedtuple types have no class statement; their fields are what matters
+            h.update(repr((obj.__qualname__, getattr(obj, '_fields', None))).encode())
+        for member in vars(obj).values():
+            member = getattr(member, '__func__', member)
+            if inspect.isfunction(member):
+                follow(member)
+
+    def follow(fn):
+        """Walk the local code and record the constants `fn` refers to through its globals."""
+        for name in sorted(_referenced_names(fn.__code__)):
+            if name not in fn.__globals__:
+                continue
+            obj = fn.__globals__[name]
+            if (inspect.isfunction(obj) or inspect.isclass(obj)) and _is_local(obj):
+                walk(obj)
+            elif inspect.ismodule(obj) and _is_local(obj):
+                h.update(census_cache.content_hash(inspect.getsourcefile(obj)).encode())
+            elif isinstance(obj, PARAM_TYPES) and not name.startswith('__'):
+                params[name] = repr(obj)
+
+    walk(func.func if isinstance(func, functools.partial) else func)
+    return h.hexdigest(), params
+
+
+class BuildCache:
+    """Stage manifests and pickled results under one directory."""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._digests_path = os.path.join(cache_dir, 'file_digests.json')
+        try:
+            with open(self._digests_path) as f:
+                self._digests = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self._digests = {}
+
+    # -- files --------------------------------------------------------------
+
+    def file_digest(self, path):
+        """SHA-256 of `path`, recomputed only when its size or mtime moved."""
+        path = os.path.abspath(path)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return 'missing'
+        known = self._digests.get(path)
+        if known and known['size'] == st.st_size and known['mtime_ns'] == st.st_mtime_ns:
+            return known['sha256']
+        digest = census_cache.content_hash(path)
+        with self._lock:
+            self._digests[path] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha256': digest}
+            with open(self._digests_path, 'w') as f:
+                json.dump(self._digests, f, indent=1)
+        return digest
+
+    # -- manifests ----------------------------------------------------------
+
+    def describe(self, name, func, dep_fingerprints):
+        """Manifest (without outputs) for stage `name` given its deps' fingerprints."""
+        code, params = code_fingerprint(func)
+        inputs = {}
+        if isinstance(func, functools.partial):
+            for i, arg in enumerate(list(func.args) + sorted(func.keywords.items())):
+                key = arg[0] if isinstance(arg, tuple) else f'arg{i}'
+                value = arg[1] if isinstance(arg, tuple) else arg
+                if isinstance(value, str) and (os.path.isfile(value) or value.endswith('.csv')):
+                    inputs[key] = {'path': value, 'sha256': self.file_digest(value)}
+                else:
+                    params[key] = repr(value)
+        store = os.environ.get(census_schema.STORE_ENV)
+        if store and any(entry['path'].endswith('.csv') for entry in inputs.values()):
+            # The stage's Census CSVs are read from the store instead (census_schema.py)
+            inputs['census_store'] = {'path': store, 'sha256': self.file_digest(store)}
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'stage': name,
+            'code': code,
+            'params': params,
+            'inputs': inputs,
+            'deps': dep_fingerprints,
+        }
+        manifest['fingerprint'] = hashlib.sha256(json.dumps(manifest, sort_keys=True).encode()).hexdigest()
+        return manifest
+
+    def _paths(self, name):
+        return os.path.join(self.cache_dir, f'{name}.json'), os.path.join(self.cache_dir, f'{name}.pkl')
+
+    def stored(self, name):
+        manifest_path, _ = self._paths(name)
+        try:
+            with open(manifest_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def is_fresh(self, name, manifest):
+        """True if a result exists for exactly this manifest and its outputs are untouched."""
+        stored = self.stored(name)
+        if stored is None or stored.get('fingerprint') != manifest['fingerprint']:
+            return False
+        if not os.path.exists(self._paths(name)[1]):
+            return False
+        return all(self.file_digest(path) == digest for path, digest in stored.get('outputs', {}).items())
+
+    def load(self, name):
+        with open(self._paths(name)[1], 'rb') as f:
+            return pickle.load(f)
+
+    def save(self, name, manifest, result, seconds=None):
+        """Store `result` and its manifest; file paths returned by the stage are recorded as outputs."""
+        manifest_path, result_path = self._paths(name)
+        manifest = dict(manifest, built_at=time.strftime('%Y-%m-%dT%H:%M:%S'), seconds=seconds)
+        if isinstance(result, list) and result and all(isinstance(p, str) and os.path.isfile(p) for p in result):
+            manifest['outputs'] = {os.path.abspath(p): self.file_digest(p) for p in result}
+        with open(result_path + '.tmp', 'wb') as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(result_path + '.tmp', result_path)
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
@@ -0,0 +1,886 @@
+#!/usr/bin/env python3
+"""
+Single-pass build for the Cities for Families site data.
+
+Runs the work of process_birth_data.py and process_fertility_data.py as one
+DAG of stages: load each source file once, enrich with the EIG locale_type,
+compute the under-5 / birth-rate / fertility metrics, and export one
+consistent set of files. Stages whose inputs are ready run concurrently.
+
+Reruns are incremental: each stage's manifest (input hashes, parameters,
+code version) is kept in .build_cache/ and stages whose manifest has not
+changed reuse their stored result. Pass --full to rebuild everything.
+
+The years are not hard-coded: each vintage's years and agesex YEAR codes are
+read off the input headers and codes (vintages.py). The current vintage is the
+newest year with both a co-est{year}-alldata.csv and a cc-est{year}-agesex-all.csv
+in the source directory (--vintage picks another), so a new Census release
+only needs its two files dropped in next to the old ones. With --append the
+time series, the county fertility series and the cube keep the years already
+in the output directory and only the years missing there are computed and
+appended; finished history is never recomputed.
+
+The locale_type metrics are also written by state, by metro area (when
+cbsa_delineation.csv is in the source directory) and by any --groups
+crosswalk, under geographies/ (geographies.py).
+
+The county outputs also follow two cohorts through the full age structure of
+the agesex file (age_structure.py): the children under 5 at the April base
+and the adults 25-39, counted again four years older in the latest estimate.
+Their change is net migration, apart from the births that move the under-5
+count.
+
+Every county's map record is also written per state under counties/, with a
+small manifest the map paints from before it loads any state (county_shards.py).
+
+Every run writes run_report.json next to summary_stats.json with each stage's
+wall/CPU time, memory growth and rows in/out (see instrumentation.py).
+--profile STAGE runs one stage under cProfile (no name: the slowest stage of
+the previous run, or of the last run that built it when it was cached) and
+dumps the stats into the cache directory. A cached stage is not run, so it is
+only profiled with --full.
+
+Usage:
+    python pipeline.py [--source-dir DIR] [--vintage YEAR] [--out-dir DIR] [--workers N] [--processes N]
+                       [--full] [--append] [--groups NAME=PATH[:COLUMN]] [--stream] [--trace-memory]
+                       [--profile [STAGE]]
+"""
+
+import argparse
+import functools
+import json
+import os
+import re
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+
+import census_schema
+from age_structure import AGE_COLUMNS, build_age_structure, cohort_table
+from bootstrap import N_REPLICATES, add_intervals, percentile_intervals, ratio_replicates
+from county_dimension import CountyDimension, fips_code, fips_str
+from county_payload import write_payload
+from county_series import (SERIES_NAME, agesex_matrix, append_series, component_matrix, county_fertility_series,
+                           write_series)
+from county_shards import write_shards
+from data_cube import INDEX_NAME, append_cube, build_cube, write_cube
+from exporter import grouped, keyed, write_js, write_json
+from geographies import Grouping, aggregate, county_labels, parse_crosswalk, read_crosswalk, write_geographies
+from census_schema import WOMEN_15_49_COLS
+from instrumentation import REPORT_NAME, RunReport, read_report, slowest_stage, source_files_meta
+from long_format import (agesex_long, birth_rates, components_long, fertility_rates, in_order,
+                         year_code_sums)
+from manifest import BuildCache
+from streaming import stream_agesex
+from svg_paths import build_svg_paths
+from threshold_sweep import DEFAULT_THRESHOLDS, county_table_from_agesex, threshold_curve, write_curve
+from topology import COUNTIES_GEOJSON
+from vintages import assign_years, output_years, snapshot_years, year_map
+
+SOURCE_DIR = '/Users/connorobrien/Downloads'
+OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+BUILD_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.build_cache')
+
+SOURCE_FILES = {
+    'county_types': 'county_summary_final.csv',
+    'components_10': 'co-est2020-alldata.csv',
+    'components_24': 'co-est2024-alldata.csv',
+    'agesex_10': 'cc-est2020-agesex-all.csv',
+    'agesex_24': 'cc-est2024-agesex-all.csv',
+}
+
+# The current vintage's files (the _24 keys), named for its year; the 2010-2020
+# files stay fixed. DEFAULT_VINTAGE is used when the source directory has none.
+CURRENT_FILES = {
+    'components_24': 'co-est{year}-alldata.csv',
+    'agesex_24': 'cc-est{year}-agesex-all.csv',
+}
+PREVIOUS_VINTAGE = 2020
+DEFAULT_VINTAGE = 2024
+
+LOCALE_ORDER = ['Large urban', 'Mid-sized urban', 'Small urban', 'Suburban', 'Small town', 'Rural']
+
+# Optional county -> group crosswalks in the source directory (geographies.py):
+# grouping name -> (file, group column or None for the file's default)
+CROSSWALK_FILES = {
+    'cbsa': ('cbsa_delineation.csv', None),
+}
+
+# county_data_embed.js: key -> (column, exporter kind); column names are filled
+# in with the snapshot years (vintages.snapshot_years)
+EMBED_FIELDS = {
+    'n': ('CTYNAME', 'str'),
+    's': ('STNAME', 'str'),
+    'p0': ('POPESTIMATE_{base}', 'int'),
+    'u0': ('UNDER5_TOT_{base}', 'int'),
+    'u4': ('UNDER5_TOT_{latest}', 'int'),
+    'ac': ('under5_change', 'int'),
+    'pc': ('under5_pct_change', 'float'),
+    'w0': ('WOMEN_15_49_{base}', 'int'),
+    'w4': ('WOMEN_15_49_{latest}', 'int'),
+    'br11': ('RBIRTH{first}', 'optional'),
+    'br24': ('RBIRTH{latest}', 'optional'),
+    'brch': ('br_pct_change', 'optional'),
+    'fr21': ('fertility_{current}', 'optional'),
+    'fr24': ('fertility_{latest}', 'optional'),
+    'frch': ('fertility_pct_change', 'optional'),
+    'cpc': ('cohort_under5_pct_change', 'optional'),
+    'ypc': ('cohort_age25_39_pct_change', 'optional'),
+}
+
+# Per-state shard records: the embed fields plus the locale type (county_shards.SUMMARY_KEYS)
+SHARD_FIELDS = dict(EMBED_FIELDS, t=('locale_type', 'str'))
+
+# Outputs extended in place by --append (their years are read back with vintages.output_years)
+HISTORY_FILES = {
+    'birth_rate_ts': 'birth_rate_ts.json',
+    'fertility_rate_ts': 'fertility_rate_ts.json',
+    'county_fertility_ts': SERIES_NAME,
+    'county_cube': os.path.join('cube', INDEX_NAME),
+}
+
+
+# ---------------------------------------------------------------------------
+# Sources
+# ---------------------------------------------------------------------------
+
+def current_vintage(source_dir):
+    """
+    Newest vintage after PREVIOUS_VINTAGE with both of its CURRENT_FILES in
+    `source_dir`; DEFAULT_VINTAGE if there is none.
+    """
+    try:
+        names = set(os.listdir(source_dir))
+    except FileNotFoundError:
+        return DEFAULT_VINTAGE
+    found = None
+    for name in CURRENT_FILES.values():
+        pattern = re.compile(re.escape(name).replace(re.escape('{year}'), r'(\d{4})') + '$')
+        years = {int(m.group(1)) for m in map(pattern.match, names) if m and int(m.group(1)) > PREVIOUS_VINTAGE}
+        found = years if found is None else found & years
+    return max(found) if found else DEFAULT_VINTAGE
+
+
+def source_paths(source_dir, vintage=None):
+    """SOURCE_FILES key -> path in `source_dir`, the current files for `vintage` (default: current_vintage)."""
+    vintage = vintage or current_vintage(source_dir)
+    names = dict(SOURCE_FILES, **{key: name.format(year=vintage) for key, name in CURRENT_FILES.items()})
+    return {key: os.path.join(source_dir, name) for key, name in names.items()}
+
+
+# ---------------------------------------------------------------------------
+# Load
+# ---------------------------------------------------------------------------
+
+def load_county_types(path):
+    """EIG typology as the county dimension (integer FIPS -> locale_type, names)."""
+    return CountyDimension.from_typology(census_schema.read_typology(path))
+
+
+def add_fips(df):
+    """Integer FIPS (STATE * 1000 + COUNTY); strings are only made for the outputs."""
+    df['FIPS'] = fips_code(df['STATE'], df['COUNTY'])
+    return df
+
+
+def load_components(path):
+    """co-est alldata file, county rows only."""
+    df = add_fips(census_schema.read_components(path))
+    return df[df['COUNTY'] != 0].copy()
+
+
+def load_agesex(path, optional=False, stream=False, extra=()):
+    """
+    cc-est agesex file with a WOMEN_15_49 column (and the `extra` columns,
+    e.g. age_structure.AGE_COLUMNS); None if optional and missing. With
+    `stream` the file is folded chunk by chunk into per-county totals
+    (streaming.stream_agesex) instead of being loaded whole.
+    """
+    try:
+        df = stream_agesex(path, extra=extra) if stream else census_schema.read_agesex(path, extra=extra)
+    except FileNotFoundError:
+        if optional:
+            return None
+        raise
+    df = add_fips(df)
+    if not stream:
+        df['WOMEN_15_49'] = df[WOMEN_15_49_COLS].sum(axis=1)
+    return df
+
+
+# ---------------------------------------------------------------------------
+# Enrich
+# ---------------------------------------------------------------------------
+
+def add_locale_type(df, counties):
+    """locale_type looked up from the county dimension by integer FIPS (no merge)."""
+    if df is None:
+        return None
+    return counties.attach(df)
+
+
+def _prepare(kind, path, types_path, optional=False, stream=False, extra=()):
+    """Load and enrich one source file (runs in a worker process)."""
+    if kind == 'components':
+        df = load_components(path)
+    else:
+        df = load_agesex(path, optional=optional, stream=stream, extra=extra)
+    return add_locale_type(df, load_county_types(types_path))
+
+
+def load_prepared_parallel(types_path, components_10_path, components_24_path, agesex_10_path, agesex_24_path,
+                           processes=None, stream=False):
+    """
+    Load and enrich the four Census files at once, one worker process each.
+    Every worker reads the (small) typology itself so none waits on another;
+    the frames come back already pruned and compactly typed (census_schema),
+    which keeps pickling them to the parent cheap. Returns name -> frame.
+    """
+    jobs = {
+        'components_10': ('components', components_10_path, False, ()),
+        'components_24': ('components', components_24_path, False, ()),
+        'agesex_10': ('agesex', agesex_10_path, True, ()),
+        'agesex_24': ('agesex', agesex_24_path, False, AGE_COLUMNS),
+    }
+    with ProcessPoolExecutor(max_workers=processes or min(len(jobs), os.cpu_count() or 1)) as pool:
+        futures = {name: pool.submit(_prepare, kind, path, types_path, optional, stream, extra)
+                   for name, (kind, path, optional, extra) in jobs.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+
+def pick(key, prepared):
+    return prepared[key]
+
+
+# ---------------------------------------------------------------------------
+# Metrics
+# ---------------------------------------------------------------------------
+
+def vintage_periods(df_10, df_24, pop_data_10=None, pop_data=None, skip=(), leading_estimates=False):
+    """
+    (components, agesex, years, year_map) per vintage, oldest first: the years
+    each co-est frame is used for (vintages.assign_years) minus those in
+    `skip`, and its agesex calendar year -> YEAR code map ({} without agesex).
+    """
+    periods = []
+    assigned = assign_years(df_10, df_24, leading_estimates=leading_estimates)
+    for df, agesex, years in zip((df_10, df_24), (pop_data_10, pop_data), assigned):
+        periods.append((df, agesex, [year for year in years if year not in skip],
+                        {} if agesex is None else year_map(agesex, df)))
+    return periods
+
+
+def read_history(path):
+    """Records of a time series written by an earlier run ([] if there is none)."""
+    if path is None or not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def birth_rate_ts(df_10, df_24, history=None):
+    """
+    Population-weighted RBIRTH by locale_type and year. With `history` (the
+    birth_rate_ts.json of an earlier run) its records are kept as they are and
+    only the years missing from it are computed and appended.
+    """
+    records = read_history(history)
+    periods = vintage_periods(df_10, df_24, skip={row['year'] for row in records})
+    if not any(years for _, _, years, _ in periods):
+        return records
+    long = pd.concat([components_long(df, years=years) for df, _, years, _ in periods])
+    rates = in_order(birth_rates(long), LOCALE_ORDER)
+    return records + [{'locale_type': locale, 'year': int(year), 'birth_rate': round(rate, 2)}
+                      for locale, year, rate in zip(rates['locale_type'], rates['year'], rates['birth_rate'])]
+
+
+def birth_rate_change(ts):
+    """Each locale's birth rate in the first and last year of the series, and the change."""
+    ts_df = pd.DataFrame(ts)
+    first, last = int(ts_df['year'].min()), int(ts_df['year'].max())
+    change_data = []
+    for locale in LOCALE_ORDER:
+        locale_df = ts_df[ts_df['locale_type'] == locale]
+        rate_first = locale_df[locale_df['year'] == first]['birth_rate'].values[0]
+        rate_last = locale_df[locale_df['year'] == last]['birth_rate'].values[0]
+        change = rate_last - rate_first
+        pct_change = (change / rate_first) * 100
+        change_data.append({
+            'locale_type': locale,
+            f'rate_{first}': rate_first,
+            f'rate_{last}': rate_last,
+            'change': round(change, 2),
+            'pct_change': round(pct_change, 1)
+        })
+    return change_data
+
+
+def fertility_rate_ts(df_10, df_24, pop_data_10, pop_data, history=None):
+    """Births per 1,000 women 15-49 by locale_type and year (`history` as in birth_rate_ts)."""
+    records = read_history(history)
+    periods = vintage_periods(df_10, df_24, pop_data_10, pop_data, skip={row['year'] for row in records})
+    # Same record order as before: the newest vintage's block first
+    periods = [period for period in reversed(periods) if period[1] is not None and period[2]]
+    if not periods:
+        return records
+    births_long = pd.concat([components_long(df, years=years) for df, _, years, _ in periods])
+    women_long = pd.concat([agesex_long(agesex, {year: year_map[year] for year in years if year in year_map})
+                            for _, agesex, years, year_map in periods])
+    rates = fertility_rates(births_long, women_long)
+
+    for _, _, years, _ in periods:
+        block = in_order(rates[rates['year'].isin(years)], LOCALE_ORDER)
+        for row in block.itertuples(index=False):
+            records.append({
+                'locale_type': row.locale_type,
+                'year': int(row.year),
+                'fertility_rate': round(row.fertility_rate, 2),
+                'births': int(row.births),
+                'women_15_49': int(row.women_15_49)
+            })
+    return records
+
+
+def county_fertility_ts(df_10, df_24, pop_data_10, pop_data, history=None):
+    """
+    Births per 1,000 women 15-49 for every county and year (county_series.py);
+    with `history` only for the years missing from that county series.
+    """
+    return county_fertility_series(vintage_periods(df_10, df_24, pop_data_10, pop_data,
+                                                   skip=output_years(history)))
+
+
+def county_locales(fips, *frames):
+    """locale_type of each integer FIPS in `fips`, from the frames' own locale_type column."""
+    return county_labels(fips, 'locale_type', *frames)
+
+
+def birth_rate_samples(df_10, df_24, replicates=N_REPLICATES, skip=()):
+    """
+    Bootstrap replicates of birth_rate_ts (bootstrap.py): RBIRTH * POPESTIMATE
+    over POPESTIMATE for counties resampled within each locale_type, for every
+    year not in `skip`. Returns ({locale: replicates x years}, years).
+    """
+    periods = [(df, years) for df, _, years, _ in vintage_periods(df_10, df_24, skip=skip)]
+    fips = np.unique(np.concatenate([df['FIPS'].to_numpy() for df, _ in periods]))
+    pop = np.hstack([component_matrix(df, fips, years, 'POPESTIMATE') for df, years in periods])
+    rate = np.hstack([component_matrix(df, fips, years, 'RBIRTH') for df, years in periods])
+    # Like birth_rates: a county without RBIRTH still counts in the population
+    samples = ratio_replicates(np.nan_to_num(rate * pop), np.nan_to_num(pop), county_locales(fips, df_10, df_24),
+                               LOCALE_ORDER, replicates)
+    return samples, [year for _, years in periods for year in years]
+
+
+def fertility_rate_samples(series, df_10, df_24, replicates=N_REPLICATES):
+    """Bootstrap replicates of fertility_rate_ts from the county series (county_fertility_ts)."""
+    samples = ratio_replicates(np.nan_to_num(series.births) * 1000, np.nan_to_num(series.women),
+                               county_locales(series.fips, df_10, df_24), LOCALE_ORDER, replicates)
+    return samples, series.years.tolist()
+
+
+def birth_rate_ci(df_10, df_24, history=None):
+    """95% bootstrap percentile interval for every birth_rate_ts value (not already in `history`)."""
+    return percentile_intervals(*birth_rate_samples(df_10, df_24, skip=output_years(history)))
+
+
+def fertility_rate_ci(series, df_10, df_24):
+    """95% bootstrap percentile interval for every fertility_rate_ts value."""
+    return percentile_intervals(*fertility_rate_samples(series, df_10, df_24))
+
+
+def county_cube(df_10, df_24, pop_data_10, pop_data, history=None):
+    """
+    Every county x year x cube metric (data_cube.py), including the 2010
+    estimates; with `history` (a cube index) only the years missing from it.
+    """
+    fips = np.unique(np.concatenate([df_10['FIPS'].to_numpy(), df_24['FIPS'].to_numpy()]))
+    periods = vintage_periods(df_10, df_24, pop_data_10, pop_data, skip=output_years(history),
+                              leading_estimates=True)
+    return build_cube(fips, periods, county_locales(fips, df_10, df_24))
+
+
+def geography_metrics(df_10, df_24, pop_data_10, pop_data, snapshot, *crosswalks, names=()):
+    """
+    Birth-rate, fertility and under-5 records by locale_type, by state and by
+    each crosswalk (geographies.py; `names` are the crosswalks' grouping
+    names, a crosswalk of None is skipped), all from one county x year table.
+    """
+    frames = [df for df in (df_10, df_24, pop_data_10, pop_data) if df is not None]
+    fips = np.unique(np.concatenate([df['FIPS'].to_numpy() for df in frames]))
+    cube = build_cube(fips, vintage_periods(df_10, df_24, pop_data_10, pop_data), county_locales(fips, *frames))
+    groupings = [Grouping('locale_type', cube.locale_type, LOCALE_ORDER),
+                 Grouping('state', county_labels(fips, 'STNAME', *frames))]
+    groupings += [Grouping(name, crosswalk.reindex(fips).to_numpy(dtype=object))
+                  for name, crosswalk in zip(names, crosswalks) if crosswalk is not None]
+    under5 = agesex_matrix(pop_data, fips, [snapshot['base'], snapshot['latest']],
+                           {snapshot['base']: snapshot['base_code'], snapshot['latest']: snapshot['latest_code']},
+                           'UNDER5_TOT')
+    return aggregate(cube, groupings, under5, snapshot)
+
+
+def county_cohorts(ages, snapshot):
+    """
+    Per-county cohorts of age_structure.COHORTS from the April base to the
+    latest July estimate (cohort_{name}_{base}, _{latest}, _pct_change).
+    """
+    return cohort_table(ages, snapshot['base_code'], snapshot['latest_code'], snapshot['base'], snapshot['latest'])
+
+
+def under5_by_type(pop_data, snapshot):
+    """Under-5 population by locale_type at the April base and the latest July estimate."""
+    base, latest = snapshot['base'], snapshot['latest']
+    codes = [snapshot['base_code'], snapshot['latest_code']]
+    sums = year_code_sums(pop_data, 'UNDER5_TOT', codes).reindex(LOCALE_ORDER).fillna(0)
+    under5_data = []
+    for locale, u5_base, u5_latest in zip(sums.index, sums[codes[0]], sums[codes[1]]):
+        change = u5_latest - u5_base
+        under5_data.append({
+            'locale_type': locale,
+            f'under5_{base}': int(u5_base),
+            f'under5_{latest}': int(u5_latest),
+            'change': int(change),
+            'pct_change': round((change / u5_base) * 100, 1)
+        })
+    return under5_data
+
+
+def nationwide_under5(pop_data, snapshot):
+    base, latest = snapshot['base'], snapshot['latest']
+    totals = pop_data.groupby('YEAR')['UNDER5_TOT'].sum()
+    nationwide = {
+        f'under5_{base}': int(totals.get(snapshot['base_code'], 0)),
+        f'under5_{latest}': int(totals.get(snapshot['latest_code'], 0))
+    }
+    nationwide['under5_change'] = nationwide[f'under5_{latest}'] - nationwide[f'under5_{base}']
+    nationwide['under5_pct_change'] = round((nationwide['under5_change'] / nationwide[f'under5_{base}']) * 100, 1)
+    return nationwide
+
+
+def county_detail(pop_data, df_10, df_24, snapshot, cohorts=None, locale_type=None):
+    """
+    Per-county under-5, birth-rate and fertility figures (all counties, or one
+    locale type) for the years of `snapshot` (vintages.snapshot_years), with
+    the columns of `cohorts` (county_cohorts) when given.
+    """
+    if locale_type is not None:
+        pop_data = pop_data[pop_data['locale_type'] == locale_type]
+        df_10 = df_10[df_10['locale_type'] == locale_type]
+        df_24 = df_24[df_24['locale_type'] == locale_type]
+    first, base, current, latest = (snapshot[key] for key in ('first', 'base', 'current', 'latest'))
+    # Joined on the integer FIPS index; rows keep the baseline's order
+    cols = ['POPESTIMATE', 'UNDER5_TOT', 'WOMEN_15_49']
+    lu_baseline = (pop_data[pop_data['YEAR'] == snapshot['base_code']].set_index('FIPS')
+                   [['STNAME', 'CTYNAME', 'locale_type'] + cols])
+    lu_latest = pop_data[pop_data['YEAR'] == snapshot['latest_code']].set_index('FIPS')[cols]
+    lu = lu_baseline.join(lu_latest, how='inner', lsuffix=f'_{base}', rsuffix=f'_{latest}')
+    u5_base, u5_latest = lu[f'UNDER5_TOT_{base}'], lu[f'UNDER5_TOT_{latest}']
+    lu['under5_change'] = u5_latest - u5_base
+    lu['under5_pct_change'] = ((u5_latest - u5_base) / u5_base * 100).round(1)
+
+    lu_births = df_24.set_index('FIPS')[[f'RBIRTH{current}', f'RBIRTH{latest}', f'BIRTHS{current}',
+                                         f'BIRTHS{latest}']]
+    lu_births = lu_births.join(df_10.set_index('FIPS')[f'RBIRTH{first}'])
+    br_first, br_latest = lu_births[f'RBIRTH{first}'], lu_births[f'RBIRTH{latest}']
+    lu_births['br_change'] = br_latest - br_first
+    lu_births['br_pct_change'] = ((br_latest - br_first) / br_first * 100).round(1)
+    lu = lu.join(lu_births)
+    if cohorts is not None:
+        lu = lu.join(cohorts)
+    lu = lu.reset_index()
+
+    lu[f'fertility_{latest}'] = (lu[f'BIRTHS{latest}'] / lu[f'WOMEN_15_49_{latest}'] * 1000).round(1)
+    lu[f'fertility_{current}'] = (lu[f'BIRTHS{current}'] / lu[f'WOMEN_15_49_{base}'] * 1000).round(1)
+    fr_current, fr_latest = lu[f'fertility_{current}'], lu[f'fertility_{latest}']
+    lu['fertility_change'] = (fr_latest - fr_current).round(1)
+    lu['fertility_pct_change'] = ((fr_latest - fr_current) / fr_current * 100).round(1)
+    return lu
+
+
+def large_urban_detail(pop_data, df_10, df_24, snapshot, cohorts=None):
+    """Per-county under-5, birth-rate and fertility figures for large urban counties."""
+    return county_detail(pop_data, df_10, df_24, snapshot, cohorts, locale_type='Large urban')
+
+
+# ---------------------------------------------------------------------------
+# Export
+# ---------------------------------------------------------------------------
+
+def ts_by_type(ts, rate_key):
+    """{locale_type: [{'year', 'rate'}, ...]} in LOCALE_ORDER, years ascending."""
+    return grouped(pd.DataFrame(ts), 'locale_type', LOCALE_ORDER,
+                   {'year': ('year', 'int'), 'rate': (rate_key, 'float')})
+
+
+def embed_fields(snapshot, fields=EMBED_FIELDS):
+    """EMBED_FIELDS (or `fields`) with the column names filled in with the snapshot years."""
+    return {key: (col.format(**snapshot), kind) for key, (col, kind) in fields.items()}
+
+
+def county_data_embed(lu, snapshot):
+    """FIPS -> county record for the map; the short keys stay the same whatever the snapshot years."""
+    return keyed(fips_str(lu['FIPS']), lu, embed_fields(snapshot))
+
+
+def summary_stats(lu, nationwide, change_data, fertility_by_type, under5_data, snapshot):
+    base, current, latest = snapshot['base'], snapshot['current'], snapshot['latest']
+    return {
+        'large_urban': {
+            'count': len(lu),
+            f'under5_{base}': int(lu[f'UNDER5_TOT_{base}'].sum()),
+            f'under5_{latest}': int(lu[f'UNDER5_TOT_{latest}'].sum()),
+            'under5_change': int(lu['under5_change'].sum()),
+            'under5_pct_change': round((lu['under5_change'].sum() / lu[f'UNDER5_TOT_{base}'].sum()) * 100, 1),
+            f'avg_fertility_{current}': round(lu[f'fertility_{current}'].mean(), 1),
+            f'avg_fertility_{latest}': round(lu[f'fertility_{latest}'].mean(), 1)
+        },
+        'nationwide': nationwide,
+        'birth_rate_change': change_data,
+        'fertility_by_type': fertility_by_type,
+        'under5_by_type': under5_data
+    }
+
+
+def export(out_dir, birth_ts, change_data, fertility_ts, under5_data, lu, nationwide, birth_ci, fertility_ci,
+           snapshot):
+    """
+    Write every site data file from one consistent set of results. The JSON
+    time series carry each rate's bootstrap interval (<rate>_low/_high).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    birth_by_type = ts_by_type(birth_ts, 'birth_rate')
+    fertility_by_type = ts_by_type(fertility_ts, 'fertility_rate')
+    embed = county_data_embed(lu, snapshot)
+
+    written = [
+        write_json(os.path.join(out_dir, 'birth_rate_ts.json'), add_intervals(birth_ts, birth_ci, 'birth_rate')),
+        write_js(os.path.join(out_dir, 'birth_rate_ts.js'), 'birthRateTS', birth_by_type),
+        write_json(os.path.join(out_dir, 'birth_rate_change.json'), change_data),
+        write_json(os.path.join(out_dir, 'fertility_rate_ts.json'),
+                   add_intervals(fertility_ts, fertility_ci, 'fertility_rate')),
+        write_js(os.path.join(out_dir, 'fertility_rate_ts.js'), 'fertilityRateTS', fertility_by_type),
+        write_json(os.path.join(out_dir, 'under5_by_type.json'), under5_data),
+        write_js(os.path.join(out_dir, 'county_data_embed.js'), 'countyData', embed),
+        write_json(os.path.join(out_dir, 'summary_stats.json'),
+                   summary_stats(lu, nationwide, change_data, fertility_by_type, under5_data, snapshot),
+                   indent=2),
+    ]
+    print(f"Exported {len(birth_ts)} birth-rate records, {len(fertility_ts)} fertility records, "
+          f"{len(embed)} counties to {out_dir}")
+    return written
+
+
+def population_threshold_curve(pop_data, snapshot):
+    """Under-5 aggregates over counties above each of threshold_sweep.DEFAULT_THRESHOLDS."""
+    table = county_table_from_agesex(pop_data, snapshot['base_code'], snapshot['latest_code'])
+    return threshold_curve(table, DEFAULT_THRESHOLDS)
+
+
+def export_threshold_curve(out_dir, curve):
+    return [write_curve(os.path.join(out_dir, 'threshold_curve.json'), curve)]
+
+
+def export_county_fertility(out_dir, series, append=False):
+    """Write the county series; with `append` its years are added to the series already in `out_dir`."""
+    if append:
+        written = append_series(out_dir, series)
+        print(f"Appended {len(series.years)} years to {os.path.basename(written[0])}")
+        return written
+    written = write_series(out_dir, series)
+    print(f"Exported {os.path.basename(written[0])}: {len(series.fips)} counties x {len(series.years)} years")
+    return written
+
+
+def export_cube(out_dir, cube, append=False):
+    """Write the cube; with `append` its years are added to the cube already in `out_dir`."""
+    if append:
+        written = append_cube(cube, os.path.join(out_dir, 'cube'))
+        print(f"Appended {len(cube.years)} years to the cube")
+        return written
+    written = write_cube(cube, os.path.join(out_dir, 'cube'))
+    print(f"Exported cube: {len(cube.fips)} counties x {len(cube.years)} years x {len(cube.values)} metrics")
+    return written
+
+
+def export_geographies(out_dir, metrics):
+    written = write_geographies(out_dir, metrics)
+    print(f"Exported {len(written)} files for {len(metrics)} groupings ({', '.join(metrics)})")
+    return written
+
+
+def export_county_payload(out_dir, counties, snapshot):
+    """Columnar map payload for every county (county_payload.py)."""
+    written = write_payload(out_dir, counties, snapshot)
+    print(f"Exported {os.path.basename(written[0])}: {len(counties)} counties, "
+          f"{os.path.getsize(written[0]):,} bytes ({os.path.getsize(written[1]):,} gzipped)")
+    return written
+
+
+def export_county_shards(out_dir, counties, nationwide, snapshot):
+    """Per-state county records and their manifest (county_shards.py)."""
+    written = write_shards(out_dir, counties, embed_fields(snapshot, SHARD_FIELDS), national=nationwide,
+                           snapshot=snapshot)
+    print(f"Exported {len(counties)} counties in {len(written) - 1} state shards, "
+          f"manifest {os.path.getsize(written[-1]):,} bytes")
+    return written
+
+
+# ---------------------------------------------------------------------------
+# DAG runner
+# ---------------------------------------------------------------------------
+
+# func is called with the results of `deps`, in order; cache=False keeps the
+# result out of the build cache (the stage reruns whenever it is needed)
+Stage = namedtuple('Stage', ['func', 'deps', 'cache'], defaults=[True])
+
+
+def build_stages(source_dir=SOURCE_DIR, out_dir=OUTPUT_DIR, stream=False, processes=0, append=False, groups=(),
+                 vintage=None):
+    """
+    Stage name -> Stage. Load and enrich results are large frames that are
+    cheap to rebuild from the census_cache, so only later stages keep their
+    results in the build cache. With `processes` the load and enrich stages
+    are replaced by one stage that prepares all four files in a process pool.
+    With `append` the time series, county series and cube stages read the
+    years already in `out_dir` (HISTORY_FILES) and compute only the rest; the
+    history files are stage inputs, so their manifests follow them.
+    `groups` are extra (name, crosswalk path, column) county groupings on top
+    of locale_type, state and the CROSSWALK_FILES found in `source_dir`.
+    `vintage` is the year of the current Census files (source_paths).
+    """
+    src = source_paths(source_dir, vintage)
+    history = {name: os.path.join(out_dir, path) if append else None for name, path in HISTORY_FILES.items()}
+    crosswalks = [(name, os.path.join(source_dir, file), column) for name, (file, column) in CROSSWALK_FILES.items()]
+    crosswalks += [(name, path, column) for name, path, column in groups]
+    if processes:
+        prepare = {
+            'prepared': Stage(functools.partial(load_prepared_parallel, src['county_types'], src['components_10'],
+                                                src['components_24'], src['agesex_10'], src['agesex_24'],
+                                                processes=processes, stream=stream), [], False),
+        }
+        for name in ['components_10', 'components_24', 'agesex_10', 'agesex_24']:
+            prepare[name] = Stage(functools.partial(pick, name), ['prepared'], False)
+    else:
+        prepare = {
+            # load
+            'county_types': Stage(functools.partial(load_county_types, src['county_types']), [], False),
+            'raw_components_10': Stage(functools.partial(load_components, src['components_10']), [], False),
+            'raw_components_24': Stage(functools.partial(load_components, src['components_24']), [], False),
+            'raw_agesex_10': Stage(functools.partial(load_agesex, src['agesex_10'], optional=True, stream=stream),
+                                   [], False),
+            # with the age x sex columns of the age structure, so the file is read once
+            'raw_agesex_24': Stage(functools.partial(load_agesex, src['agesex_24'], stream=stream, extra=AGE_COLUMNS),
+                                   [], False),
+            # enrich
+            'components_10': Stage(add_locale_type, ['raw_components_10', 'county_types'], False),
+            'components_24': Stage(add_locale_type, ['raw_components_24', 'county_types'], False),
+            'agesex_10': Stage(add_locale_type, ['raw_agesex_10', 'county_types'], False),
+            'agesex_24': Stage(add_locale_type, ['raw_agesex_24', 'county_types'], False),
+        }
+    for name, path, column in crosswalks:
+        prepare[f'crosswalk_{name}'] = Stage(functools.partial(read_crosswalk, path, column, optional=True), [], False)
+    return dict(prepare, **{
+        # metrics
+        'snapshot': Stage(snapshot_years, ['components_10', 'components_24', 'agesex_24']),
+        'age_structure': Stage(build_age_structure, ['agesex_24']),
+        'cohorts': Stage(county_cohorts, ['age_structure', 'snapshot']),
+        'birth_rate_ts': Stage(functools.partial(birth_rate_ts, history=history['birth_rate_ts']),
+                               ['components_10', 'components_24']),
+        'birth_rate_change': Stage(birth_rate_change, ['birth_rate_ts']),
+        'fertility_rate_ts': Stage(functools.partial(fertility_rate_ts, history=history['fertility_rate_ts']),
+                                   ['components_10', 'components_24', 'agesex_10', 'agesex_24']),
+        'county_fertility_ts': Stage(functools.partial(county_fertility_ts, history=history['county_fertility_ts']),
+                                     ['components_10', 'components_24', 'agesex_10', 'agesex_24']),
+        'county_cube': Stage(functools.partial(county_cube, history=history['county_cube']),
+                             ['components_10', 'components_24', 'agesex_10', 'agesex_24']),
+        'birth_rate_ci': Stage(functools.partial(birth_rate_ci, history=history['birth_rate_ts']),
+                               ['components_10', 'components_24']),
+        'fertility_rate_ci': Stage(fertility_rate_ci, ['county_fertility_ts', 'components_10', 'components_24']),
+        'under5_by_type': Stage(under5_by_type, ['agesex_24', 'snapshot']),
+        'nationwide': Stage(nationwide_under5, ['agesex_24', 'snapshot']),
+        'large_urban': Stage(large_urban_detail, ['agesex_24', 'components_10', 'components_24', 'snapshot',
+                                                  'cohorts']),
+        'county_detail': Stage(county_detail, ['agesex_24', 'components_10', 'components_24', 'snapshot',
+                                               'cohorts']),
+        'threshold_curve': Stage(population_threshold_curve, ['agesex_24', 'snapshot']),
+        'geographies': Stage(functools.partial(geography_metrics, names=tuple(name for name, *_ in crosswalks)),
+                             ['components_10', 'components_24', 'agesex_10', 'agesex_24', 'snapshot']
+                             + [f'crosswalk_{name}' for name, *_ in crosswalks]),
+        # export
+        'export': Stage(functools.partial(export, out_dir),
+                        ['birth_rate_ts', 'birth_rate_change', 'fertility_rate_ts', 'under5_by_type',
+                         'large_urban', 'nationwide', 'birth_rate_ci', 'fertility_rate_ci', 'snapshot']),
+        'export_counties': Stage(functools.partial(export_county_payload, out_dir),
+                                 ['county_detail', 'snapshot']),
+        'export_shards': Stage(functools.partial(export_county_shards, out_dir),
+                               ['county_detail', 'nationwide', 'snapshot']),
+        'export_county_fertility': Stage(functools.partial(export_county_fertility, out_dir, append=append),
+                                         ['county_fertility_ts']),
+        'export_cube': Stage(functools.partial(export_cube, out_dir, append=append), ['county_cube']),
+        'export_threshold_curve': Stage(functools.partial(export_threshold_curve, out_dir), ['threshold_curve']),
+        'export_geographies': Stage(functools.partial(export_geographies, out_dir), ['geographies']),
+        # map geometry (independent of the Census files)
+        'svg_paths': Stage(functools.partial(build_svg_paths, COUNTIES_GEOJSON, out_dir), []),
+    })
+
+
+def plan_stages(stages, build_cache, targets=None):
+    """
+    Decide what an incremental run has to do. Returns (manifests, reuse, run):
+    `reuse` are stages whose stored result matches their manifest, `run` the
+    stages that must execute to produce the targets (default: every stage
+    nothing else depends on).
+    """
+    manifests = {}
+
+    def describe(name):
+        if name not in manifests:
+            stage = stages[name]
+            manifests[name] = build_cache.describe(
+                name, stage.func, [describe(dep)['fingerprint'] for dep in stage.deps])
+        return manifests[name]
+
+    for name in stages:
+        describe(name)
+
+    if targets is None:
+        upstream = {dep for stage in stages.values() for dep in stage.deps}
+        targets = [name for name in stages if name not in upstream]
+    reuse, run = set(), set()
+
+    def need(name):
+        if name in reuse or name in run:
+            return
+        if stages[name].cache and build_cache.is_fresh(name, manifests[name]):
+            reuse.add(name)
+            return
+        run.add(name)
+        for dep in stages[name].deps:
+            need(dep)
+
+    for name in targets:
+        need(name)
+    return manifests, reuse, run
+
+
+def run_stages(stages, workers=4, build_cache=None, targets=None, report=None):
+    """
+    Run `stages` (see build_stages) in dependency order, each as soon as all of
+    its inputs exist. Every result is computed once and shared by reference.
+
+    With a `build_cache` (manifest.BuildCache) stages whose manifest is
+    unchanged are not run: their stored result is loaded instead, and their
+    upstream stages are skipped entirely unless something else needs them.
+
+    With a `report` (instrumentation.RunReport) every stage run or reused is
+    recorded in it.
+    """
+    results = {}
+    manifests = {}
+    pending = dict(stages)
+    if build_cache is not None:
+        manifests, reuse, run = plan_stages(stages, build_cache, targets)
+        for name in reuse:
+            results[name] = build_cache.load(name)
+            if report is not None:
+                report.cached(name, results[name])
+            print(f"  cached: {name}")
+        pending = {name: stages[name] for name in run}
+        if report is not None:
+            for name in set(stages) - set(reuse) - set(run):
+                report.skipped(name)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        running = {}
+        while pending or running:
+            for name, stage in list(pending.items()):
+                if all(dep in results for dep in stage.deps):
+                    runner = functools.partial(report.call, name) if report is not None else _timed
+                    running[pool.submit(runner, stage.func, *[results[dep] for dep in stage.deps])] = name
+                    del pending[name]
+            if not running:
+                raise ValueError(f"Unresolvable stage dependencies: {sorted(pending)}")
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                results[name], seconds = future.result()
+                if build_cache is not None and stages[name].cache:
+                    build_cache.save(name, manifests[name], results[name], seconds=round(seconds, 3))
+                print(f"  done: {name} ({seconds:.2f}s)")
+    return results
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--source-dir', default=SOURCE_DIR, help='directory holding the Census/EIG CSV downloads')
+    parser.add_argument('--vintage', type=int,
+                        help='year of the current co-est/cc-est files (default: the newest in --source-dir)')
+    parser.add_argument('--out-dir', default=OUTPUT_DIR, help='where to write the site data files')
+    parser.add_argument('--workers', type=int, default=4, help='concurrent stages')
+    parser.add_argument('--cache-dir', default=BUILD_CACHE_DIR, help='stage manifests and cached results')
+    parser.add_argument('--full', action='store_true', help='ignore manifests and rerun every stage')
+    parser.add_argument('--append', action='store_true',
+                        help='keep the years already in --out-dir and compute only the new ones')
+    parser.add_argument('--groups', type=parse_crosswalk, action='append', default=[], metavar='NAME=PATH[:COLUMN]',
+                        help='also aggregate by the county groups of this crosswalk CSV (repeatable)')
+    parser.add_argument('--processes', type=int, default=0,
+                        help='load and enrich the Census files in a pool of this many processes')
+    parser.add_argument('--stream', action='store_true',
+                        help='aggregate the agesex files chunk by chunk (bounded memory)')
+    parser.add_argument('--no-report', action='store_true', help=f'do not write {REPORT_NAME}')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='record tracemalloc peaks per stage in the report (slower)')
+    parser.add_argument('--profile', nargs='?', const='', metavar='STAGE',
+                        help='run STAGE under cProfile (default: slowest stage of the previous run)')
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("CITIES FOR FAMILIES - PIPELINE")
+    print("=" * 80)
+    start = time.perf_counter()
+    build_cache = None if args.full else BuildCache(args.cache_dir)
+    src = source_paths(args.source_dir, args.vintage)
+    print(f"Current vintage: {os.path.basename(src['components_24'])}, {os.path.basename(src['agesex_24'])}")
+    stages = build_stages(args.source_dir, args.out_dir, stream=args.stream, processes=args.processes,
+                          append=args.append, groups=args.groups, vintage=args.vintage)
+
+    report = None
+    if not args.no_report:
+        previous = read_report(os.path.join(args.out_dir, REPORT_NAME))
+        profile_stage = args.profile
+        if profile_stage == '':
+            profile_stage = slowest_stage(previous)
+            if previous is None:
+                print(f"No previous {REPORT_NAME} to pick the slowest stage from; not profiling")
+            elif profile_stage is None:
+                print(f"Every stage in the previous {REPORT_NAME} was cached and none has an earlier timing; "
+                      f"not profiling (run with --full to time them)")
+            else:
+                print(f"Profiling {profile_stage}, the slowest stage of the last run that built it")
+        if profile_stage and profile_stage not in stages:
+            parser.error(f"unknown stage {profile_stage!r}; stages: {', '.join(stages)}")
+        report = RunReport(trace_memory=args.trace_memory, profile_stage=profile_stage, profile_dir=args.cache_dir,
+                           meta={'workers': args.workers, 'processes': args.processes, 'stream': args.stream,
+                                 'full': args.full, 'append': args.append, 'sources': source_files_meta(src)},
+                           previous=previous)
+
+    run_stages(stages, workers=args.workers, build_cache=build_cache, report=report)
+    if report is not None:
+        status = report.stages.get(report.profile_stage, {}).get('status')
+        if report.profile_stage and status != 'run':
+            print(f"\n{report.profile_stage} was {status} this run, so it was not profiled; "
+                  f"rerun with --full to profile it")
+        print(f"\nRun report: {report.write(args.out_dir)}")
+    print(f"\nDONE in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
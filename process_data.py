@@ -5,24 +5,31 @@ for major cities (counties with population >= 250,000).
 """
 
 import pandas as pd
-import json
+
+import census_schema
+from county_dimension import fips_code, fips_str
+import exporter
+import threshold_sweep
+from vintages import base_code, estimate_years, full_years, year_map
 
 # Load the data
-df = pd.read_csv('/Users/connorobrien/Downloads/cc-est2024-agesex-all.csv', encoding='latin-1')
+df = census_schema.read_agesex('/Users/connorobrien/Downloads/cc-est2024-agesex-all.csv')
 
-# YEAR key:
-# 1 = 4/1/2020 population estimates base
-# 6 = 7/1/2024 population estimate
+# The agesex YEAR codes are matched to calendar years through the column names
+# of the components file of the same vintage (vintages.py): the April base
+# estimate and the latest July estimate. Only its header is read.
+components = pd.DataFrame(columns=census_schema.read_header('/Users/connorobrien/Downloads/co-est2024-alldata.csv'))
+base, latest_year = estimate_years(components)[0], full_years(components)[-1]
 
-# Get baseline (April 2020) and latest (July 2024) data
-baseline = df[df['YEAR'] == 1].copy()
-latest = df[df['YEAR'] == 6].copy()
+# Get baseline (April base) and latest (July) data
+baseline = df[df['YEAR'] == base_code(df)].copy()
+latest = df[df['YEAR'] == year_map(df, components)[latest_year]].copy()
 
-# Create FIPS code (state + county, zero-padded)
-baseline['FIPS'] = baseline['STATE'].astype(str).str.zfill(2) + baseline['COUNTY'].astype(str).str.zfill(3)
-latest['FIPS'] = latest['STATE'].astype(str).str.zfill(2) + latest['COUNTY'].astype(str).str.zfill(3)
+# Create FIPS code (STATE * 1000 + COUNTY; zero-padded strings only for the export)
+baseline['FIPS'] = fips_code(baseline['STATE'], baseline['COUNTY'])
+latest['FIPS'] = fips_code(latest['STATE'], latest['COUNTY'])
 
-# Filter for major cities: counties with population >= 250,000 in April 2020
+# Filter for major cities: counties with population >= 250,000 in the April base
 POPULATION_THRESHOLD = 250000
 major_counties_baseline = baseline[baseline['POPESTIMATE'] >= POPULATION_THRESHOLD].copy()
 
@@ -37,23 +44,25 @@ major_latest = latest[latest['FIPS'].isin(major_fips)].copy()
 merged = major_counties_baseline[['FIPS', 'STNAME', 'CTYNAME', 'POPESTIMATE', 'UNDER5_TOT']].merge(
     major_latest[['FIPS', 'POPESTIMATE', 'UNDER5_TOT']],
     on='FIPS',
-    suffixes=('_2020', '_2024')
+    suffixes=(f'_{base}', f'_{latest_year}')
 )
 
 # Calculate changes
-merged['under5_absolute_change'] = merged['UNDER5_TOT_2024'] - merged['UNDER5_TOT_2020']
-merged['under5_pct_change'] = ((merged['UNDER5_TOT_2024'] - merged['UNDER5_TOT_2020']) / merged['UNDER5_TOT_2020'] * 100).round(2)
-merged['total_pop_change'] = merged['POPESTIMATE_2024'] - merged['POPESTIMATE_2020']
-merged['total_pop_pct_change'] = ((merged['POPESTIMATE_2024'] - merged['POPESTIMATE_2020']) / merged['POPESTIMATE_2020'] * 100).round(2)
+u5_base, u5_latest = merged[f'UNDER5_TOT_{base}'], merged[f'UNDER5_TOT_{latest_year}']
+pop_base, pop_latest = merged[f'POPESTIMATE_{base}'], merged[f'POPESTIMATE_{latest_year}']
+merged['under5_absolute_change'] = u5_latest - u5_base
+merged['under5_pct_change'] = ((u5_latest - u5_base) / u5_base * 100).round(2)
+merged['total_pop_change'] = pop_latest - pop_base
+merged['total_pop_pct_change'] = ((pop_latest - pop_base) / pop_base * 100).round(2)
 
 # Rename columns for clarity
 merged = merged.rename(columns={
     'STNAME': 'state',
     'CTYNAME': 'county',
-    'POPESTIMATE_2020': 'pop_2020',
-    'POPESTIMATE_2024': 'pop_2024',
-    'UNDER5_TOT_2020': 'under5_2020',
-    'UNDER5_TOT_2024': 'under5_2024'
+    f'POPESTIMATE_{base}': f'pop_{base}',
+    f'POPESTIMATE_{latest_year}': f'pop_{latest_year}',
+    f'UNDER5_TOT_{base}': f'under5_{base}',
+    f'UNDER5_TOT_{latest_year}': f'under5_{latest_year}'
 })
 
 # Sort by absolute change (most negative first)
@@ -61,20 +70,20 @@ merged = merged.sort_values('under5_absolute_change')
 
 # Display summary statistics
 print("\n" + "="*80)
-print("UNDER-5 POPULATION CHANGES IN MAJOR U.S. COUNTIES (April 2020 - July 2024)")
+print(f"UNDER-5 POPULATION CHANGES IN MAJOR U.S. COUNTIES (April {base} - July {latest_year})")
 print("="*80)
-print(f"\nDefinition: Major counties = population >= {POPULATION_THRESHOLD:,} in April 2020")
+print(f"\nDefinition: Major counties = population >= {POPULATION_THRESHOLD:,} in April {base}")
 print(f"Number of major counties: {len(merged)}")
 
 # Summary stats
-total_under5_2020 = merged['under5_2020'].sum()
-total_under5_2024 = merged['under5_2024'].sum()
-total_change = total_under5_2024 - total_under5_2020
-pct_change = (total_change / total_under5_2020) * 100
+total_under5_base = merged[f'under5_{base}'].sum()
+total_under5_latest = merged[f'under5_{latest_year}'].sum()
+total_change = total_under5_latest - total_under5_base
+pct_change = (total_change / total_under5_base) * 100
 
 print(f"\nAggregate statistics for major counties:")
-print(f"  Under-5 population in April 2020: {total_under5_2020:,}")
-print(f"  Under-5 population in July 2024:  {total_under5_2024:,}")
+print(f"  Under-5 population in April {base}: {total_under5_base:,}")
+print(f"  Under-5 population in July {latest_year}:  {total_under5_latest:,}")
 print(f"  Absolute change: {total_change:,}")
 print(f"  Percent change: {pct_change:.1f}%")
 
@@ -102,13 +111,25 @@ for i, row in gainers.head(20).iterrows():
     print(f"  {row['county']}, {row['state']}: +{row['under5_absolute_change']:,} ({row['under5_pct_change']:+.1f}%)")
 
 # Export to JSON for map
-output_data = merged.to_dict(orient='records')
+merged['FIPS'] = fips_str(merged['FIPS'])
+output_data = exporter.records(merged)
 
-with open('/Users/connorobrien/cities-for-families/data/county_changes.json', 'w') as f:
-    json.dump(output_data, f, indent=2)
+exporter.write_json('/Users/connorobrien/cities-for-families/data/county_changes.json', output_data, indent=2)
 
 print(f"\n\nData exported to: /Users/connorobrien/cities-for-families/data/county_changes.json")
 
 # Also create a summary CSV
-merged.to_csv('/Users/connorobrien/cities-for-families/data/county_changes.csv', index=False)
+exporter.write_csv('/Users/connorobrien/cities-for-families/data/county_changes.csv', merged)
 print(f"Data exported to: /Users/connorobrien/cities-for-families/data/county_changes.csv")
+
+# Same aggregates for a range of cutoffs, from one sort of the baseline
+# population (threshold_sweep.py; run it directly for other thresholds)
+curve = threshold_sweep.threshold_curve(threshold_sweep.county_table(baseline, latest),
+                                        threshold_sweep.DEFAULT_THRESHOLDS)
+print("\n" + "-"*80)
+print("UNDER-5 CHANGE BY POPULATION THRESHOLD:")
+print("-"*80)
+for row in curve.itertuples():
+    print(f"  >= {row.threshold:>9,}: {row.counties:>5,} counties, {row.under5_pct_change:+.1f}%")
+threshold_sweep.write_curve('/Users/connorobrien/cities-for-families/data/threshold_curve.json', curve)
+print(f"Data exported to: /Users/connorobrien/cities-for-families/data/threshold_curve.json")
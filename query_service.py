@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+"""
+Local HTTP query service over the pipeline's output files.
+
+Loads the county and locale-type metrics from the data directory once, keeps
+them in memory indexed by FIPS, state and locale_type, and answers filtered,
+sorted, paginated queries as JSON. Every response carries an ETag derived
+from the hashes of the files it was built from, so a client repeating a
+request with If-None-Match gets a 304 until the data is rebuilt; the files'
+mtimes are checked on each request and the store reloads when they change.
+Requests are answered (and the store reloaded) in a worker thread, so a
+reload or a large query does not hold up the event loop.
+
+Sources (whichever exist): county_data.bin (every county, see
+county_payload.py) or county_data_embed.js (large urban counties),
+county_changes.json, fertility_rate_ts.json, birth_rate_ts.json,
+under5_by_type.json.
+
+Endpoints:
+    GET /counties?state=Texas&locale_type=Large urban&sort=-under5_pct_change&limit=20&offset=0
+        state / locale_type accept comma-separated values; min_<field> and
+        max_<field> filter numeric fields; fields=a,b limits the columns
+    GET /counties/<FIPS>
+    GET /locales                  per-locale-type time series and under-5 totals
+    GET /locales/<locale_type>
+    GET /health                   build, counts and the snapshot years in the field names
+
+Usage:
+    python query_service.py [--data-dir data] [--host 127.0.0.1] [--port 8765]
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from email.utils import formatdate
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import census_cache
+from county_payload import FIELDS, PAYLOAD_NAME, read_payload, snapshot_header
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(REPO_DIR, 'data')
+
+# county_data_embed.js / county_data.bin keys -> field names in responses, filled
+# in with the snapshot years from the payload header (county_payload.py)
+FIELD_NAMES = {
+    'n': 'county',
+    's': 'state',
+    't': 'locale_type',
+    'p0': 'pop_{base}',
+    'u0': 'under5_{base}',
+    'u4': 'under5_{latest}',
+    'ac': 'under5_change',
+    'pc': 'under5_pct_change',
+    'w0': 'women_15_49_{base}',
+    'w4': 'women_15_49_{latest}',
+    'br11': 'birth_rate_{first}',
+    'br24': 'birth_rate_{latest}',
+    'brch': 'birth_rate_pct_change',
+    'fr21': 'fertility_{current}',
+    'fr24': 'fertility_{latest}',
+    'frch': 'fertility_pct_change',
+    'c0': 'cohort_under5_{base}',
+    'c4': 'cohort_under5_{latest}',
+    'cpc': 'cohort_under5_pct_change',
+    'y0': 'cohort_age25_39_{base}',
+    'y4': 'cohort_age25_39_{latest}',
+    'ypc': 'cohort_age25_39_pct_change',
+}
+
+# Keys the payload stores as integer counts; they decode as floats
+COUNT_KEYS = frozenset(key for key, (_, decimals) in FIELDS.items() if decimals is None)
+
+LOCALE_SOURCES = {
+    'fertility_rate_ts.json': 'fertility_rate',
+    'birth_rate_ts.json': 'birth_rate',
+}
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 1000
+
+
+class QueryError(ValueError):
+    """A request the service understood but cannot answer (400)."""
+
+
+# ---------------------------------------------------------------------------
+# Store
+# ---------------------------------------------------------------------------
+
+def source_paths(data_dir):
+    """The files a store for `data_dir` reads, in load order; the payload supersedes the embed."""
+    names = [PAYLOAD_NAME if os.path.exists(os.path.join(data_dir, PAYLOAD_NAME)) else 'county_data_embed.js',
+             'county_changes.json', *LOCALE_SOURCES, 'under5_by_type.json']
+    return [os.path.join(data_dir, name) for name in names if os.path.exists(os.path.join(data_dir, name))]
+
+
+def _read_embed(path):
+    """county_data_embed.js -> {FIPS: record}; it only covers large urban counties."""
+    with open(path) as f:
+        text = f.read()
+    records = json.loads(text[text.index('=') + 1:].strip().rstrip(';'))
+    return {fips: dict(record, t='Large urban') for fips, record in records.items()}
+
+
+def _read_counties(data_dir):
+    """
+    (records keyed by FIPS, snapshot years, source paths) from the payload, the
+    embed, and county_changes.json.
+    """
+    payload = os.path.join(data_dir, PAYLOAD_NAME)
+    embed = os.path.join(data_dir, 'county_data_embed.js')
+    sources = []
+    records = {}
+    # The embed carries no years; it is written for the default snapshot
+    years = snapshot_header()
+    if os.path.exists(payload):
+        frame = read_payload(payload)
+        years = frame.attrs['years']
+        for fips, row in zip(frame.index, frame.to_dict('records')):
+            records[fips] = {k: (None if isinstance(v, float) and v != v else v) for k, v in row.items()}
+        sources.append(payload)
+    elif os.path.exists(embed):
+        records = _read_embed(embed)
+        sources.append(embed)
+
+    names = {key: name.format(**years) for key, name in FIELD_NAMES.items()}
+    counties = {}
+    for fips, record in records.items():
+        row = {'fips': fips}
+        for key, value in record.items():
+            # Counts decode as floats from the payload; keep them integral
+            if isinstance(value, float) and value.is_integer() and key in COUNT_KEYS:
+                value = int(value)
+            row[names.get(key, key)] = value
+        counties[fips] = row
+
+    changes = os.path.join(data_dir, 'county_changes.json')
+    if os.path.exists(changes):
+        with open(changes) as f:
+            for row in json.load(f):
+                entry = counties.setdefault(row['FIPS'], {'fips': row['FIPS']})
+                for key, value in row.items():
+                    if key != 'FIPS':
+                        entry.setdefault(key, value)
+        sources.append(changes)
+    return counties, years, sources
+
+
+def _read_locales(data_dir):
+    locales = {}
+    sources = []
+    for name, rate_key in LOCALE_SOURCES.items():
+        path = os.path.join(data_dir, name)
+        if not os.path.exists(path):
+            continue
+        with open(path) as f:
+            for row in json.load(f):
+                series = locales.setdefault(row['locale_type'], {'locale_type': row['locale_type']})
+                point = {'year': row['year'], 'rate': row[rate_key]}
+                # Bootstrap interval, when the build wrote one (bootstrap.py)
+                if f'{rate_key}_low' in row:
+                    point.update(low=row[f'{rate_key}_low'], high=row[f'{rate_key}_high'])
+                series.setdefault(rate_key, []).append(point)
+        sources.append(path)
+    path = os.path.join(data_dir, 'under5_by_type.json')
+    if os.path.exists(path):
+        with open(path) as f:
+            for row in json.load(f):
+                entry = locales.setdefault(row['locale_type'], {'locale_type': row['locale_type']})
+                entry['under5'] = {k: v for k, v in row.items() if k != 'locale_type'}
+        sources.append(path)
+    for entry in locales.values():
+        for rate_key in LOCALE_SOURCES.values():
+            if rate_key in entry:
+                entry[rate_key].sort(key=lambda point: point['year'])
+    return locales, sources
+
+
+def _is_missing(value):
+    """None, or a NaN that slipped through from a source file."""
+    return value is None or (isinstance(value, float) and value != value)
+
+
+class MetricsStore:
+    """County and locale metrics with FIPS / state / locale_type indexes."""
+
+    def __init__(self, data_dir=DATA_DIR):
+        self.data_dir = data_dir
+        self.counties, self.years, county_sources = _read_counties(data_dir)
+        self.locales, locale_sources = _read_locales(data_dir)
+        self.sources = county_sources + locale_sources
+        if not self.sources:
+            raise FileNotFoundError(f"no pipeline outputs in {data_dir}")
+        self._mtimes = self._stat()
+
+        self.by_state = {}
+        self.by_locale = {}
+        for fips, row in self.counties.items():
+            self.by_state.setdefault(str(row.get('state', '')).lower(), set()).add(fips)
+            self.by_locale.setdefault(str(row.get('locale_type', '')).lower(), set()).add(fips)
+        self.fields = sorted({k for row in self.counties.values() for k in row})
+        self.numeric_fields = sorted({k for row in self.counties.values() for k, v in row.items()
+                                      if isinstance(v, (int, float)) and not isinstance(v, bool)})
+
+        build = hashlib.sha256()
+        for path in self.sources:
+            build.update(os.path.basename(path).encode())
+            build.update(census_cache.content_hash(path).encode())
+        self.build_hash = build.hexdigest()
+        self.etag = f'"{self.build_hash[:20]}"'
+        self.loaded_at = formatdate(usegmt=True)
+
+    def _stat(self):
+        return {path: os.stat(path).st_mtime_ns for path in self.sources if os.path.exists(path)}
+
+    def is_stale(self):
+        """True if a source file changed, appeared or went away since loading."""
+        return source_paths(self.data_dir) != self.sources or self._stat() != self._mtimes
+
+    # -- queries ------------------------------------------------------------
+
+    def query_counties(self, params):
+        """(total matches, page of rows) for /counties query parameters (dict of lists)."""
+        selected = None
+        for key, index in (('state', self.by_state), ('locale_type', self.by_locale)):
+            if key in params:
+                wanted = [v.strip().lower() for value in params[key] for v in value.split(',') if v.strip()]
+                matches = set().union(*(index.get(v, set()) for v in wanted))
+                selected = matches if selected is None else selected & matches
+        if 'fips' in params:
+            wanted = {v.strip() for value in params['fips'] for v in value.split(',')}
+            selected = wanted & set(self.counties) if selected is None else selected & wanted
+        rows = [self.counties[f] for f in sorted(self.counties if selected is None else selected)]
+
+        for key, values in params.items():
+            for prefix, keep in (('min_', lambda v, b: v >= b), ('max_', lambda v, b: v <= b)):
+                if key.startswith(prefix):
+                    field = key[len(prefix):]
+                    self._check_numeric(field)
+                    try:
+                        bound = float(values[-1])
+                    except ValueError:
+                        raise QueryError(f"{key} must be a number") from None
+                    rows = [r for r in rows if r.get(field) is not None and keep(r[field], bound)]
+
+        if 'sort' in params:
+            for spec in reversed(params['sort'][-1].split(',')):
+                field = spec.lstrip('-+')
+                if field not in self.fields:
+                    raise QueryError(f"unknown sort field {field!r}; one of: {', '.join(self.fields)}")
+                descending = spec.startswith('-')
+                present = [r for r in rows if not _is_missing(r.get(field))]
+                missing = [r for r in rows if _is_missing(r.get(field))]
+                # Missing values sort last either way and are never compared with numbers
+                rows = sorted(present, key=lambda r: r[field], reverse=descending) + missing
+
+        limit = self._int_param(params, 'limit', DEFAULT_LIMIT)
+        offset = self._int_param(params, 'offset', 0)
+        if not 0 < limit <= MAX_LIMIT:
+            raise QueryError(f"limit must be between 1 and {MAX_LIMIT}")
+        if offset < 0:
+            raise QueryError("offset must not be negative")
+        page = rows[offset:offset + limit]
+        if 'fields' in params:
+            fields = ['fips'] + [f for value in params['fields'] for f in value.split(',') if f and f != 'fips']
+            page = [{f: r.get(f) for f in fields} for r in page]
+        return len(rows), page
+
+    def _check_numeric(self, field):
+        if field not in self.numeric_fields:
+            raise QueryError(f"unknown numeric field {field!r}; one of: {', '.join(self.numeric_fields)}")
+
+    @staticmethod
+    def _int_param(params, key, default):
+        try:
+            return int(params[key][-1]) if key in params else default
+        except ValueError:
+            raise QueryError(f"{key} must be an integer") from None
+
+
+# ---------------------------------------------------------------------------
+# HTTP
+# ---------------------------------------------------------------------------
+
+STATUS = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+          500: 'Internal Server Error'}
+
+
+class QueryService:
+    """Routes requests to a MetricsStore, reloading it when the pipeline rewrites its files."""
+
+    def __init__(self, data_dir=DATA_DIR):
+        self.data_dir = data_dir
+        self.store = MetricsStore(data_dir)
+        # Requests run in executor threads; one of them reloads, the rest wait for it
+        self._reload_lock = threading.Lock()
+
+    def current_store(self):
+        with self._reload_lock:
+            if self.store.is_stale():
+                self.store = MetricsStore(self.data_dir)
+                print(f"Reloaded {self.data_dir} (build {self.store.build_hash[:12]})")
+            return self.store
+
+    @staticmethod
+    def route(store, path, params):
+        """(status, body object) for a GET of `path` with parsed query `params`."""
+        parts = [unquote(p) for p in path.strip('/').split('/') if p]
+        if parts == ['health']:
+            return 200, {'status': 'ok', 'build': store.build_hash, 'counties': len(store.counties),
+                         'locale_types': len(store.locales), 'years': store.years, 'loaded_at': store.loaded_at}
+        if parts == ['counties']:
+            total, page = store.query_counties(params)
+            return 200, {'total': total, 'offset': store._int_param(params, 'offset', 0),
+                         'limit': store._int_param(params, 'limit', DEFAULT_LIMIT), 'results': page}
+        if len(parts) == 2 and parts[0] == 'counties':
+            row = store.counties.get(parts[1].zfill(5))
+            return (200, row) if row else (404, {'error': f"no county {parts[1]}"})
+        if parts == ['locales']:
+            return 200, {'results': list(store.locales.values())}
+        if len(parts) == 2 and parts[0] == 'locales':
+            match = {k.lower(): v for k, v in store.locales.items()}.get(parts[1].lower())
+            return (200, match) if match else (404, {'error': f"no locale type {parts[1]}"})
+        return 404, {'error': 'not found'}
+
+    def respond(self, method, target, headers):
+        """(status, headers, body bytes) for one request."""
+        if method not in ('GET', 'HEAD'):
+            return 405, {'Allow': 'GET, HEAD'}, b''
+        url = urlsplit(target)
+        store = self.current_store()
+        try:
+            status, body = self.route(store, url.path, parse_qs(url.query))
+        except QueryError as exc:
+            status, body = 400, {'error': str(exc)}
+        etag = store.etag
+        out_headers = {'Content-Type': 'application/json', 'Cache-Control': 'no-cache',
+                       'Access-Control-Allow-Origin': '*'}
+        if status == 200:
+            out_headers['ETag'] = etag
+            if etag in [t.strip() for t in headers.get('if-none-match', '').split(',')]:
+                return 304, out_headers, b''
+        return status, out_headers, json.dumps(body, separators=(',', ':')).encode('utf-8')
+
+    async def handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self._send(writer, 400, {}, b'', keep_alive=False)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    content_length = int(headers.get('content-length', 0) or 0)
+                    if content_length < 0:
+                        raise ValueError(content_length)
+                except ValueError:
+                    # The body cannot be framed, so neither can a following request
+                    await self._send(writer, 400, {'Content-Type': 'application/json'},
+                                     b'{"error":"invalid Content-Length"}', keep_alive=False)
+                    break
+                if content_length:
+                    await reader.readexactly(content_length)
+
+                start = time.perf_counter()
+                try:
+                    status, out_headers, body = await loop.run_in_executor(None, self.respond, method, target,
+                                                                           headers)
+                except Exception as exc:  # keep serving; report the failure to the client
+                    status, out_headers, body = 500, {'Content-Type': 'application/json'}, \
+                        json.dumps({'error': str(exc)}).encode('utf-8')
+                keep_alive = (version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close')
+                await self._send(writer, status, out_headers, b'' if method == 'HEAD' else body, keep_alive,
+                                 content_length=len(body))
+                print(f"{method} {target} {status} {(time.perf_counter() - start) * 1000:.1f}ms")
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _send(writer, status, headers, body, keep_alive, content_length=None):
+        lines = [f"HTTP/1.1 {status} {STATUS.get(status, '')}"]
+        headers = dict(headers, **{'Content-Length': str(len(body) if content_length is None else content_length),
+                                   'Connection': 'keep-alive' if keep_alive else 'close',
+                                   'Date': formatdate(usegmt=True)})
+        if status == 304:
+            headers['Content-Length'] = '0'
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+
+
+async def serve(data_dir=DATA_DIR, host='127.0.0.1', port=8765):
+    service = QueryService(data_dir)
+    server = await asyncio.start_server(service.handle, host, port)
+    store = service.store
+    print(f"Serving {len(store.counties):,} counties, {len(store.locales)} locale types "
+          f"(build {store.build_hash[:12]}) on http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.data_dir, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Bounded-memory streaming aggregation for the county characteristics files.
+
+Reads an agesex-style file in chunks and folds each chunk into running
+per-(county, YEAR) totals of POPESTIMATE, UNDER5_TOT and WOMEN_15_49, so peak
+memory depends on the number of counties and YEAR codes, not on the number of
+rows. Besides the cc-est agesex layout (one row per county and YEAR) it reads
+the cc-est alldata layout by race/ethnicity, which has one row per county,
+YEAR and AGEGRP with TOT_POP / TOT_FEMALE columns.
+
+The result has the same columns as census_schema.read_agesex plus
+WOMEN_15_49, with identical totals, so the pipeline can use either. `extra`
+age x sex columns (age_structure.AGE_COLUMNS) are folded the same way; in
+the alldata layout they are read off the AGEGRP rows. Their size is fixed
+too (counties x YEAR codes x columns), so the age structure fits the same
+bounded pass.
+
+Usage:
+    python streaming.py /path/to/cc-est2024-alldata.csv [--chunksize N] [--check]
+"""
+
+import pandas as pd
+
+from age_structure import AGE_GROUPS
+from census_schema import FOOTNOTE_VALUES, WOMEN_15_49_COLS, parse_csv_chunks, read_header
+
+KEYS = ['STATE', 'COUNTY', 'YEAR']
+NAMES = ['STNAME', 'CTYNAME']
+TOTALS = ['POPESTIMATE', 'UNDER5_TOT', 'WOMEN_15_49']
+
+# alldata AGEGRP codes: 0 = all ages, 1 = 0-4, 4..10 = 15-19 .. 45-49
+AGEGRP_TOTAL = 0
+AGEGRP_UNDER5 = 1
+AGEGRP_WOMEN_15_49 = range(4, 11)
+# alldata AGEGRP 1..18 are the five-year groups of age_structure.AGE_GROUPS; sex -> count column
+ALLDATA_SEX_COLUMNS = {'TOT': 'TOT_POP', 'MALE': 'TOT_MALE', 'FEM': 'TOT_FEMALE'}
+
+DEFAULT_CHUNKSIZE = 200_000
+
+
+def detect_layout(header):
+    return 'alldata' if 'AGEGRP' in header else 'agesex'
+
+
+def _layout_columns(layout, extra=()):
+    if layout == 'alldata':
+        columns = ['TOT_POP', 'TOT_FEMALE'] + (['TOT_MALE'] if extra else [])
+        return dict({'AGEGRP': 'int8'}, **{col: 'float64' for col in columns})
+    return {col: 'float64' for col in ['POPESTIMATE', 'UNDER5_TOT'] + WOMEN_15_49_COLS + list(extra)}
+
+
+def _layout_extra(header, layout, extra):
+    """The `extra` columns a file of `layout` can provide."""
+    if layout == 'alldata':
+        return [col for col in extra
+                if col.rsplit('_', 1)[0] in AGE_GROUPS and col.rsplit('_', 1)[-1] in ALLDATA_SEX_COLUMNS]
+    return [col for col in extra if col in header]
+
+
+def chunk_totals(chunk, layout, extra=()):
+    """One chunk -> its contribution to the (STATE, COUNTY, YEAR) totals."""
+    if layout == 'alldata':
+        agegrp = chunk['AGEGRP']
+        contrib = pd.DataFrame({
+            'POPESTIMATE': chunk['TOT_POP'].where(agegrp == AGEGRP_TOTAL, 0),
+            'UNDER5_TOT': chunk['TOT_POP'].where(agegrp == AGEGRP_UNDER5, 0),
+            'WOMEN_15_49': chunk['TOT_FEMALE'].where(agegrp.isin(AGEGRP_WOMEN_15_49), 0),
+        })
+        for col in extra:
+            group, sex = col.rsplit('_', 1)
+            contrib[col] = chunk[ALLDATA_SEX_COLUMNS[sex]].where(agegrp == AGE_GROUPS.index(group) + 1, 0)
+    else:
+        contrib = pd.DataFrame({
+            'POPESTIMATE': chunk['POPESTIMATE'],
+            'UNDER5_TOT': chunk['UNDER5_TOT'],
+            'WOMEN_15_49': chunk[WOMEN_15_49_COLS].sum(axis=1),
+        })
+        for col in extra:
+            contrib[col] = chunk[col]
+    contrib = contrib.fillna(0).astype('int64')
+    for key in KEYS:
+        contrib[key] = chunk[key].to_numpy()
+    return contrib.groupby(KEYS)[TOTALS + list(extra)].sum()
+
+
+def stream_agesex(path, chunksize=DEFAULT_CHUNKSIZE, extra=()):
+    """
+    Aggregate an agesex or alldata file chunk by chunk. Returns a frame with
+    one row per (county, YEAR): STATE, COUNTY, STNAME, CTYNAME, YEAR,
+    POPESTIMATE, UNDER5_TOT, WOMEN_15_49 and the `extra` age x sex columns
+    the file has.
+    """
+    header = read_header(path)
+    layout = detect_layout(header)
+    extra = _layout_extra(header, layout, extra)
+    dtypes = dict({'STATE': 'int16', 'COUNTY': 'int16', 'YEAR': 'int8', 'STNAME': str, 'CTYNAME': str},
+                  **_layout_columns(layout, extra))
+    totals = None
+    names = None
+    for chunk in parse_csv_chunks(path, chunksize, encoding='latin-1', usecols=list(dtypes), dtype=dtypes,
+                                  na_values=FOOTNOTE_VALUES):
+        part = chunk_totals(chunk, layout, extra)
+        totals = part if totals is None else totals.add(part, fill_value=0)
+        chunk_names = chunk.drop_duplicates(['STATE', 'COUNTY']).set_index(['STATE', 'COUNTY'])[NAMES]
+        names = chunk_names if names is None else names.combine_first(chunk_names)
+
+    out = totals.astype('int64').reset_index()
+    out = out.merge(names.reset_index(), on=['STATE', 'COUNTY'], how='left')
+    # Match census_schema.read_agesex dtypes so either source can feed the pipeline
+    out = out.astype(dict({'STATE': 'int16', 'COUNTY': 'int16', 'YEAR': 'int8',
+                           'POPESTIMATE': 'int32', 'UNDER5_TOT': 'int32',
+                           'STNAME': 'category', 'CTYNAME': 'category'}, **{col: 'int32' for col in extra}))
+    return out[['STATE', 'COUNTY', 'STNAME', 'CTYNAME', 'YEAR'] + TOTALS + extra]
+
+
+def in_memory_totals(df):
+    """The same totals from a fully loaded census_schema.read_agesex frame."""
+    totals = df.assign(WOMEN_15_49=df[WOMEN_15_49_COLS].sum(axis=1))
+    return (totals.groupby(KEYS, observed=True)
+            .agg(STNAME=('STNAME', 'first'), CTYNAME=('CTYNAME', 'first'),
+                 POPESTIMATE=('POPESTIMATE', 'sum'), UNDER5_TOT=('UNDER5_TOT', 'sum'),
+                 WOMEN_15_49=('WOMEN_15_49', 'sum'))
+            .reset_index())
+
+
+if __name__ == '__main__':
+    import argparse
+    import resource
+    import time
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='+')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument('--check', action='store_true', help='compare against a full in-memory load (agesex layout)')
+    args = parser.parse_args()
+
+    for src in args.paths:
+        start = time.perf_counter()
+        result = stream_agesex(src, args.chunksize)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f"{src}: {len(result):,} county-years in {time.perf_counter() - start:.2f}s "
+              f"(peak RSS {peak:.0f} MB)")
+        if args.check:
+            from census_schema import read_agesex
+            # A fresh parse of the CSV: not the columnar cache or a CENSUS_STORE
+            expected = in_memory_totals(read_agesex(src, store='', cache=False))
+            pd.testing.assert_frame_equal(result, expected[result.columns], check_dtype=False, check_categorical=False)
+            print("  matches the in-memory totals")
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Pre-projected SVG paths for the county map.
+
+Projects data/counties.geojson with the same Albers USA composite projection
+the page used to run in the browser (d3.geoAlbersUsa().scale(1280) translated
+to the middle of the 960x600 map), so the page only attaches ready-made `d`
+attributes. Geometry comes from the shared arcs built by topology.py,
+simplified to the same detail levels, so neighbouring counties still meet
+exactly. Coordinates are rounded to 0.1 px and written as relative path
+commands.
+
+One file per level in topology.LEVELS, each with a .gz sibling:
+    data/county-paths-national.json
+    data/county-paths-state.json
+holding {"width", "height", "paths": {FIPS: d}, "borders": d}, where
+`borders` are the state lines (county arcs whose two sides lie in different
+states).
+
+d3 also resamples long edges adaptively; at the GeoJSON's resolution the
+difference is well under a pixel.
+
+Usage:
+    python svg_paths.py [data/counties.geojson] [--out-dir data]
+"""
+
+import argparse
+import json
+import math
+import os
+
+from county_payload import write_precompressed
+from topology import (COUNTIES_GEOJSON, LEVELS, REPO_DIR, build_topology, minimum_points, simplify_arcs,
+                      visvalingam_weights)
+
+WIDTH = 960
+HEIGHT = 600
+SCALE = 1280
+
+ALASKA = '02'
+HAWAII = '15'
+
+
+def conic_equal_area(parallels, rotate, center, scale, translate):
+    """d3.geoConicEqualArea().parallels(..).rotate([rotate, 0]).center(..).scale(..).translate(..)"""
+    y0, y1 = (math.radians(p) for p in parallels)
+    sy0 = math.sin(y0)
+    n = (sy0 + math.sin(y1)) / 2
+    c = 1 + sy0 * (2 * n - sy0)
+    r0 = math.sqrt(c) / n
+
+    def raw(x, y):
+        r = math.sqrt(c - 2 * n * math.sin(y)) / n
+        return r * math.sin(x * n), r0 - r * math.cos(x * n)
+
+    cx, cy = raw(*(math.radians(v) for v in center))
+    tx, ty = translate
+
+    def project(lon, lat):
+        lam = math.radians(lon + rotate)
+        if lam > math.pi:
+            lam -= 2 * math.pi
+        elif lam < -math.pi:
+            lam += 2 * math.pi
+        x, y = raw(lam, math.radians(lat))
+        return tx + scale * (x - cx), ty - scale * (y - cy)
+
+    return project
+
+
+def albers_usa(scale=SCALE, translate=(WIDTH / 2, HEIGHT / 2)):
+    """
+    The three parts of d3.geoAlbersUsa as {'lower48', 'alaska', 'hawaii'}
+    projections, with d3's insets and the lower-48 clip extent.
+    """
+    x, y = translate
+    k = scale
+    return {
+        'lower48': conic_equal_area((29.5, 45.5), 96, (-0.6, 38.7), k, (x, y)),
+        'alaska': conic_equal_area((55, 65), 154, (-2, 58.5), k * 0.35, (x - 0.307 * k, y + 0.201 * k)),
+        'hawaii': conic_equal_area((8, 18), 157, (-3, 19.9), k, (x - 0.205 * k, y + 0.212 * k)),
+        'extent': ((x - 0.455 * k, y - 0.238 * k), (x + 0.455 * k, y + 0.238 * k)),
+    }
+
+
+def _tenths(value):
+    """Tenths of a pixel as a compact SVG number: 12 -> '1.2', -5 -> '-.5'."""
+    sign = '-' if value < 0 else ''
+    whole, frac = divmod(abs(value), 10)
+    if not frac:
+        return f'{sign}{whole}'
+    return f'{sign}{whole or ""}.{frac}'
+
+
+def path_data(lines, closed):
+    """SVG path for projected polylines: absolute move, then relative lines, in 0.1 px."""
+    parts = []
+    for points in lines:
+        rounded = []
+        for x, y in points:
+            q = (round(x * 10), round(y * 10))
+            if not rounded or q != rounded[-1]:
+                rounded.append(q)
+        if closed and len(rounded) > 1 and rounded[0] == rounded[-1]:
+            rounded.pop()
+        if len(rounded) < (3 if closed else 2):
+            continue
+        (x0, y0), rest = rounded[0], rounded[1:]
+        steps = []
+        px, py = x0, y0
+        for x, y in rest:
+            dx, dy = _tenths(x - px), _tenths(y - py)
+            steps.append(f"{dx}{'' if dy.startswith('-') else ','}{dy}")
+            px, py = x, y
+        parts.append(f"M{_tenths(x0)},{_tenths(y0)}l{' '.join(steps)}{'z' if closed else ''}")
+    return ''.join(parts)
+
+
+def _ring_points(arcs, refs):
+    points = []
+    for ref in refs:
+        arc = arcs[ref] if ref >= 0 else arcs[~ref][::-1]
+        points.extend(arc if not points else arc[1:])
+    return points
+
+
+def _projection_for(fips, parts):
+    return parts['alaska'] if fips.startswith(ALASKA) else parts['hawaii'] if fips.startswith(HAWAII) \
+        else parts['lower48']
+
+
+def _inside(points, extent):
+    (x0, y0), (x1, y1) = extent
+    return any(x0 <= x <= x1 and y0 <= y <= y1 for x, y in points)
+
+
+def project_level(arcs, geometries, weights, keep_share, parts):
+    """{'paths': {FIPS: d}, 'borders': d} for one simplification level."""
+    simplified = simplify_arcs(arcs, weights, keep_share, minimum_points(arcs, geometries))
+    paths = {}
+    users = {}
+    for geometry in geometries:
+        fips = geometry['id']
+        project = _projection_for(fips, parts)
+        polygons = [geometry['arcs']] if geometry['type'] == 'Polygon' else geometry['arcs']
+        rings = []
+        for polygon in polygons:
+            for refs in polygon:
+                rings.append([project(lon, lat) for lon, lat in _ring_points(simplified, refs)])
+                for ref in refs:
+                    users.setdefault(ref if ref >= 0 else ~ref, set()).add(fips[:2])
+        # Like d3's clip extent: lower-48 projections of other territories fall off the map
+        if project is parts['lower48'] and not any(_inside(ring, parts['extent']) for ring in rings):
+            continue
+        d = path_data(rings, closed=True)
+        if d:
+            paths[fips] = d
+
+    borders = []
+    for index, states in sorted(users.items()):
+        if len(states) > 1 and not states & {ALASKA, HAWAII}:
+            borders.append([parts['lower48'](lon, lat) for lon, lat in simplified[index]])
+    return {'paths': paths, 'borders': path_data(borders, closed=False)}
+
+
+def build_svg_paths(geojson_path=COUNTIES_GEOJSON, out_dir=os.path.join(REPO_DIR, 'data'), levels=None):
+    """Write county-paths-<level>.json (plus .gz) for each level; returns the paths."""
+    with open(geojson_path) as f:
+        features = json.load(f)['features']
+    arcs, geometries = build_topology(features)
+    weights = [visvalingam_weights(points) for points in arcs]
+    parts = albers_usa()
+    os.makedirs(out_dir, exist_ok=True)
+    written = []
+    levels = levels or LEVELS
+    for name, (keep_share, _) in levels.items():
+        projected = project_level(arcs, geometries, weights, keep_share, parts)
+        doc = dict({'width': WIDTH, 'height': HEIGHT, 'scale': SCALE}, **projected)
+        data = json.dumps(doc, separators=(',', ':')).encode('utf-8')
+        written += write_precompressed(os.path.join(out_dir, f'county-paths-{name}.json'), data)
+    print(f"Projected {len(geometries)} counties to SVG paths -> {len(levels)} levels")
+    return written
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('geojson', nargs='?', default=COUNTIES_GEOJSON)
+    parser.add_argument('--out-dir', default=os.path.join(REPO_DIR, 'data'))
+    args = parser.parse_args()
+
+    for path in build_svg_paths(args.geojson, args.out_dir):
+        print(f"  {os.path.basename(path):<32} {os.path.getsize(path):>10,} bytes")
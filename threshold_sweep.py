@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Population-threshold sweep for the process_data.py "major counties" cut.
+
+process_data.py keeps counties with an April base population of at least
+POPULATION_THRESHOLD and sums their under-5 counts. This computes the same
+aggregates for any number of thresholds at once: counties are sorted by
+baseline population a single time and the counts summed cumulatively from the
+largest down, so each threshold is one binary search into those sums.
+
+The curve (one row per threshold: counties kept, their population and under-5
+totals at the April base and the latest estimate, change, percent change and
+share of the national under-5 population) is written as
+data/threshold_curve.json for the site. Its columns are named base / latest
+rather than for the years, so the file keeps its shape from one vintage to
+the next.
+
+Usage:
+    python threshold_sweep.py [/path/to/cc-est2024-agesex-all.csv] [--thresholds 100000,250000,1000000 | all]
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+import census_schema
+from county_dimension import fips_code
+from exporter import records, write_json
+from vintages import base_code, latest_code
+
+SOURCE_PATH = '/Users/connorobrien/Downloads/cc-est2024-agesex-all.csv'
+OUTPUT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'threshold_curve.json')
+
+# Chart grid: roughly log-spaced from 10k to 5M, including the script's 250k cutoff
+DEFAULT_THRESHOLDS = sorted({10_000, 15_000, 25_000, 35_000, 50_000, 75_000, 100_000, 150_000, 250_000,
+                             350_000, 500_000, 750_000, 1_000_000, 1_500_000, 2_500_000, 3_500_000, 5_000_000})
+
+SUMMED = ['pop_base', 'under5_base', 'pop_latest', 'under5_latest']
+
+
+def county_table(baseline, latest):
+    """One row per county in both estimates: FIPS, pop_base, under5_base, pop_latest, under5_latest."""
+    cols = ['FIPS', 'POPESTIMATE', 'UNDER5_TOT']
+    merged = baseline[cols].merge(latest[cols], on='FIPS', suffixes=('_base', '_latest'))
+    return merged.rename(columns={'POPESTIMATE_base': 'pop_base', 'POPESTIMATE_latest': 'pop_latest',
+                                  'UNDER5_TOT_base': 'under5_base', 'UNDER5_TOT_latest': 'under5_latest'})
+
+
+def county_table_from_agesex(df, base=None, latest=None):
+    """
+    county_table from an agesex frame: the April base (`base`, default its
+    first YEAR code) against the latest July estimate (`latest`, default its
+    last).
+    """
+    if 'FIPS' not in df.columns:
+        df = df.assign(FIPS=fips_code(df['STATE'], df['COUNTY']))
+    base = base_code(df) if base is None else base
+    latest = latest_code(df) if latest is None else latest
+    return county_table(df[df['YEAR'] == base], df[df['YEAR'] == latest])
+
+
+def threshold_curve(counties, thresholds=None):
+    """
+    Aggregates over counties with pop_base >= each threshold. `thresholds`
+    defaults to every distinct county population (the full step curve).
+    """
+    order = np.argsort(counties['pop_base'].to_numpy(), kind='stable')
+    pop = counties['pop_base'].to_numpy()[order]
+    # suffix[k] = sum over the counties from sorted position k to the end
+    suffix = {}
+    for col in SUMMED:
+        values = counties[col].to_numpy(dtype=np.int64)[order]
+        suffix[col] = np.concatenate([np.cumsum(values[::-1])[::-1], [0]])
+
+    if thresholds is None:
+        thresholds = np.unique(pop)
+    thresholds = np.asarray(sorted(thresholds), dtype=np.int64)
+    start = np.searchsorted(pop, thresholds, side='left')
+
+    curve = pd.DataFrame({'threshold': thresholds, 'counties': len(pop) - start})
+    for col in SUMMED:
+        curve[col] = suffix[col][start]
+    national_under5 = suffix['under5_base'][0]
+    curve['under5_change'] = curve['under5_latest'] - curve['under5_base']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        curve['under5_pct_change'] = (curve['under5_change'] / curve['under5_base'] * 100).round(2)
+        curve['under5_share_base'] = (curve['under5_base'] / national_under5 * 100).round(2)
+    return curve
+
+
+def curve_records(curve):
+    """JSON-ready rows; thresholds that keep no county have null percentages."""
+    return records(curve)
+
+
+def write_curve(path, curve):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    return write_json(path, curve_records(curve))
+
+
+def parse_thresholds(text):
+    if text is None:
+        return DEFAULT_THRESHOLDS
+    if text == 'all':
+        return None
+    return [int(float(v)) for v in text.split(',') if v.strip()]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('source', nargs='?', default=SOURCE_PATH)
+    parser.add_argument('--thresholds', help="comma-separated populations, or 'all' for every distinct one")
+    parser.add_argument('--out', default=OUTPUT_PATH)
+    args = parser.parse_args()
+
+    curve = threshold_curve(county_table_from_agesex(census_schema.read_agesex(args.source)),
+                            parse_thresholds(args.thresholds))
+    print(curve.to_string(index=False, max_rows=40))
+    print(f"\nExported {write_curve(args.out, curve)}: {len(curve)} thresholds")
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Build the map's county TopoJSON from data/counties.geojson.
+
+The GeoJSON stores every county ring in full, so each border between two
+counties is written twice. This turns it into a topology: rings are cut at
+junctions (points where more than two counties meet, or where a shared border
+ends) into arcs, and each arc is stored once and referenced by every county
+that uses it. Arcs are then simplified (Visvalingam effective area, with arc
+endpoints fixed, so neighbouring counties still meet exactly), quantized to an
+integer grid and delta-encoded.
+
+svg_paths.py builds the page's pre-projected county paths from these arcs.
+Run directly, this also writes the topology itself, one file per level in
+LEVELS (a coarse one for the national map and a finer one for state-level
+zoom), each with a .gz sibling, for clients that draw from TopoJSON; the page
+and the pipeline do not use them:
+    data/counties-national.topo.json
+    data/counties-state.topo.json
+
+Counties carry their 5-digit FIPS as `id`; state borders are the county arcs
+whose two sides lie in different states (the first two digits of the ids).
+
+Usage:
+    python topology.py [data/counties.geojson] [--out-dir data]
+"""
+
+import argparse
+import heapq
+import json
+import math
+import os
+
+from county_payload import write_precompressed
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+COUNTIES_GEOJSON = os.path.join(REPO_DIR, 'data', 'counties.geojson')
+
+# name -> (share of interior arc points kept, by Visvalingam weight; quantization grid)
+LEVELS = {
+    'national': (0.1, 10_000),
+    'state': (0.6, 100_000),
+}
+
+
+# ---------------------------------------------------------------------------
+# Topology
+# ---------------------------------------------------------------------------
+
+def _rings(geometry):
+    """Polygon/MultiPolygon -> list of polygons, each a list of rings (lists of (x, y))."""
+    if geometry['type'] == 'Polygon':
+        polygons = [geometry['coordinates']]
+    elif geometry['type'] == 'MultiPolygon':
+        polygons = geometry['coordinates']
+    else:
+        raise ValueError(f"unsupported geometry type {geometry['type']}")
+    out = []
+    for polygon in polygons:
+        rings = []
+        for ring in polygon:
+            ring = [(float(x), float(y)) for x, y in ring]
+            if ring[0] != ring[-1]:
+                ring.append(ring[0])
+            rings.append(ring)
+        out.append(rings)
+    return out
+
+
+def find_junctions(rings):
+    """
+    Points where rings stop running along each other: a point is a junction
+    if it is reached with different neighbours in different rings.
+    """
+    neighbours = {}
+    junctions = set()
+    for ring in rings:
+        n = len(ring) - 1
+        for i in range(n):
+            point = ring[i]
+            pair = frozenset((ring[i - 1], ring[i + 1]))
+            seen = neighbours.get(point)
+            if seen is None:
+                neighbours[point] = pair
+            elif seen != pair:
+                junctions.add(point)
+    return junctions
+
+
+def _canonical_ring(ring):
+    """A junction-free closed ring rotated to start at its smallest point."""
+    body = ring[:-1]
+    start = min(range(len(body)), key=body.__getitem__)
+    body = body[start:] + body[:start]
+    return body + [body[0]]
+
+
+class ArcIndex:
+    """Deduplicated arcs; a reversed arc is referenced as ~index."""
+
+    def __init__(self):
+        self.arcs = []
+        self._index = {}
+
+    def add(self, points, free_ring=False):
+        """
+        Reference to `points`, stored if new. A `free_ring` (closed, with no
+        junction) may start anywhere, so it is compared in canonical rotation.
+        """
+        if free_ring:
+            points = _canonical_ring(points)
+            reverse = tuple(_canonical_ring(points[::-1]))
+        else:
+            reverse = tuple(points[::-1])
+        key = tuple(points)
+        if key in self._index:
+            return self._index[key]
+        if reverse in self._index:
+            return ~self._index[reverse]
+        self._index[key] = len(self.arcs)
+        self.arcs.append(points)
+        return self._index[key]
+
+
+def cut_ring(ring, junctions, arcs):
+    """Split a closed ring at its junctions; returns its arc references."""
+    body = ring[:-1]
+    cuts = [i for i, point in enumerate(body) if point in junctions]
+    if not cuts:
+        return [arcs.add(ring, free_ring=True)]
+    start = cuts[0]
+    body = body[start:] + body[:start]
+    cuts = [i - start for i in cuts] + [len(body)]
+    body.append(body[0])
+    return [arcs.add(body[a:b + 1]) for a, b in zip(cuts, cuts[1:])]
+
+
+def build_topology(features):
+    """(arcs, geometries): shared arcs and TopoJSON geometries with arc references."""
+    parsed = [(feature, _rings(feature['geometry'])) for feature in features]
+    junctions = find_junctions([ring for _, polygons in parsed for rings in polygons for ring in rings])
+    arcs = ArcIndex()
+    geometries = []
+    for feature, polygons in parsed:
+        props = feature['properties']
+        refs = [[cut_ring(ring, junctions, arcs) for ring in rings] for rings in polygons]
+        geometry = {'id': f"{props['STATE']}{props['COUNTY']}"}
+        if len(refs) == 1:
+            geometry.update(type='Polygon', arcs=refs[0])
+        else:
+            geometry.update(type='MultiPolygon', arcs=refs)
+        geometries.append(geometry)
+    return arcs.arcs, geometries
+
+
+# ---------------------------------------------------------------------------
+# Simplification and quantization
+# ---------------------------------------------------------------------------
+
+def _triangle_area(a, b, c):
+    # Longitude shrinks with latitude; scale x so areas are roughly equal-area
+    k = math.cos(math.radians((a[1] + b[1] + c[1]) / 3))
+    return abs((b[0] - a[0]) * (c[1] - a[1]) - (c[0] - a[0]) * (b[1] - a[1])) * k / 2
+
+
+def visvalingam_weights(points):
+    """Effective area of each point (endpoints: infinity), as in TopoJSON's presimplify."""
+    n = len(points)
+    weights = [math.inf] * n
+    if n < 3:
+        return weights
+    prev = list(range(-1, n - 1))
+    nxt = list(range(1, n + 1))
+    heap = [(_triangle_area(points[i - 1], points[i], points[i + 1]), i) for i in range(1, n - 1)]
+    heapq.heapify(heap)
+    current = {i: area for area, i in heap}
+    max_area = 0.0
+    while heap:
+        area, i = heapq.heappop(heap)
+        if current.get(i) != area:
+            continue
+        del current[i]
+        # A point's weight never drops below one removed before it
+        max_area = max(max_area, area)
+        weights[i] = max_area
+        p, q = prev[i], nxt[i]
+        nxt[p], prev[q] = q, p
+        for j in (p, q):
+            if 0 < j < n - 1:
+                current[j] = _triangle_area(points[prev[j]], points[j], points[nxt[j]])
+                heapq.heappush(heap, (current[j], j))
+    return weights
+
+
+def minimum_points(arcs, geometries):
+    """
+    Interior points each arc keeps at any level: two for arcs that make up a
+    ring alone or with one other arc (small enclaves, islands), else one, so no
+    ring collapses to a line.
+    """
+    minimum = [1] * len(arcs)
+    for geometry in geometries:
+        polygons = [geometry['arcs']] if geometry['type'] == 'Polygon' else geometry['arcs']
+        for ring in (ring for polygon in polygons for ring in polygon):
+            if len(ring) <= 2:
+                for ref in ring:
+                    minimum[ref if ref >= 0 else ~ref] = 2
+    return minimum
+
+
+def simplify_arcs(arcs, weights, keep_share, minimum):
+    """
+    Keep the heaviest `keep_share` of interior points across all arcs, and at
+    least `minimum[i]` interior points of arc i.
+    """
+    interior = sorted((w for ws in weights for w in ws[1:-1]), reverse=True)
+    if not interior or keep_share >= 1:
+        threshold = 0.0
+    else:
+        threshold = interior[min(len(interior) - 1, int(len(interior) * keep_share))]
+        # Strictly above the cut-off weight, so ties do not overshoot the share
+        threshold = math.nextafter(threshold, math.inf)
+    out = []
+    for points, ws in zip(arcs, weights):
+        heaviest = sorted(range(1, len(points) - 1), key=ws.__getitem__, reverse=True)
+        keep = set(heaviest[:minimum[len(out)]])
+        out.append([p for i, (p, w) in enumerate(zip(points, ws)) if w >= threshold or i in keep])
+    return out
+
+
+def quantize(arcs, bbox, n):
+    """Quantize to an n x n grid and delta-encode; returns (arcs, transform)."""
+    x0, y0, x1, y1 = bbox
+    kx = (x1 - x0) / (n - 1) if x1 > x0 else 1
+    ky = (y1 - y0) / (n - 1) if y1 > y0 else 1
+    encoded = []
+    for points in arcs:
+        arc, px, py = [], None, None
+        for x, y in points:
+            qx, qy = round((x - x0) / kx), round((y - y0) / ky)
+            if (qx, qy) == (px, py):
+                continue
+            arc.append([qx, qy] if px is None else [qx - px, qy - py])
+            px, py = qx, qy
+        if len(arc) == 1:
+            # Arcs need two positions even when they collapse to a point
+            arc.append([0, 0])
+        encoded.append(arc)
+    return encoded, {'scale': [kx, ky], 'translate': [x0, y0]}
+
+
+def topology(arcs, geometries, weights, keep_share, grid):
+    xs = [x for points in arcs for x, _ in points]
+    ys = [y for points in arcs for _, y in points]
+    bbox = [min(xs), min(ys), max(xs), max(ys)]
+    simplified = simplify_arcs(arcs, weights, keep_share, minimum_points(arcs, geometries))
+    encoded, transform = quantize(simplified, bbox, grid)
+    return {
+        'type': 'Topology',
+        'bbox': bbox,
+        'transform': transform,
+        'objects': {'counties': {'type': 'GeometryCollection', 'geometries': geometries}},
+        'arcs': encoded,
+    }
+
+
+def build_topology_files(geojson_path=COUNTIES_GEOJSON, out_dir=os.path.join(REPO_DIR, 'data'), levels=None):
+    """Write one TopoJSON per level (plus .gz siblings); returns the paths."""
+    with open(geojson_path) as f:
+        features = json.load(f)['features']
+    arcs, geometries = build_topology(features)
+    weights = [visvalingam_weights(points) for points in arcs]
+    os.makedirs(out_dir, exist_ok=True)
+    written = []
+    levels = levels or LEVELS
+    for name, (keep_share, grid) in levels.items():
+        topo = topology(arcs, geometries, weights, keep_share, grid)
+        data = json.dumps(topo, separators=(',', ':')).encode('utf-8')
+        written += write_precompressed(os.path.join(out_dir, f'counties-{name}.topo.json'), data)
+    print(f"Built topology: {len(geometries)} counties, {len(arcs)} arcs "
+          f"({sum(len(a) for a in arcs):,} points) -> {len(levels)} levels")
+    return written
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('geojson', nargs='?', default=COUNTIES_GEOJSON)
+    parser.add_argument('--out-dir', default=os.path.join(REPO_DIR, 'data'))
+    args = parser.parse_args()
+
+    print(f"{os.path.basename(args.geojson)}: {os.path.getsize(args.geojson):,} bytes")
+    for path in build_topology_files(args.geojson, args.out_dir):
+        print(f"  {os.path.basename(path):<32} {os.path.getsize(path):>10,} bytes")
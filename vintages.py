@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Calendar years and agesex YEAR codes, detected from the Census inputs.
+
+Every release adds a year: co-est2025 gains POPESTIMATE2025 / BIRTHS2025 /
+RBIRTH2025 columns and cc-est2025 one more YEAR code. Instead of hard-coded
+ranges and code maps, the years are read off the frames themselves:
+
+  - a vintage's full years are those with an RBIRTH{year} column (the base
+    year's partial-year components have births but no rate)
+  - its estimate years are those with a POPESTIMATE{year} column (July 1)
+  - an agesex file lists its April base estimate(s) first and then one July
+    estimate per year, so its last len(estimate years) YEAR codes are those
+    years in order, and its first code is the April base
+  - a year covered by two vintages is taken from the newest one that has it
+    as a full year
+
+With --append the pipeline also reads the years already present in its
+outputs (output_years) and computes only the years that are missing.
+
+Usage (print what a source directory holds):
+    python vintages.py [--source-dir DIR]
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+from long_format import wide_years
+
+
+def full_years(components):
+    """Years with an RBIRTH column: complete years of births and rates."""
+    return wide_years(components, 'RBIRTH')
+
+
+def estimate_years(components):
+    """Years with a (July 1) POPESTIMATE column."""
+    return wide_years(components, 'POPESTIMATE')
+
+
+def year_codes(agesex):
+    return sorted(int(code) for code in np.unique(agesex['YEAR'].to_numpy()))
+
+
+def year_map(agesex, components):
+    """Calendar year -> agesex YEAR code of that year's July estimate."""
+    years = estimate_years(components)
+    codes = year_codes(agesex)
+    if len(codes) < len(years):
+        raise ValueError(f"{len(codes)} YEAR codes for {len(years)} estimate years ({years[0]}-{years[-1]})")
+    return dict(zip(years, codes[len(codes) - len(years):]))
+
+
+def base_code(agesex):
+    """YEAR code of the April base estimate (the first one)."""
+    return year_codes(agesex)[0]
+
+
+def latest_code(agesex):
+    """YEAR code of the most recent July estimate (the last one)."""
+    return year_codes(agesex)[-1]
+
+
+def assign_years(*components, leading_estimates=False):
+    """
+    Full years of each co-est frame (oldest vintage first), each year given to
+    the newest vintage that has it. With `leading_estimates` the oldest vintage
+    also keeps its estimate-only years before its first full year (2010).
+    """
+    taken = set()
+    assigned = []
+    for df in reversed(components):
+        years = [year for year in full_years(df) if year not in taken]
+        taken.update(years)
+        assigned.append(years)
+    assigned.reverse()
+    if leading_estimates and assigned[0]:
+        assigned[0] = [year for year in estimate_years(components[0]) if year < assigned[0][0]] + assigned[0]
+    return assigned
+
+
+def snapshot_years(df_10, df_24, pop_data):
+    """
+    Years and YEAR codes of the county snapshot: the first full year of the
+    series, the April base and first full year of the current vintage, and its
+    latest year.
+    """
+    latest = full_years(df_24)[-1]
+    return {
+        'first': full_years(df_10)[0],
+        'base': estimate_years(df_24)[0],
+        'current': full_years(df_24)[0],
+        'latest': latest,
+        'base_code': base_code(pop_data),
+        'latest_code': year_map(pop_data, df_24)[latest],
+    }
+
+
+def output_years(path):
+    """
+    Years already present in a pipeline output: a list of records with a
+    'year' (the time series JSON) or a document with 'years' (the county
+    series, the cube index). Empty if the file does not exist (or is None).
+    """
+    if path is None:
+        return set()
+    try:
+        with open(path) as f:
+            doc = json.load(f)
+    except FileNotFoundError:
+        return set()
+    if isinstance(doc, dict):
+        return {int(year) for year in doc.get('years', [])}
+    return {int(row['year']) for row in doc}
+
+
+if __name__ == '__main__':
+    import census_schema
+    import pipeline
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--source-dir', default=pipeline.SOURCE_DIR)
+    args = parser.parse_args()
+
+    src = pipeline.source_paths(args.source_dir)
+    components = {key: pipeline.load_components(src[key]) for key in ['components_10', 'components_24']}
+    years = dict(zip(components, assign_years(*components.values())))
+    for key, df in components.items():
+        agesex_key = key.replace('components', 'agesex')
+        print(f"{os.path.basename(src[key])}: estimates {estimate_years(df)}, full years {full_years(df)}")
+        print(f"  used for {years[key]}")
+        try:
+            agesex = census_schema.read_agesex(src[agesex_key])
+        except FileNotFoundError:
+            print(f"  {os.path.basename(src[agesex_key])}: missing")
+            continue
+        print(f"  {os.path.basename(src[agesex_key])}: YEAR codes {year_codes(agesex)} -> "
+              f"{year_map(agesex, df)}")